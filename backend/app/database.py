@@ -1,28 +1,144 @@
 """
 数据库配置和连接管理
-使用 SQLAlchemy + SQLite
+使用 SQLAlchemy，默认 SQLite，可通过 DATABASE_URL 切换到 PostgreSQL（多节点部署）
+
+提供两套会话：
+- get_async_db: AsyncSession（aiosqlite / asyncpg），供请求处理使用，不阻塞事件循环
+- get_db / SessionLocal: 同步 Session，供 scripts/ 下的命令行脚本使用
 """
+import logging
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
+
+logger = logging.getLogger(__name__)
 
 # 数据库文件路径
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, "data")
-os.makedirs(DATA_DIR, exist_ok=True)
 
-DATABASE_URL = f"sqlite:///{os.path.join(DATA_DIR, 'users.db')}"
+DATABASE_URL = os.getenv("DATABASE_URL") or f"sqlite:///{os.path.join(DATA_DIR, 'users.db')}"
+
+# 同步驱动 -> 异步驱动
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+# 连接池配置
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# SQLite PRAGMA 配置（每个新连接建立时执行）
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    # 负数表示以 KiB 为单位，-65536 即 64 MiB
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),
+}
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """连接建立时设置 SQLite PRAGMA"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def to_async_url(database_url: str) -> URL:
+    """
+    将同步数据库 URL 转换为对应的异步驱动 URL
+    例如 sqlite:///x.db -> sqlite+aiosqlite:///x.db，postgresql://... -> postgresql+asyncpg://...
+    已经是异步驱动（如 postgresql+psycopg）的 URL 保持不变
+    """
+    url = make_url(database_url)
+    drivername = ASYNC_DRIVERS.get(url.drivername, url.drivername)
+    return url.set(drivername=drivername)
+
+
+def _engine_kwargs(url: URL, async_mode: bool) -> dict:
+    """
+    根据数据库 URL 生成引擎参数
+
+    - SQLite 文件库：QueuePool 连接池，减少并发写入时的 "database is locked"
+    - SQLite 内存库：StaticPool，所有会话共享同一连接
+    - 其他数据库（如 postgresql+psycopg://...）：QueuePool，启用 pre_ping 和定期回收
+    """
+    queue_pool = AsyncAdaptedQueuePool if async_mode else QueuePool
+
+    if url.get_backend_name() != "sqlite":
+        return {
+            "poolclass": queue_pool,
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "pool_pre_ping": True,
+        }
+
+    in_memory = url.database in (None, "", ":memory:")
+    if not in_memory:
+        os.makedirs(os.path.dirname(os.path.abspath(url.database)), exist_ok=True)
+
+    pool_kwargs = {"poolclass": StaticPool} if in_memory else {
+        "poolclass": queue_pool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+
+    return {
+        "connect_args": {
+            "check_same_thread": False,  # SQLite 需要这个参数
+            "timeout": SQLITE_PRAGMAS["busy_timeout"] / 1000,
+        },
+        **pool_kwargs
+    }
+
+
+def create_db_engine(database_url: str = DATABASE_URL, echo: bool = False) -> Engine:
+    """
+    根据数据库 URL 创建同步引擎
+    SQLite 连接建立时会设置 WAL 等 PRAGMA
+    """
+    url = make_url(database_url)
+    engine = create_engine(url, echo=echo, **_engine_kwargs(url, async_mode=False))  # echo=True 可以看到 SQL 语句
+    if url.get_backend_name() == "sqlite":
+        event.listen(engine, "connect", _apply_sqlite_pragmas)
+    return engine
+
+
+def create_async_db_engine(database_url: str = DATABASE_URL, echo: bool = False) -> AsyncEngine:
+    """
+    根据数据库 URL 创建异步引擎（自动切换到 aiosqlite / asyncpg 驱动）
+    """
+    url = to_async_url(database_url)
+    engine = create_async_engine(url, echo=echo, **_engine_kwargs(url, async_mode=True))
+    if url.get_backend_name() == "sqlite":
+        event.listen(engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    return engine
+
 
 # 创建数据库引擎
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False},  # SQLite 需要这个参数
-    echo=False  # 设置为 True 可以看到 SQL 语句
-)
+engine = create_db_engine(DATABASE_URL)
+async_engine = create_async_db_engine(DATABASE_URL)
 
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 # 创建基类
 Base = declarative_base()
@@ -30,8 +146,8 @@ Base = declarative_base()
 
 def get_db():
     """
-    获取数据库会话
-    用于 FastAPI 的依赖注入
+    获取同步数据库会话
+    供命令行脚本使用，请求处理请使用 get_async_db
     """
     db = SessionLocal()
     try:
@@ -40,18 +156,34 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """
+    获取异步数据库会话
+    用于 FastAPI 的依赖注入
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def init_db():
     """
     初始化数据库（创建所有表）
     """
     # 导入所有模型，确保它们被注册到 Base.metadata
     from app.models.user import User  # noqa
+    from app.models.usage_counter import UsageCounter  # noqa
 
     # 创建所有表
     Base.metadata.create_all(bind=engine)
-    print(f"✅ 数据库初始化完成: {DATABASE_URL}")
+
+    # create_all 不会为已存在的表补建新增的索引
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    logger.info("数据库初始化完成", extra={"url": engine.url.render_as_string(hide_password=True)})
 
 
 if __name__ == "__main__":
     # 可以直接运行此文件来初始化数据库
+    logging.basicConfig(level=logging.INFO)
     init_db()
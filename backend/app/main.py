@@ -2,17 +2,48 @@
 FastAPI 主应用入口
 用于处理需求说明书生成的后端逻辑
 """
+# 启动耗时统计的起点（不读取环境变量，放在最前面）
+from app.utils.startup_report import startup_report
+
 # 第一步：加载环境变量（必须在所有导入之前）
 from dotenv import load_dotenv
 load_dotenv()
 
-# 第二步：导入其他模块
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
+# 第二步：配置日志（JSON Lines，后台线程写出）
+import logging
+from app.utils.logging_setup import setup_logging
+with startup_report.measure("setup_logging"):
+    setup_logging()
+
+# 第三步：导入其他模块
+# pandas / openpyxl / python-docx / OpenAI SDK 在首次使用时才导入，不拖慢启动
+import asyncio
+
+with startup_report.measure("import fastapi"):
+    from fastapi import FastAPI
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
 
-from app.routers import upload, generate, auth, admin, cache
-from app.database import init_db
+with startup_report.measure("import app.routers.upload"):
+    from app.routers import upload
+with startup_report.measure("import app.routers.generate"):
+    from app.routers import generate
+with startup_report.measure("import app.routers.auth"):
+    from app.routers import auth
+with startup_report.measure("import app.routers.admin"):
+    from app.routers import admin
+with startup_report.measure("import app.routers.cache"):
+    from app.routers import cache
+from app.database import AsyncSessionLocal, async_engine, init_db
+from app.services.metrics import MetricsMiddleware, registry as metrics_registry
+from app.services.docx_build_pool import docx_build_pool
+from app.services.excel_parse_pool import excel_parse_pool
+from app.services.password_hasher import password_hasher
+from app.services.tracing import REQUEST_ID_HEADER, TracingMiddleware, tracer
+from app.services.usage_counter_service import usage_counter_service
+
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
@@ -22,14 +53,28 @@ async def lifespan(app: FastAPI):
     启动时初始化数据库
     """
     # 启动时执行
-    print("🚀 启动应用...")
-    init_db()
-    print("✅ 数据库初始化完成")
+    logger.info("启动应用")
+    with startup_report.measure("init_db"):
+        init_db()
+    # 定期将使用量计数写入数据库
+    counter_task = asyncio.create_task(usage_counter_service.run_periodic_flush(AsyncSessionLocal))
+    startup_report.ready()
 
     yield
 
     # 关闭时执行
-    print("👋 关闭应用...")
+    logger.info("关闭应用")
+    counter_task.cancel()
+    try:
+        await counter_task
+    except asyncio.CancelledError:
+        pass
+    # 进程池在首次使用时才创建；关闭时取消排队任务并等待子进程退出
+    password_hasher.shutdown()
+    excel_parse_pool.shutdown()
+    docx_build_pool.shutdown()
+    tracer.shutdown()
+    await async_engine.dispose()
 
 
 app = FastAPI(
@@ -46,8 +91,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[REQUEST_ID_HEADER, generate.CHAPTERS_TOTAL_HEADER, generate.CHAPTERS_REUSED_HEADER,
+                    generate.DOCUMENT_ID_HEADER, generate.DIAGRAM_HASH_HEADER, "ETag"],
 )
 
+# 记录请求耗时 / 状态码指标，通过 /metrics 暴露
+app.add_middleware(MetricsMiddleware)
+# 为每个请求分配请求 ID（响应头 X-Request-ID）并记录链路追踪 Span
+app.add_middleware(TracingMiddleware)
+
 # 注册路由
 app.include_router(upload.router, prefix="/api/upload", tags=["文件上传"])
 app.include_router(generate.router, prefix="/api/generate", tags=["文档生成"])
@@ -71,7 +123,9 @@ async def health_check():
     return {"status": "ok"}
 
 
-if __name__ == "__main__":
-    import uvicorn
-    # 默认运行在 8000 端口
-    uvicorn.run(app, host="127.0.0.1", port=8000)
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus 文本格式的指标（METRICS_ENABLED=false 时关闭）"""
+    if not metrics_registry.enabled:
+        return PlainTextResponse("metrics disabled\n", status_code=404)
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
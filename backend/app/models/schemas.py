@@ -2,7 +2,7 @@
 Pydantic 数据模型定义
 """
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Literal, Optional, Dict, Any
 
 
 class RequirementItem(BaseModel):
@@ -57,11 +57,31 @@ class ChapterModel(BaseModel):
 
 class GenerateMermaidImagesRequest(BaseModel):
     chapters: List[ChapterModel]
+    # 部分返回：以 NDJSON 流先返回已缓存的图片，其余图片每生成一张返回一行
+    partial: bool = False
 
 
 class ProcessExcelRequest(BaseModel):
     """处理 Excel 请求"""
     file_path: str
+    # 工作表名，默认「功能点拆分表」
+    sheet_name: Optional[str] = None
+    # 增量生成：复用内容未变化的章节上次生成的描述
+    incremental: bool = False
+
+
+class BatchItem(BaseModel):
+    """批量处理中的一个工作簿"""
+    file_path: str
+    # 要处理的工作表，不填则处理所有表头符合格式的工作表
+    sheet_names: Optional[List[str]] = None
+
+
+class BatchProcessExcelRequest(BaseModel):
+    """批量处理 Excel 请求"""
+    items: List[BatchItem]
+    # 是否同时生成流程图 / 结构图（整个批次内相同的图只渲染一次）
+    render_images: bool = False
 
 
 class GenerateWordRequest(BaseModel):
@@ -69,3 +89,7 @@ class GenerateWordRequest(BaseModel):
     chapters: List[Dict[str, Any]]
     image_mapping: Dict[str, str]
     output_filename: Optional[str] = "需求说明书.docx"
+    # 增量生成：复用内容未变化的章节上次生成的 Word 片段
+    incremental: bool = False
+    # Word 生成方式，不填时取环境变量 DOCX_WRITER（增量生成始终使用 python-docx 片段）
+    writer: Optional[Literal["python-docx", "ooxml"]] = None
@@ -0,0 +1,18 @@
+"""
+使用量计数数据模型
+"""
+from sqlalchemy import BigInteger, Column, DateTime, String
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class UsageCounter(Base):
+    """使用量计数表（生成文档数、渲染图表数、AI 调用次数等），每个计数一行"""
+    __tablename__ = "usage_counters"
+
+    name = Column(String(50), primary_key=True, comment="计数名称")
+    value = Column(BigInteger, default=0, nullable=False, comment="累计值")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), comment="更新时间")
+
+    def __repr__(self):
+        return f"<UsageCounter(name='{self.name}', value={self.value})>"
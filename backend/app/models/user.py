@@ -1,14 +1,26 @@
 """
 用户数据模型
 """
-from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Index
+from sqlalchemy.dialects.sqlite import DATETIME as SQLITE_DATETIME
 from sqlalchemy.sql import func
 from app.database import Base
 
+# SQLite 的 CURRENT_TIMESTAMP 精确到秒，绑定参数也使用相同格式，
+# 保证按 (created_at, id) 分页时游标比较与库内值完全一致
+CreatedAtType = DateTime(timezone=True).with_variant(
+    SQLITE_DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite"
+)
+
 
 class User(Base):
     """用户表"""
     __tablename__ = "users"
+    __table_args__ = (
+        # 管理员用户列表按 (created_at, id) 倒序做游标分页
+        Index("ix_users_created_at_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     username = Column(String(50), unique=True, index=True, nullable=False, comment="用户名")
@@ -16,7 +28,7 @@ class User(Base):
     real_name = Column(String(50), nullable=False, comment="真实姓名")
     is_admin = Column(Boolean, default=False, nullable=False, comment="是否为管理员")
     is_active = Column(Boolean, default=True, nullable=False, comment="是否启用")
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
+    created_at = Column(CreatedAtType, server_default=func.now(), comment="创建时间")
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), comment="更新时间")
 
     def __repr__(self):
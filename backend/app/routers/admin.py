@@ -2,17 +2,31 @@
 管理员专用路由
 仅管理员可以访问这些接口
 """
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from typing import Dict, Any, List
+import base64
+import logging
+import os
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Depends, Query
+from sqlalchemy import and_, case, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Any, List, Optional, Tuple
 from pydantic import BaseModel
 
-from app.database import get_db
+from app.database import get_async_db
 from app.models.user import User
 from app.services.auth_service import AuthService, get_current_user
+from app.services.token_cache import UserSnapshot, token_cache
 from app.services.cache_service import cache_service
+from app.services.usage_counter_service import usage_counter_service
+from app.utils.ttl_cache import TTLCache
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# 用户数量缓存（按筛选条件），用户变更时清空
+user_count_cache = TTLCache(ttl_seconds=30)
+# 管理后台统计缓存（仪表盘会轮询），用户变更时清空
+stats_cache = TTLCache(ttl_seconds=float(os.getenv("ADMIN_STATS_CACHE_TTL", "10")))
 
 
 # Request/Response Models
@@ -51,7 +65,7 @@ class UserResponse(BaseModel):
         from_attributes = True
 
 
-def require_admin(current_user: User = Depends(get_current_user)):
+def require_admin(current_user: UserSnapshot = Depends(get_current_user)):
     """验证当前用户是否为管理员"""
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="权限不足，需要管理员权限")
@@ -60,43 +74,114 @@ def require_admin(current_user: User = Depends(get_current_user)):
 
 @router.get("/users")
 async def list_users(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin)
+    limit: int = Query(100, ge=1, le=500, description="每页数量"),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+    username_prefix: Optional[str] = Query(None, description="用户名前缀"),
+    is_active: Optional[bool] = Query(None),
+    is_admin: Optional[bool] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserSnapshot = Depends(require_admin)
 ) -> Dict[str, Any]:
-    """获取所有用户列表（仅管理员）"""
-    users = db.query(User).order_by(User.created_at.desc()).all()
+    """
+    分页获取用户列表（仅管理员）
+    按创建时间倒序，使用 (created_at, id) 游标分页；total 仅在第一页返回
+    """
+    filters = []
+    if username_prefix:
+        # 使用范围条件代替 LIKE，保证可以走 username 索引
+        filters.append(User.username >= username_prefix)
+        filters.append(User.username < username_prefix + "\U0010ffff")
+    if is_active is not None:
+        filters.append(User.is_active == is_active)
+    if is_admin is not None:
+        filters.append(User.is_admin == is_admin)
+
+    stmt = select(
+        User.id, User.username, User.real_name, User.is_admin, User.is_active, User.created_at
+    ).where(*filters)
+
+    if cursor:
+        cursor_created_at, cursor_id = _decode_user_cursor(cursor)
+        # 展开为 OR 形式，使游标时间按列类型绑定（SQLite 中 created_at 以字符串存储）
+        stmt = stmt.where(or_(
+            User.created_at < cursor_created_at,
+            and_(User.created_at == cursor_created_at, User.id < cursor_id),
+        ))
+
+    stmt = stmt.order_by(User.created_at.desc(), User.id.desc()).limit(limit + 1)
+    rows = (await db.execute(stmt)).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
 
     user_list = []
-    for user in users:
+    for row in rows:
         user_list.append({
-            "id": user.id,
-            "username": user.username,
-            "real_name": user.real_name,
-            "is_admin": user.is_admin,
-            "is_active": user.is_active,
-            "created_at": user.created_at.isoformat() if user.created_at else None
+            "id": row.id,
+            "username": row.username,
+            "real_name": row.real_name,
+            "is_admin": row.is_admin,
+            "is_active": row.is_active,
+            "created_at": row.created_at.isoformat() if row.created_at else None
         })
 
+    total = None
+    if not cursor:
+        total = await _count_users(db, filters, (username_prefix, is_active, is_admin))
+
     return {
         "code": 0,
         "data": {
             "users": user_list,
-            "total": len(user_list)
+            "total": total,
+            "has_more": has_more,
+            "next_cursor": _encode_user_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
         }
     }
 
 
+def _encode_user_cursor(created_at: datetime, user_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{user_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def _decode_user_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        created_at, user_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(user_id)
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+
+async def _count_users(db: AsyncSession, filters: list, cache_key: tuple) -> int:
+    """统计符合条件的用户数，结果短时间缓存，用户变更时失效"""
+    total = user_count_cache.get(cache_key)
+    if total is None:
+        total = await db.scalar(select(func.count()).select_from(User).where(*filters))
+        user_count_cache.set(cache_key, total)
+    return total
+
+
+def _on_user_changed(user_id: Optional[int] = None):
+    """用户被创建/修改/删除后调用，使相关缓存失效"""
+    user_count_cache.clear()
+    stats_cache.clear()
+    if user_id is not None:
+        token_cache.invalidate_user(user_id)
+
+
 @router.post("/users")
 async def create_user(
     request: CreateUserRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserSnapshot = Depends(require_admin)
 ) -> Dict[str, Any]:
     """创建新用户（仅管理员）"""
     auth_service = AuthService(db)
 
     # 检查用户名是否已存在
-    existing_user = db.query(User).filter(User.username == request.username).first()
+    existing_user = await db.scalar(select(User).where(User.username == request.username))
     if existing_user:
         raise HTTPException(status_code=400, detail="用户名已存在")
 
@@ -105,12 +190,13 @@ async def create_user(
         raise HTTPException(status_code=400, detail="密码长度不能少于 6 位")
 
     try:
-        user = auth_service.create_user(
+        user = await auth_service.create_user_async(
             username=request.username,
             password=request.password,
             real_name=request.real_name,
             is_admin=request.is_admin
         )
+        _on_user_changed()
 
         return {
             "code": 0,
@@ -130,11 +216,11 @@ async def create_user(
 async def update_user(
     user_id: int,
     request: UpdateUserRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserSnapshot = Depends(require_admin)
 ) -> Dict[str, Any]:
     """更新用户信息（仅管理员）"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
 
@@ -146,14 +232,15 @@ async def update_user(
     if request.is_admin is not None:
         # 防止最后一个管理员被取消管理员权限
         if not request.is_admin and user.is_admin:
-            admin_count = db.query(User).filter(User.is_admin == True).count()
+            admin_count = await db.scalar(select(func.count()).select_from(User).where(User.is_admin == True))
             if admin_count <= 1:
                 raise HTTPException(status_code=400, detail="至少需要保留一个管理员账号")
         user.is_admin = request.is_admin
 
     try:
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
+        _on_user_changed(user.id)
 
         return {
             "code": 0,
@@ -167,7 +254,7 @@ async def update_user(
             }
         }
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"更新用户失败: {str(e)}")
 
 
@@ -175,11 +262,11 @@ async def update_user(
 async def reset_password(
     user_id: int,
     request: ResetPasswordRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserSnapshot = Depends(require_admin)
 ) -> Dict[str, Any]:
     """重置用户密码（仅管理员）"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
 
@@ -187,46 +274,53 @@ async def reset_password(
     if len(request.new_password) < 6:
         raise HTTPException(status_code=400, detail="密码长度不能少于 6 位")
 
+    username = user.username
+
     try:
         auth_service = AuthService(db)
-        user.hashed_password = auth_service.get_password_hash(request.new_password)
-        db.commit()
+        # 等待 bcrypt 期间不占用数据库连接
+        await db.rollback()
+        hashed_password = await auth_service.get_password_hash_async(request.new_password)
+        await db.execute(update(User).where(User.id == user_id).values(hashed_password=hashed_password))
+        await db.commit()
+        _on_user_changed(user_id)
 
         return {
             "code": 0,
             "data": {
-                "message": f"用户 {user.username} 的密码已重置"
+                "message": f"用户 {username} 的密码已重置"
             }
         }
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"重置密码失败: {str(e)}")
 
 
 @router.delete("/users/{user_id}")
 async def delete_user(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserSnapshot = Depends(require_admin)
 ) -> Dict[str, Any]:
     """删除用户（仅管理员）"""
     # 不能删除自己
     if user_id == current_user.id:
         raise HTTPException(status_code=400, detail="不能删除自己的账号")
 
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
 
     # 防止删除最后一个管理员
     if user.is_admin:
-        admin_count = db.query(User).filter(User.is_admin == True).count()
+        admin_count = await db.scalar(select(func.count()).select_from(User).where(User.is_admin == True))
         if admin_count <= 1:
             raise HTTPException(status_code=400, detail="不能删除最后一个管理员账号")
 
     try:
-        db.delete(user)
-        db.commit()
+        await db.delete(user)
+        await db.commit()
+        _on_user_changed(user_id)
 
         return {
             "code": 0,
@@ -235,34 +329,48 @@ async def delete_user(
             }
         }
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"删除用户失败: {str(e)}")
 
 
 @router.get("/stats")
 async def get_stats(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserSnapshot = Depends(require_admin)
 ) -> Dict[str, Any]:
-    """获取系统统计信息（仅管理员）"""
-    total_users = db.query(User).count()
-    active_users = db.query(User).filter(User.is_active == True).count()
-    admin_users = db.query(User).filter(User.is_admin == True).count()
+    """
+    获取系统统计信息（仅管理员）
+    用户统计通过一次条件聚合查询得到，并附带使用量计数；结果短时间缓存
+    """
+    stats = stats_cache.get("stats")
+    if stats is None:
+        row = (await db.execute(
+            select(
+                func.count().label("total"),
+                func.coalesce(func.sum(case((User.is_active == True, 1), else_=0)), 0).label("active"),
+                func.coalesce(func.sum(case((User.is_admin == True, 1), else_=0)), 0).label("admin"),
+            ).select_from(User)
+        )).one()
+        usage = await usage_counter_service.read(db)
+
+        stats = {
+            "total_users": row.total,
+            "active_users": row.active,
+            "admin_users": row.admin,
+            "inactive_users": row.total - row.active,
+            **usage
+        }
+        stats_cache.set("stats", stats)
 
     return {
         "code": 0,
-        "data": {
-            "total_users": total_users,
-            "active_users": active_users,
-            "admin_users": admin_users,
-            "inactive_users": total_users - active_users
-        }
+        "data": stats
     }
 
 
 @router.get("/cache/stats")
 async def get_all_cache_stats(
-    current_user: User = Depends(require_admin)
+    current_user: UserSnapshot = Depends(require_admin)
 ) -> Dict[str, Any]:
     """获取所有用户的缓存统计（仅管理员）"""
     stats = cache_service.get_all_users_cache_stats()
@@ -294,7 +402,7 @@ async def get_all_cache_stats(
 @router.post("/cache/clear-all")
 async def clear_all_cache(
     request: ClearAllCacheRequest,
-    current_user: User = Depends(require_admin)
+    current_user: UserSnapshot = Depends(require_admin)
 ) -> Dict[str, Any]:
     """清理所有用户的缓存（仅管理员）"""
     result = cache_service.clear_all_users_cache(
@@ -303,7 +411,7 @@ async def clear_all_cache(
         clear_outputs=request.clear_outputs
     )
 
-    print(f"🗑️  管理员 {current_user.username} 清理了所有用户缓存: {result['message']}")
+    logger.info("管理员清理了所有用户缓存: %s", result["message"], extra={"admin": current_user.username})
 
     return {
         "code": 0,
@@ -319,12 +427,12 @@ async def clear_all_cache(
 async def clear_user_cache(
     user_id: int,
     request: ClearAllCacheRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserSnapshot = Depends(require_admin)
 ) -> Dict[str, Any]:
     """清理指定用户的缓存（仅管理员）"""
     # 验证用户是否存在
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
 
@@ -335,7 +443,7 @@ async def clear_user_cache(
         clear_outputs=request.clear_outputs
     )
 
-    print(f"🗑️  管理员 {current_user.username} 清理了用户 {user.username} (ID: {user_id}) 的缓存")
+    logger.info("管理员清理了用户缓存", extra={"admin": current_user.username, "user_id": user_id, "username": user.username})
 
     return {
         "code": 0,
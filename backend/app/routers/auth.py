@@ -2,16 +2,20 @@
 认证相关路由
 提供真实的用户登录认证
 """
-from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy.orm import Session
+import logging
+
+from fastapi import APIRouter, HTTPException, Depends, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import Dict, Any
 
-from app.database import get_db
+from app.database import get_async_db
 from app.services.auth_service import AuthService, get_current_user
-from app.models.user import User
+from app.services.login_throttle import login_throttle
+from app.services.token_cache import UserSnapshot
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 
 # Request/Response Models
@@ -25,26 +29,33 @@ class LoginResult(BaseModel):
 
 
 @router.post("/login")
-async def login(params: LoginParams, db: Session = Depends(get_db)) -> Dict[str, Any]:
+async def login(params: LoginParams, request: Request, db: AsyncSession = Depends(get_async_db)) -> Dict[str, Any]:
     """
     用户登录接口
     验证用户名密码，返回 JWT Token
+    同一 IP 尝试过于频繁、或同一用户名在该 IP 上失败次数过多时返回 429
     """
+    client_ip = request.client.host if request.client else "unknown"
+    login_throttle.check(params.username, client_ip)
+
     auth_service = AuthService(db)
 
     # 验证用户
-    user = auth_service.authenticate_user(params.username, params.password)
+    user = await auth_service.authenticate_user_async(params.username, params.password)
 
     if not user:
+        login_throttle.record_failure(params.username, client_ip)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户名或密码错误"
         )
 
+    login_throttle.record_success(params.username, client_ip)
+
     # 生成 Token
     access_token = auth_service.create_access_token(user)
 
-    print(f"✅ 用户登录成功: {user.username} (ID: {user.id})")
+    logger.info("用户登录成功", extra={"user_id": user.id, "username": user.username})
 
     return {
         "code": 0,
@@ -55,7 +66,7 @@ async def login(params: LoginParams, db: Session = Depends(get_db)) -> Dict[str,
 
 
 @router.get("/getUserInfo")
-async def get_user_info(current_user: User = Depends(get_current_user)) -> Dict[str, Any]:
+async def get_user_info(current_user: UserSnapshot = Depends(get_current_user)) -> Dict[str, Any]:
     """
     获取当前登录用户信息
     需要在 Header 中携带 Authorization: Bearer <token>
@@ -75,7 +86,7 @@ async def get_user_info(current_user: User = Depends(get_current_user)) -> Dict[
 
 
 @router.get("/codes")
-async def get_access_codes(current_user: User = Depends(get_current_user)) -> Dict[str, Any]:
+async def get_access_codes(current_user: UserSnapshot = Depends(get_current_user)) -> Dict[str, Any]:
     """
     获取用户权限码
     管理员返回 ["admin", "user"]，普通用户返回 ["user"]
@@ -101,7 +112,7 @@ async def logout() -> Dict[str, Any]:
 
 
 @router.post("/refresh")
-async def refresh_token(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)) -> Dict[str, Any]:
+async def refresh_token(current_user: UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)) -> Dict[str, Any]:
     """
     刷新 Token
     使用现有 Token 获取新的 Token
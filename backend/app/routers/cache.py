@@ -2,15 +2,18 @@
 缓存管理路由
 提供用户级别的缓存查看和清理功能
 """
+import logging
+
 from fastapi import APIRouter, Depends
 from typing import Dict, Any
 from pydantic import BaseModel
 
-from app.models.user import User
 from app.services.auth_service import get_current_user
+from app.services.token_cache import UserSnapshot
 from app.services.cache_service import cache_service
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 
 # Request Models
@@ -22,7 +25,7 @@ class ClearCacheRequest(BaseModel):
 
 @router.get("/stats")
 async def get_cache_stats(
-    current_user: User = Depends(get_current_user)
+    current_user: UserSnapshot = Depends(get_current_user)
 ) -> Dict[str, Any]:
     """
     获取当前用户的缓存统计信息
@@ -56,7 +59,7 @@ async def get_cache_stats(
 @router.post("/clear")
 async def clear_cache(
     request: ClearCacheRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: UserSnapshot = Depends(get_current_user)
 ) -> Dict[str, Any]:
     """
     清理当前用户的缓存
@@ -69,7 +72,7 @@ async def clear_cache(
         clear_outputs=request.clear_outputs
     )
 
-    print(f"🗑️  用户 {current_user.username} (ID: {current_user.id}) 清理缓存: {result['message']}")
+    logger.info("用户清理缓存: %s", result["message"], extra={"user_id": current_user.id, "username": current_user.username})
 
     return {
         "code": 0,
@@ -3,30 +3,111 @@
 处理需求文档生成、图表生成等逻辑
 """
 import asyncio
-import hashlib
+import json
+import logging
 import os
+import re
+import signal
 import subprocess
 import tempfile
-from typing import Any, Coroutine, Dict, List, Optional
+import time
+from typing import Any, Awaitable, Coroutine, Dict, List, Optional, Tuple, TypeVar
 
-from app.models.schemas import (GenerateMermaidImagesRequest, MermaidRequest,
-                              ProcessExcelRequest, GenerateWordRequest)
-from app.models.user import User
+from app.models.schemas import (BatchProcessExcelRequest, ChapterModel, GenerateMermaidImagesRequest,
+                              MermaidRequest, ProcessExcelRequest, GenerateWordRequest)
 from app.services.auth_service import get_current_user
+from app.services.token_cache import UserSnapshot
+from app.services.tracing import tracer
+from app.services.diagram_keys import Diagram, diagram_hash, flow_key, structure_key
 from app.services.document_service import document_service
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import FileResponse
+from app.services.output_store import output_store
+from app.services.render_failures import is_code_error, render_failure_cache
+from app.services.render_manifest import diagram_request_key, render_manifest
+from app.services.render_scheduler import BULK, INTERACTIVE, RenderScheduler, RenderTicket
+from app.services.metrics import (abandoned_work_total, client_disconnects_total, docx_build_seconds, docx_bytes,
+                                  mermaid_cache_total, mermaid_render_seconds)
+from app.services.usage_counter_service import (DIAGRAMS_RENDERED, DOCUMENTS_GENERATED,
+                                                usage_counter_service)
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, Response, StreamingResponse
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # --- 缓存和临时文件目录 ---
 TEMP_DIR = os.path.join(tempfile.gettempdir(), 'spec-desktop-backend')
 os.makedirs(TEMP_DIR, exist_ok=True)
 
 # --- Mermaid CLI 并发控制 ---
-# 限制同时运行的 mmdc 进程数量，避免 Puppeteer 资源竞争
+# 限制同时运行的 mmdc 进程数量，避免 Puppeteer 资源竞争；单张预览优先于整份文档的图片
 MAX_CONCURRENT_MERMAID = 3
-mermaid_semaphore = asyncio.Semaphore(MAX_CONCURRENT_MERMAID)
+render_scheduler = RenderScheduler(MAX_CONCURRENT_MERMAID)
+
+# 进行中的渲染：输出路径（用户 + 内容哈希）-> _InflightRender
+_inflight_renders: Dict[str, "_InflightRender"] = {}
+
+# 结束被取消的 mmdc 时先发送 SIGTERM，超过该时间（秒）仍未退出则强制结束
+MMDC_TERMINATE_TIMEOUT = 2.0
+
+# 客户端在生成完成前断开连接时的状态码（沿用 nginx 的 499 Client Closed Request）
+CLIENT_CLOSED_REQUEST = 499
+
+T = TypeVar("T")
+
+# 增量生成 Word 时返回章节数 / 复用章节数的响应头
+CHAPTERS_TOTAL_HEADER = "X-Chapters-Total"
+CHAPTERS_REUSED_HEADER = "X-Chapters-Reused"
+
+# 生成的文档 ID（内容 key），用于 GET /documents/{id} 再次下载
+DOCUMENT_ID_HEADER = "X-Document-Id"
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+# Mermaid 图片的内容哈希，用于 GET /mermaid/{hash}
+DIAGRAM_HASH_HEADER = "X-Diagram-Hash"
+_MERMAID_HASH_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# 文档 / 图片按内容寻址，同一 ID 的内容不会变化，客户端可以直接缓存
+CONTENT_CACHE_CONTROL = "private, max-age=86400, immutable"
+
+# 批量处理一次最多接受的工作簿数量
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+
+# 缓存命中日志每 N 条记录一条
+CACHE_HIT_LOG_SAMPLE_EVERY = int(os.getenv("LOG_CACHE_HIT_SAMPLE_EVERY", "100"))
+
+
+async def _cancel_on_disconnect(http_request: Request, awaitable: Awaitable[T]) -> T:
+    """
+    运行 awaitable；客户端在完成前断开连接时取消它（其中的渲染、AI 调用随之取消），
+    等待取消完成（mmdc 进程已结束）后抛出 HTTPException(499)
+    """
+    work = asyncio.ensure_future(awaitable)
+    disconnect = asyncio.ensure_future(_wait_for_disconnect(http_request))
+    try:
+        await asyncio.wait({work, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        work.cancel()
+        raise
+    finally:
+        disconnect.cancel()
+
+    if not work.done():
+        client_disconnects_total.inc()
+        logger.info("客户端已断开连接，取消生成")
+        work.cancel()
+        await asyncio.wait({work})
+        if not work.cancelled():
+            work.exception()
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="客户端已断开连接")
+    return work.result()
+
+
+async def _wait_for_disconnect(http_request: Request):
+    # 请求体已读取完毕，之后收到的只会是 http.disconnect
+    while True:
+        message = await http_request.receive()
+        if message["type"] == "http.disconnect":
+            return
 
 
 def _get_user_cache_dir(user_id: int) -> str:
@@ -39,97 +120,259 @@ def _get_user_cache_dir(user_id: int) -> str:
     return user_cache_dir
 
 
-async def _generate_png_from_mermaid_code(mermaid_code: str, user_id: int) -> str:
+async def _generate_png_from_mermaid_code(mermaid_code: str, user_id: int, priority: str = BULK,
+                                          content_hash: Optional[str] = None) -> str:
     """
     核心逻辑：接收 Mermaid 代码，生成 PNG 图片并返回路径。
-    实现了基于内容哈希的缓存（按用户隔离）。
-    使用信号量限制并发，避免 Puppeteer 资源竞争。
+    实现了基于内容哈希的缓存（按用户隔离），同一张图同时只渲染一次。
+    通过 render_scheduler 限制并发，避免 Puppeteer 资源竞争；priority 为 INTERACTIVE（单张预览）或 BULK。
+    content_hash 为已计算好的 diagram_hash(mermaid_code)（见 _collect_diagram_codes），不传时在这里计算。
     """
-    content_hash = hashlib.md5(mermaid_code.encode('utf-8')).hexdigest()
-    user_cache_dir = _get_user_cache_dir(user_id)
-    output_path = os.path.join(user_cache_dir, f"{content_hash}.png")
+    with tracer.start_span("mermaid.generate_png", {"user.id": user_id, "mermaid.priority": priority}) as span:
+        return await _render_mermaid_png(mermaid_code, content_hash or diagram_hash(mermaid_code), user_id, span,
+                                         priority)
 
-    if os.path.exists(output_path):
-        print(f"✓ 使用缓存的 Mermaid 图片: {content_hash[:8]}.png")
-        return output_path
 
-    # 使用信号量限制并发执行
-    async with mermaid_semaphore:
-        # 双重检查：在获得信号量后再次检查缓存（可能其他任务已生成）
-        if os.path.exists(output_path):
-            print(f"✓ 使用缓存的 Mermaid 图片: {content_hash[:8]}.png")
-            return output_path
+def _mermaid_png_path(user_id: int, content_hash: str) -> str:
+    return os.path.join(_get_user_cache_dir(user_id), f"{content_hash}.png")
 
-        temp_mmd_path = ""
-        try:
-            print(f"⏳ 开始生成 Mermaid 图片: {content_hash[:8]}.png")
-            with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.mmd', encoding='utf-8') as temp_file:
-                temp_mmd_path = temp_file.name
-                temp_file.write(mermaid_code)
 
-            command = ['mmdc', '-i', temp_mmd_path, '-o', output_path, '-b', 'transparent']
+async def _render_mermaid_png(mermaid_code: str, content_hash: str, user_id: int, span,
+                              priority: str = BULK) -> str:
+    output_path = _mermaid_png_path(user_id, content_hash)
+    span.set_attribute("mermaid.hash", content_hash)
 
-            process = await asyncio.create_subprocess_exec(
-                *command,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            stdout, stderr = await process.communicate()
+    if os.path.exists(output_path):
+        span.set_attribute("cache.hit", True)
+        mermaid_cache_total.inc(result="hit")
+        logger.info("使用缓存的 Mermaid 图片", extra={"hash": content_hash[:8], "sample_every": CACHE_HIT_LOG_SAMPLE_EVERY})
+        return output_path
 
-            if process.returncode != 0:
-                raise subprocess.CalledProcessError(process.returncode, command, output=stdout, stderr=stderr)
+    failure = render_failure_cache.get(content_hash)
+    if failure is not None:
+        span.set_attribute("mermaid.known_failure", True)
+        mermaid_cache_total.inc(result="failure_hit")
+        raise HTTPException(status_code=500, detail=failure)
+
+    # 单飞：同一张图正在渲染时直接等待其结果，不再占用 mmdc 名额
+    inflight = _inflight_renders.get(output_path)
+    if inflight is None or inflight.cancelled:
+        # 已取消但尚未结束的渲染不再共享：重新渲染，并等它结束（mmdc 已退出、残留文件已删除）后再开始
+        previous = inflight.task if inflight is not None else None
+        ticket = render_scheduler.ticket(priority, user_id)
+        inflight = _InflightRender(ticket)
+        inflight.task = asyncio.ensure_future(
+            _render_with_ticket(inflight, mermaid_code, output_path, content_hash, span, previous))
+        _inflight_renders[output_path] = inflight
+    else:
+        span.set_attribute("mermaid.shared", True)
+        mermaid_cache_total.inc(result="shared")
+        if priority == INTERACTIVE:
+            # 预览的图正在整份文档的渲染中排队：提升优先级
+            inflight.ticket.promote()
+
+    # 渲染在独立的任务中进行，按等待者计数：某个请求被取消（客户端断开）时，
+    # 仍有其他请求在等待则继续渲染，否则取消渲染（排队中直接移出队列，已启动则结束 mmdc 进程）
+    inflight.waiters += 1
+    try:
+        return await asyncio.shield(inflight.task)
+    finally:
+        inflight.waiters -= 1
+        if not inflight.task.done():
+            stage = "mermaid_running" if inflight.started else "mermaid_queued"
+            if inflight.waiters == 0:
+                inflight.cancelled = True
+                inflight.task.cancel()
+                abandoned_work_total.inc(kind=stage, outcome="cancelled")
+            else:
+                abandoned_work_total.inc(kind=stage, outcome="continued")
+
+
+class _InflightRender:
+    """进行中的渲染：渲染任务、名额申请和等待者数量"""
+
+    def __init__(self, ticket: RenderTicket):
+        self.ticket = ticket
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        # 是否已获得名额（mmdc 已启动）
+        self.started = False
+        # 最后一个等待者离开时取消；取消到任务结束之间的新请求不再等待它
+        self.cancelled = False
+
+
+async def _render_with_ticket(inflight: _InflightRender, mermaid_code: str, output_path: str,
+                              content_hash: str, span, previous: Optional[asyncio.Task] = None) -> str:
+    try:
+        if previous is not None and not previous.done():
+            await asyncio.wait({previous})
+        async with inflight.ticket:
+            inflight.started = True
+            span.set_attribute("mermaid.queue_wait_ms", round(inflight.ticket.queue_wait * 1000, 3))
+            span.add_event("scheduler.acquired")
+            return await _run_mmdc(mermaid_code, output_path, content_hash, span)
+    finally:
+        # 被取消后同一张图可能已重新开始渲染，只移除自己的记录
+        if _inflight_renders.get(output_path) is inflight:
+            del _inflight_renders[output_path]
+
+
+async def _run_mmdc(mermaid_code: str, output_path: str, content_hash: str, span) -> str:
+    """调用 mmdc 生成图片（调用方已从 render_scheduler 获得名额）"""
+    # 双重检查：在获得名额后再次检查缓存（可能其他任务已生成）
+    if os.path.exists(output_path):
+        span.set_attribute("cache.hit", True)
+        mermaid_cache_total.inc(result="hit")
+        logger.info("使用缓存的 Mermaid 图片", extra={"hash": content_hash[:8], "sample_every": CACHE_HIT_LOG_SAMPLE_EVERY})
+        return output_path
 
-            if not os.path.exists(output_path):
-                raise FileNotFoundError(f"mmdc 执行成功但未生成文件: {output_path}")
+    span.set_attribute("cache.hit", False)
+    mermaid_cache_total.inc(result="miss")
 
-            print(f"✓ 图片生成成功: {content_hash[:8]}.png")
-            return output_path
+    temp_mmd_path = ""
+    render_start = time.perf_counter()
+    render_outcome = "error"
+    try:
+        logger.debug("开始生成 Mermaid 图片", extra={"hash": content_hash[:8]})
+        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.mmd', encoding='utf-8') as temp_file:
+            temp_mmd_path = temp_file.name
+            temp_file.write(mermaid_code)
+
+        command = ['mmdc', '-i', temp_mmd_path, '-o', output_path, '-b', 'transparent']
+
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            # 单独的进程组，取消时连同 mmdc 启动的 Chromium 一起结束
+            start_new_session=os.name == "posix"
+        )
+        try:
+            stdout, stderr = await process.communicate()
+        except asyncio.CancelledError:
+            render_outcome = "cancelled"
+            await _terminate_process_tree(process)
+            # 未写完的图片不能留在缓存中
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            raise
+
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, command, output=stdout, stderr=stderr)
+
+        if not os.path.exists(output_path):
+            raise FileNotFoundError(f"mmdc 执行成功但未生成文件: {output_path}")
+
+        render_outcome = "success"
+        usage_counter_service.increment(DIAGRAMS_RENDERED)
+        logger.info("Mermaid 图片生成成功", extra={"hash": content_hash[:8], "render_ms": round((time.perf_counter() - render_start) * 1000, 1)})
+        return output_path
 
-        except FileNotFoundError:
-            print("错误: 'mmdc' command not found.")
-            raise HTTPException(
-                status_code=500,
-                detail="服务器错误: 'mmdc' command not found. 请确保 Mermaid CLI 已在后端环境中全局安装。"
+    except FileNotFoundError:
+        logger.error("mmdc 命令不存在，请确认 Mermaid CLI 已安装")
+        raise HTTPException(
+            status_code=500,
+            detail="服务器错误: 'mmdc' command not found. 请确保 Mermaid CLI 已在后端环境中全局安装。"
+        )
+    except subprocess.CalledProcessError as e:
+        stderr_str = e.stderr.decode('utf-8') if e.stderr else ''
+        logger.error("Mermaid CLI 执行失败", extra={"hash": content_hash[:8], "returncode": e.returncode, "stderr": stderr_str})
+        detail = f"Mermaid 图表生成失败: {stderr_str}"
+        # 代码有误时短时间内不再重复渲染；浏览器启动失败等临时故障不缓存
+        if is_code_error(stderr_str):
+            render_failure_cache.set(content_hash, detail)
+        raise HTTPException(status_code=500, detail=detail)
+    finally:
+        render_seconds = time.perf_counter() - render_start
+        mermaid_render_seconds.observe(render_seconds, outcome=render_outcome)
+        span.set_attribute("mermaid.render_ms", round(render_seconds * 1000, 3))
+        if temp_mmd_path and os.path.exists(temp_mmd_path):
+            os.remove(temp_mmd_path)
+
+
+async def _terminate_process_tree(process: asyncio.subprocess.Process):
+    """结束 mmdc 及其子进程：POSIX 上向进程组发送 SIGTERM，超时后 SIGKILL；Windows 上使用 taskkill /T"""
+    if process.returncode is not None:
+        return
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGTERM)
+            try:
+                await asyncio.wait_for(process.wait(), MMDC_TERMINATE_TIMEOUT)
+            except asyncio.TimeoutError:
+                os.killpg(process.pid, signal.SIGKILL)
+        else:
+            killer = await asyncio.create_subprocess_exec(
+                "taskkill", "/PID", str(process.pid), "/T", "/F",
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
             )
-        except subprocess.CalledProcessError as e:
-            print(f"Mermaid CLI 执行失败. Code: {e.returncode}")
-            stderr_str = e.stderr.decode('utf-8') if e.stderr else ''
-            print(f"Stderr: {stderr_str}")
-            raise HTTPException(status_code=500, detail=f"Mermaid 图表生成失败: {stderr_str}")
-        finally:
-            if temp_mmd_path and os.path.exists(temp_mmd_path):
-                os.remove(temp_mmd_path)
+            await killer.wait()
+    except (ProcessLookupError, OSError):
+        if process.returncode is None:
+            process.kill()
+    await process.wait()
+    logger.info("已结束被取消的 mmdc 进程", extra={"pid": process.pid})
 
 
 @router.post("/mermaid")
 async def generate_mermaid_diagram(
     request: MermaidRequest,
-    current_user: User = Depends(get_current_user)
+    http_request: Request,
+    current_user: UserSnapshot = Depends(get_current_user)
 ):
-    """接收单段 Mermaid 代码，生成 PNG 图片并直接返回文件响应。需要登录。"""
+    """
+    接收单段 Mermaid 代码，生成 PNG 图片并直接返回文件响应。需要登录。
+    ETag 为代码的内容哈希（响应头 X-Diagram-Hash 同值）；条件请求（If-None-Match → 304）
+    只对 GET /mermaid/{hash} 生效，POST 不做条件判断。
+    """
+    content_hash = diagram_hash(request.code)
     try:
-        output_path = await _generate_png_from_mermaid_code(request.code, current_user.id)
-        return FileResponse(output_path, media_type="image/png")
+        output_path = await _cancel_on_disconnect(
+            http_request, _generate_png_from_mermaid_code(request.code, current_user.id, INTERACTIVE, content_hash))
+        return _diagram_response(output_path, content_hash)
     except Exception as e:
         if isinstance(e, HTTPException):
             raise e
-        print(f"生成 Mermaid 图表时发生未知错误: {e}")
+        logger.exception("生成 Mermaid 图表时发生未知错误")
         raise HTTPException(status_code=500, detail=f"生成图表时发生未知错误: {str(e)}")
 
-# --- Mermaid 代码生成辅助函数 ---
-def _hash_text(text: str) -> str:
-    return hashlib.md5(text.encode('utf-8')).hexdigest()
 
+@router.get("/mermaid/{content_hash}")
+async def get_mermaid_diagram(
+    content_hash: str,
+    http_request: Request,
+    current_user: UserSnapshot = Depends(get_current_user)
+):
+    """按内容哈希读取已生成的 Mermaid 图片（只读缓存，不渲染）。需要登录。支持 If-None-Match。"""
+    if not _MERMAID_HASH_PATTERN.match(content_hash):
+        raise HTTPException(status_code=404, detail="图片不存在")
+    # 先确认图片存在：If-None-Match: * 只对已存在的资源成立
+    output_path = _mermaid_png_path(current_user.id, content_hash)
+    if not os.path.exists(output_path):
+        raise HTTPException(status_code=404, detail="图片不存在或已被清理，请重新生成")
+    if _etag_matches(http_request.headers.get("if-none-match"), _etag(content_hash)):
+        mermaid_cache_total.inc(result="not_modified")
+        return _not_modified(content_hash)
+    return _diagram_response(output_path, content_hash)
+
+
+def _diagram_response(output_path: str, content_hash: str) -> FileResponse:
+    return FileResponse(output_path, media_type="image/png",
+                        headers={"ETag": _etag(content_hash), DIAGRAM_HASH_HEADER: content_hash,
+                                 "Cache-Control": CONTENT_CACHE_CONTROL})
+
+# --- Mermaid 代码生成辅助函数 ---
 def _get_structure_chart_code(feature_name: str, processes: List[str]) -> str:
-    node_id = lambda text: 'N' + _hash_text(text)[:8]
+    # 节点 ID 按出现顺序编号（同名功能过程仍是同一个节点），不同名称不会因哈希前缀相同而合并
     escape = lambda text: text.replace('"', '\\"')
+    process_ids: Dict[str, str] = {}
 
-    key_id = node_id(feature_name)
+    key_id = "K"
     escaped_key = escape(feature_name)
     content = f"    {key_id}[\"{escaped_key}\"]\n"
 
     for process in processes:
-        process_id = node_id(process)
+        process_id = process_ids.setdefault(process, f"P{len(process_ids)}")
         escaped_process = escape(process)
         content += f"    {process_id}[\"{escaped_process}\"]\n"
         content += f"    {key_id} --> {process_id}\n"
@@ -152,75 +395,334 @@ def _get_flow_chart_code(roles: List[str], processes: List[str]) -> str:
     b ->> c: \"{escape(step2)}\"
     b ->> a: \"{escape(step3)}\""""
 
-@router.post("/mermaid-images")
-async def generate_mermaid_images(
-    request: GenerateMermaidImagesRequest,
-    current_user: User = Depends(get_current_user)
-):
-    """接收章节数据，并行生成所有图表，返回路径映射。需要登录。"""
-    tasks: Dict[str, Coroutine[Any, Any, str]] = {}
-
-    for chapter in request.chapters:
-        structure_key = f"structure_{chapter.name}"
-        structure_code = _get_structure_chart_code(chapter.name, chapter.functions)
-        tasks[structure_key] = _generate_png_from_mermaid_code(structure_code, current_user.id)
+def _collect_diagram_codes(chapters: List[ChapterModel]) -> Dict[str, Diagram]:
+    """
+    图片键 -> 图（Mermaid 代码 + 内容哈希），键与 generate_word 读取的一致（见 diagram_keys）
+    内容哈希在这里为每张图计算一次，之后的缓存检查、渲染、去重都直接使用
+    """
+    codes: Dict[str, Diagram] = {}
+    for chapter in chapters:
+        codes[structure_key(chapter.name)] = Diagram.from_code(
+            _get_structure_chart_code(chapter.name, chapter.functions))
 
         if chapter.features:
             for feature in chapter.features:
-                flow_key = f"flow_{feature.scenario}"
-                flow_code = _get_flow_chart_code(feature.role, feature.process)
-                tasks[flow_key] = _generate_png_from_mermaid_code(flow_code, current_user.id)
+                codes[flow_key(chapter.name, feature.scenario)] = Diagram.from_code(
+                    _get_flow_chart_code(feature.role, feature.process))
+    return codes
+
 
-    print(f"开始并行生成 {len(tasks)} 张 Mermaid 图片...")
+@router.post("/mermaid-images")
+async def generate_mermaid_images(
+    request: GenerateMermaidImagesRequest,
+    http_request: Request,
+    background_tasks: BackgroundTasks,
+    current_user: UserSnapshot = Depends(get_current_user)
+):
+    """
+    接收章节数据，并行生成所有图表，返回路径映射。需要登录。
+    每张图单独成败：返回成功的图片（imageMapping）和失败原因（errors：图片键 -> 错误信息），不会因一张图失败整体报错。
+    同一份章节数据全部生成过时直接返回保存的清单；partial 为 true 时以 NDJSON 流返回（见 _stream_mermaid_images）。
+    """
+    manifest_key = diagram_request_key([chapter.model_dump() for chapter in request.chapters])
+    image_mapping = render_manifest.get(current_user.id, manifest_key)
+    if image_mapping is not None:
+        mermaid_cache_total.inc(result="manifest_hit")
+        # 清单中的图片在响应之后检查，有缺失时删除清单，下次请求重新生成
+        background_tasks.add_task(render_manifest.validate, current_user.id, manifest_key, image_mapping)
+        if request.partial:
+            return _ndjson_response(iter([
+                _ndjson_line({"type": "cached", "imageMapping": image_mapping, "pending": 0}),
+                _ndjson_line({"type": "done", "imageMapping": image_mapping, "errors": {}}),
+            ]))
+        return {"code": 0, "data": {"imageMapping": image_mapping, "errors": {}}}
+
+    codes = _collect_diagram_codes(request.chapters)
+    if request.partial:
+        return _ndjson_response(_stream_mermaid_images(codes, current_user.id, manifest_key))
+
+    tasks: Dict[str, Coroutine[Any, Any, str]] = {
+        key: _generate_png_from_mermaid_code(diagram.code, current_user.id, content_hash=diagram.content_hash)
+        for key, diagram in codes.items()
+    }
+
+    logger.info("开始并行生成 Mermaid 图片", extra={"count": len(tasks)})
     
     try:
-        results = await asyncio.gather(*tasks.values())
-        
-        image_mapping = {key: result for key, result in zip(tasks.keys(), results)}
-        
-        print("所有图片生成完成。")
-        return {"code": 0, "data": {"imageMapping": image_mapping}}
+        outcomes = await _cancel_on_disconnect(http_request, asyncio.gather(*tasks.values(), return_exceptions=True))
+
+        # 每张图单独成败：失败的图不出现在 imageMapping 中（生成 Word 时写入「生成失败」提示），原因见 errors
+        image_mapping, errors = _split_outcomes(tasks.keys(), outcomes)
+        if errors:
+            logger.warning("部分图片生成失败", extra={"count": len(tasks), "failed": len(errors)})
+        else:
+            render_manifest.put(current_user.id, manifest_key, image_mapping)
+            logger.info("所有图片生成完成", extra={"count": len(tasks)})
+        return {"code": 0, "data": {"imageMapping": image_mapping, "errors": errors}}
     except Exception as e:
-        print(f"并行生成 Mermaid 图片时出错: {e}")
+        logger.error("并行生成 Mermaid 图片时出错: %s", e)
         if isinstance(e, HTTPException):
             raise e
         raise HTTPException(status_code=500, detail=f"生成一张或多张图表时失败: {str(e)}")
 
 
+def _error_detail(error: BaseException) -> str:
+    if isinstance(error, HTTPException):
+        return str(error.detail)
+    if isinstance(error, asyncio.CancelledError):
+        return "图片生成已取消"
+    return str(error)
+
+
+def _split_outcomes(keys, outcomes) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """gather(return_exceptions=True) 的结果拆分为 (图片键 -> 路径, 图片键 -> 错误信息)"""
+    image_mapping: Dict[str, str] = {}
+    errors: Dict[str, str] = {}
+    for key, outcome in zip(keys, outcomes):
+        if isinstance(outcome, BaseException):
+            errors[key] = _error_detail(outcome)
+        else:
+            image_mapping[key] = outcome
+    return image_mapping, errors
+
+
+def _ndjson_line(data: Dict[str, Any]) -> bytes:
+    return (json.dumps(data, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _ndjson_response(lines) -> StreamingResponse:
+    return StreamingResponse(lines, media_type=NDJSON_MEDIA_TYPE)
+
+
+async def _stream_mermaid_images(codes: Dict[str, Diagram], user_id: int, manifest_key: str):
+    """
+    部分返回模式，每行一个 JSON：
+        {"type": "cached", "imageMapping": {已缓存的图片}, "pending": 待生成数量}
+        {"type": "image", "key": 图片键, "path": 路径}           每生成一张返回一行，按完成顺序
+        {"type": "error", "key": 图片键, "detail": 错误信息}
+        {"type": "done", "imageMapping": {全部成功的图片}, "errors": {图片键: 错误信息}}
+    全部成功时保存清单。客户端断开时取消尚未完成的生成。
+    """
+    image_mapping: Dict[str, str] = {}
+    pending: Dict[str, Diagram] = {}
+    for key, diagram in codes.items():
+        output_path = _mermaid_png_path(user_id, diagram.content_hash)
+        if os.path.exists(output_path):
+            image_mapping[key] = output_path
+        else:
+            pending[key] = diagram
+    mermaid_cache_total.inc(len(image_mapping), result="hit")
+    yield _ndjson_line({"type": "cached", "imageMapping": dict(image_mapping), "pending": len(pending)})
+
+    tasks = {asyncio.ensure_future(_generate_png_from_mermaid_code(diagram.code, user_id,
+                                                                   content_hash=diagram.content_hash)): key
+             for key, diagram in pending.items()}
+    errors: Dict[str, str] = {}
+    try:
+        remaining = set(tasks)
+        while remaining:
+            done, remaining = await asyncio.wait(remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                key = tasks[task]
+                # 共享的渲染被其他请求取消时同样作为失败返回
+                error = asyncio.CancelledError() if task.cancelled() else task.exception()
+                if error is None:
+                    image_mapping[key] = task.result()
+                    yield _ndjson_line({"type": "image", "key": key, "path": image_mapping[key]})
+                else:
+                    errors[key] = _error_detail(error)
+                    yield _ndjson_line({"type": "error", "key": key, "detail": errors[key]})
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if not errors:
+        render_manifest.put(user_id, manifest_key, image_mapping)
+    logger.info("图片部分返回完成", extra={"count": len(codes), "cached": len(codes) - len(pending),
+                                       "failed": len(errors)})
+    yield _ndjson_line({"type": "done", "imageMapping": image_mapping, "errors": errors})
+
+
 @router.post("/process-excel")
 async def process_excel(
     request: ProcessExcelRequest,
-    current_user: User = Depends(get_current_user)
+    http_request: Request,
+    current_user: UserSnapshot = Depends(get_current_user)
 ) -> Dict:
     """处理 Excel 文件，返回结构化数据。需要登录。"""
     try:
-        print(f"📝 用户 {current_user.username} (ID: {current_user.id}) 正在处理 Excel 文件")
-        result = await document_service.process_excel(request.file_path)
+        logger.info("用户正在处理 Excel 文件", extra={"user_id": current_user.id, "username": current_user.username})
+        result = await _cancel_on_disconnect(http_request, document_service.process_excel(
+            request.file_path, request.sheet_name, user_id=current_user.id, incremental=request.incremental))
         # The result from the service is already in the desired format {"success": true, "chapters": [...]}
         # We just need to wrap it in the {code, data} structure.
         return {"code": 0, "data": result}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/batch-process-excel")
+async def batch_process_excel(
+    request: BatchProcessExcelRequest,
+    http_request: Request,
+    current_user: UserSnapshot = Depends(get_current_user)
+) -> Dict:
+    """
+    批量处理多个工作簿 / 工作表，返回每个工作表的章节数据和整体耗时。需要登录。
+    render_images 为 true 时同时生成图片，每个工作表的结果附带 imageMapping 和 imageErrors（生成失败的图）。
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="没有需要处理的工作簿")
+    if len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"一次最多处理 {BATCH_MAX_ITEMS} 个工作簿")
+
+    logger.info("用户正在批量处理 Excel 文件", extra={"user_id": current_user.id, "username": current_user.username,
+                                                  "count": len(request.items)})
+    try:
+        result = await _cancel_on_disconnect(http_request, document_service.process_batch(
+            [(item.file_path, item.sheet_names) for item in request.items]
+        ))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if request.render_images:
+        await _cancel_on_disconnect(http_request, _render_batch_images(result, current_user.id))
+    return {"code": 0, "data": result}
+
+
+async def _render_batch_images(batch: Dict[str, Any], user_id: int):
+    """为批次中所有成功的工作表生成图片；内容哈希相同的图在整个批次内只渲染一次"""
+    start = time.perf_counter()
+    renders: Dict[str, asyncio.Future] = {}
+    mappings = []
+    for result in batch["results"]:
+        if not result["success"]:
+            continue
+        codes = _collect_diagram_codes([ChapterModel.model_validate(chapter) for chapter in result["chapters"]])
+        for diagram in codes.values():
+            if diagram.content_hash not in renders:
+                renders[diagram.content_hash] = asyncio.ensure_future(
+                    _generate_png_from_mermaid_code(diagram.code, user_id, content_hash=diagram.content_hash))
+        mappings.append((result, codes))
+
+    logger.info("开始批量生成 Mermaid 图片", extra={"count": len(renders)})
+    outcomes = await asyncio.gather(*renders.values(), return_exceptions=True)
+    paths, failures = _split_outcomes(renders.keys(), outcomes)
+    if failures:
+        logger.warning("批量生成 Mermaid 图片时部分失败", extra={"count": len(renders), "failed": len(failures)})
+
+    # 失败的图只影响对应的键，其余图片照常返回
+    for result, codes in mappings:
+        result["imageMapping"] = {key: paths[diagram.content_hash] for key, diagram in codes.items()
+                                  if diagram.content_hash in paths}
+        result["imageErrors"] = {key: failures[diagram.content_hash] for key, diagram in codes.items()
+                                 if diagram.content_hash in failures}
+
+    render_ms = round((time.perf_counter() - start) * 1000, 1)
+    stats = batch["stats"]
+    diagrams = sum(len(codes) for _, codes in mappings)
+    stats["diagrams"] = diagrams
+    stats["diagrams_deduplicated"] = diagrams - len(renders)
+    stats["diagrams_failed"] = len(failures)
+    stats["timing_ms"]["render"] = render_ms
+    stats["timing_ms"]["total"] = round(stats["timing_ms"]["total"] + render_ms, 1)
+
+
 @router.post("/generate-word")
 async def generate_word(
     request: GenerateWordRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: UserSnapshot = Depends(get_current_user)
 ):
-    """生成 Word 文档并返回文件。需要登录。"""
+    """
+    生成 Word 文档并返回文件。需要登录。
+    文档按内容保存在用户的文档存储中：内容相同的文档不重新生成，响应头 X-Document-Id 可用于 GET /documents/{id} 再次下载。
+    incremental 为 true 时复用未变化章节的 Word 片段，响应头返回章节数和复用数。
+    生成过程（含等待进程池生成章节片段、合并）在线程池中进行，不阻塞事件循环。
+    """
     try:
-        print(f"📄 用户 {current_user.username} (ID: {current_user.id}) 正在生成 Word 文档")
-        output_path = document_service.generate_word(
+        logger.info("用户正在生成 Word 文档", extra={"user_id": current_user.id, "username": current_user.username})
+        with docx_build_seconds.time():
+            output_path, document_id, reuse, size = await _generate_user_document(request, current_user.id)
+        headers = {}
+        if request.incremental:
+            headers = {CHAPTERS_TOTAL_HEADER: str(reuse["chapters"]),
+                       CHAPTERS_REUSED_HEADER: str(reuse["reused"])}
+        docx_bytes.observe(size)
+        usage_counter_service.increment(DOCUMENTS_GENERATED)
+        return _document_response(output_path, document_id, request.output_filename, headers)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _generate_user_document(request: GenerateWordRequest, user_id: int):
+    """
+    在线程池中生成（或从文档存储取出）Word 文档，返回 (路径, 文档 key, 复用统计, 文件大小)
+
+    命中的已有文档可能在返回之后、发送之前被其他请求的清理删除，此时重新生成一次
+    """
+    for attempt in range(2):
+        output_path, document_id, reuse = await run_in_threadpool(
+            document_service.generate_user_document,
             request.chapters,
             request.image_mapping,
-            request.output_filename
+            user_id,
+            request.writer,
+            request.incremental
         )
-        # 直接返回文件响应
-        return FileResponse(
-            output_path,
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            filename=request.output_filename or "需求说明书.docx"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        try:
+            return output_path, document_id, reuse, os.path.getsize(output_path)
+        except FileNotFoundError:
+            if attempt:
+                raise
+            logger.warning("文档在发送前已被清理，重新生成", extra={"user_id": user_id, "document_id": document_id})
+
+
+@router.get("/documents/{document_id}")
+async def download_document(
+    document_id: str,
+    http_request: Request,
+    filename: Optional[str] = None,
+    current_user: UserSnapshot = Depends(get_current_user)
+):
+    """
+    再次下载已生成的 Word 文档（document_id 为生成时返回的 X-Document-Id）。需要登录。
+    支持 If-None-Match（未变化时返回 304）和 Range 断点续传。
+    """
+    output_path = output_store.get(current_user.id, document_id)
+    if output_path is None:
+        raise HTTPException(status_code=404, detail="文档不存在或已被清理，请重新生成")
+
+    if _etag_matches(http_request.headers.get("if-none-match"), _etag(document_id)):
+        return _not_modified(document_id)
+    return _document_response(output_path, document_id, filename)
+
+
+def _etag(content_key: str) -> str:
+    return f'"{content_key}"'
+
+
+def _not_modified(content_key: str) -> Response:
+    return Response(status_code=304, headers={"ETag": _etag(content_key), "Cache-Control": CONTENT_CACHE_CONTROL})
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or any(value.removeprefix("W/") == etag for value in candidates)
+
+
+def _document_response(output_path: str, document_id: str, filename: Optional[str],
+                       headers: Optional[Dict[str, str]] = None) -> FileResponse:
+    """文档文件响应：ETag 为文档 key，内容不可变；Range 请求由 FileResponse 处理"""
+    return FileResponse(
+        output_path,
+        media_type=DOCX_MEDIA_TYPE,
+        filename=filename or "需求说明书.docx",
+        headers={**(headers or {}), "ETag": _etag(document_id), DOCUMENT_ID_HEADER: document_id,
+                 "Cache-Control": CONTENT_CACHE_CONTROL},
+    )
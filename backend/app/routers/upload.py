@@ -1,15 +1,18 @@
 """
 文件上传路由
 """
+import logging
 import os
 import shutil
 import tempfile
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 
-from app.models.user import User
 from app.services.auth_service import get_current_user
+from app.services.metrics import upload_bytes
+from app.services.token_cache import UserSnapshot
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # 使用一个固定的、可预见的临时目录
 UPLOAD_BASE_DIR = os.path.join(tempfile.gettempdir(), "spec-desktop-uploads")
@@ -28,7 +31,7 @@ def _get_user_upload_dir(user_id: int) -> str:
 @router.post("/excel")
 async def upload_excel(
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user)
+    current_user: UserSnapshot = Depends(get_current_user)
 ):
     """
     接收 Excel 文件上传，保存到用户专属的临时目录，并返回文件路径。需要登录。
@@ -46,8 +49,9 @@ async def upload_excel(
     try:
         with open(temp_file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
+            upload_bytes.observe(buffer.tell(), outcome="success")
 
-        print(f"📤 用户 {current_user.username} (ID: {current_user.id}) 上传文件: {temp_file_path}")
+        logger.info("用户上传文件", extra={"user_id": current_user.id, "username": current_user.username, "path": temp_file_path})
 
         return {
             "code": 0,
@@ -56,7 +60,8 @@ async def upload_excel(
             }
         }
     except Exception as e:
-        print(f"文件上传失败: {e}")
+        upload_bytes.observe(0, outcome="error")
+        logger.exception("文件上传失败")
         raise HTTPException(status_code=500, detail=f"文件保存失败: {str(e)}")
     finally:
         file.file.close()
\ No newline at end of file
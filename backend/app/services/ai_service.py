@@ -1,10 +1,23 @@
 """
 AI 服务集成 - 阿里云通义千问
 简化版本，用于生成功能描述
+
+OpenAI SDK 导入耗时较长，客户端在首次调用时才创建，以加快服务启动
 """
-from typing import Optional
+from typing import Optional, Tuple
+import logging
 import os
-from openai import OpenAI
+import threading
+import time
+
+from .metrics import ai_fallbacks_total, ai_request_seconds, ai_tokens
+from .tracing import current_span, traced
+from .usage_counter_service import AI_CALLS, usage_counter_service
+
+logger = logging.getLogger(__name__)
+
+# 客户端尚未创建的标记（None 表示未配置 API Key）
+_UNSET = object()
 
 
 class AIService:
@@ -14,16 +27,35 @@ class AIService:
         self.base_url = os.getenv("AI_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
         self.api_key = os.getenv("AI_API_KEY", "")
         self.model = os.getenv("AI_MODEL", "qwen-long")
+        self._client = _UNSET
+        self._client_lock = threading.Lock()
 
-        if self.api_key:
-            self.client = OpenAI(
-                api_key=self.api_key,
-                base_url=self.base_url
-            )
-            print(f"✅ AI 服务初始化成功 (模型: {self.model})")
-        else:
-            self.client = None
-            print("⚠️  AI API Key 未配置，将使用默认模板生成描述")
+    @property
+    def client(self):
+        """OpenAI 客户端，首次访问时创建；未配置 API Key 时为 None"""
+        if self._client is _UNSET:
+            with self._client_lock:
+                if self._client is _UNSET:
+                    self._client = self._create_client()
+        return self._client
+
+    @client.setter
+    def client(self, value):
+        self._client = value
+
+    def _create_client(self):
+        if not self.api_key:
+            logger.warning("AI API Key 未配置，将使用默认模板生成描述")
+            return None
+
+        from openai import OpenAI
+
+        client = OpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url
+        )
+        logger.info("AI 服务初始化成功", extra={"model": self.model})
+        return client
 
     def generate_description(self, feature_name: str, processes: list[str]) -> str:
         """
@@ -36,12 +68,28 @@ class AIService:
         Returns:
             生成的功能描述（100字左右）
         """
+        description, _ = self.generate_description_with_status(feature_name, processes)
+        return description
+
+    @traced("AIService.generate_description")
+    def generate_description_with_status(self, feature_name: str, processes: list[str]) -> Tuple[str, bool]:
+        """
+        同 generate_description，第二个返回值表示是否由 AI 生成
+        （False 表示使用了默认模板，调用方不应缓存该描述）
+        """
+        span = current_span()
+        span.set_attribute("feature.name", feature_name)
         if not self.client:
-            return f"这是关于{feature_name}的功能模块，主要包含{len(processes)}个功能过程。"
+            span.set_attribute("ai.fallback", "no_client")
+            ai_fallbacks_total.inc(reason="no_client")
+            return f"这是关于{feature_name}的功能模块，主要包含{len(processes)}个功能过程。", False
 
         prompt = f"""现在有一个功能需求:{feature_name},其功能过程有:{', '.join(processes)}。
 你的任务：根据需求和功能过程，写出100字左右的功能概述"""
 
+        span.set_attribute("ai.model", self.model)
+        usage_counter_service.increment(AI_CALLS)
+        start = time.perf_counter()
         try:
             completion = self.client.chat.completions.create(
                 model=self.model,
@@ -51,14 +99,26 @@ class AIService:
                 ]
             )
             result = completion.choices[0].message.content
-            print(f"✅ AI 生成描述成功 ({feature_name})")
-            return result
+            ai_request_seconds.observe(time.perf_counter() - start, model=self.model, outcome="success")
+            usage = getattr(completion, "usage", None)
+            if usage is not None:
+                ai_tokens.observe(usage.prompt_tokens or 0, model=self.model, kind="prompt")
+                ai_tokens.observe(usage.completion_tokens or 0, model=self.model, kind="completion")
+                span.set_attribute("ai.prompt_tokens", usage.prompt_tokens)
+                span.set_attribute("ai.completion_tokens", usage.completion_tokens)
+            logger.info("AI 生成描述成功", extra={"feature": feature_name, "duration_ms": round((time.perf_counter() - start) * 1000, 1)})
+            return result, True
         except Exception as e:
-            print(f"❌ AI 调用失败: {e}")
-            print(f"   - 功能: {feature_name}")
-            print(f"   - API Key 长度: {len(self.api_key) if self.api_key else 0}")
-            print(f"   - 模型: {self.model}")
-            return f"这是关于{feature_name}的功能模块,主要包含{len(processes)}个功能过程。"
+            ai_request_seconds.observe(time.perf_counter() - start, model=self.model, outcome="error")
+            ai_fallbacks_total.inc(reason="error")
+            span.set_attribute("ai.fallback", "error")
+            span.record_exception(e)
+            logger.error("AI 调用失败: %s", e, extra={
+                "feature": feature_name,
+                "api_key_length": len(self.api_key) if self.api_key else 0,
+                "model": self.model,
+            })
+            return f"这是关于{feature_name}的功能模块,主要包含{len(processes)}个功能过程。", False
 
 
 # 全局实例
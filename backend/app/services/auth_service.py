@@ -3,45 +3,65 @@
 处理用户认证、JWT Token 生成和验证
 """
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Union
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.database import get_db
+from app.database import get_async_db
 from app.models.user import User
+from app.services.login_throttle import login_throttle
+from app.services.password_hasher import hash_password, password_hasher, verify_password
+from app.services.token_cache import UserSnapshot, token_cache
 
 # JWT 配置
 SECRET_KEY = "your-secret-key-change-this-in-production"  # 生产环境请修改为随机密钥
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 24  # Token 有效期 24 小时
 
-# 密码加密上下文
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # HTTP Bearer 认证方案
 security = HTTPBearer()
 
 
 class AuthService:
-    """认证服务类"""
+    """
+    认证服务类
+
+    同步方法需要 Session（供 scripts/ 下的脚本使用），
+    带 _async 后缀的方法需要 AsyncSession（供请求处理使用）
+    """
 
-    def __init__(self, db: Session):
+    def __init__(self, db: Union[Session, AsyncSession]):
         self.db = db
 
     def get_password_hash(self, password: str) -> str:
         """
         对密码进行 bcrypt 加密
+        同步版本，仅供脚本使用；请求处理中请使用 get_password_hash_async
         """
-        return pwd_context.hash(password)
+        return hash_password(password)
 
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         """
         验证密码是否正确
+        同步版本，仅供脚本使用；请求处理中请使用 verify_password_async
+        """
+        return verify_password(plain_password, hashed_password)
+
+    async def get_password_hash_async(self, password: str) -> str:
+        """
+        在密码哈希进程池中对密码进行 bcrypt 加密，不阻塞事件循环
+        """
+        return await password_hasher.hash(password)
+
+    async def verify_password_async(self, plain_password: str, hashed_password: str) -> bool:
+        """
+        在密码哈希进程池中验证密码，不阻塞事件循环
         """
-        return pwd_context.verify(plain_password, hashed_password)
+        return await password_hasher.verify(plain_password, hashed_password)
 
     def create_user(
         self,
@@ -59,14 +79,7 @@ class AuthService:
             raise ValueError(f"用户名 {username} 已存在")
 
         # 创建用户
-        hashed_password = self.get_password_hash(password)
-        user = User(
-            username=username,
-            hashed_password=hashed_password,
-            real_name=real_name,
-            is_admin=is_admin,
-            is_active=True
-        )
+        user = self._new_user(username, self.get_password_hash(password), real_name, is_admin)
 
         self.db.add(user)
         self.db.commit()
@@ -74,6 +87,40 @@ class AuthService:
 
         return user
 
+    async def create_user_async(
+        self,
+        username: str,
+        password: str,
+        real_name: str,
+        is_admin: bool = False
+    ) -> User:
+        """
+        创建新用户（密码哈希在进程池中计算）
+        """
+        existing_user_id = await self.db.scalar(select(User.id).where(User.username == username))
+        if existing_user_id is not None:
+            raise ValueError(f"用户名 {username} 已存在")
+
+        # 等待 bcrypt 期间不占用数据库连接
+        await self.db.rollback()
+        hashed_password = await self.get_password_hash_async(password)
+        user = self._new_user(username, hashed_password, real_name, is_admin)
+
+        self.db.add(user)
+        await self.db.commit()
+        await self.db.refresh(user)
+
+        return user
+
+    def _new_user(self, username: str, hashed_password: str, real_name: str, is_admin: bool) -> User:
+        return User(
+            username=username,
+            hashed_password=hashed_password,
+            real_name=real_name,
+            is_admin=is_admin,
+            is_active=True
+        )
+
     def authenticate_user(self, username: str, password: str) -> Optional[User]:
         """
         验证用户登录
@@ -92,7 +139,36 @@ class AuthService:
 
         return user
 
-    def create_access_token(self, user: User) -> str:
+    async def authenticate_user_async(self, username: str, password: str) -> Optional[User]:
+        """
+        验证用户登录（bcrypt 校验在进程池中执行）
+        返回用户对象，如果验证失败返回 None
+
+        同时进行的 bcrypt 校验数量受 login_throttle 限制，排队超时抛出 503
+        """
+        user = await self.db.scalar(select(User).where(User.username == username))
+
+        if not user:
+            # 不做 bcrypt 校验，但保持与正常校验相近的响应时间
+            await login_throttle.delay_unknown_user()
+            return None
+
+        # 等待 bcrypt 期间不占用数据库连接（并发登录时连接池可能被耗尽）
+        self.db.expunge(user)
+        await self.db.rollback()
+
+        async with login_throttle.verify_slot():
+            password_ok = await self.verify_password_async(password, user.hashed_password)
+
+        if not password_ok:
+            return None
+
+        if not user.is_active:
+            return None
+
+        return user
+
+    def create_access_token(self, user: Union[User, UserSnapshot]) -> str:
         """
         为用户创建 JWT Token
         """
@@ -129,17 +205,31 @@ class AuthService:
         """
         return self.db.query(User).filter(User.id == user_id).first()
 
+    async def get_user_by_id_async(self, user_id: int) -> Optional[User]:
+        """
+        根据 ID 获取用户（异步会话）
+        """
+        return await self.db.get(User, user_id)
+
 
 # 依赖注入函数：获取当前登录用户
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
+    db: AsyncSession = Depends(get_async_db)
+) -> UserSnapshot:
     """
     从 JWT Token 中获取当前登录用户
     用于保护需要登录的接口
+
+    已验证的 Token 会缓存用户快照（见 token_cache），
+    命中缓存时既不重新解码 Token，也不查询数据库。
     """
     token = credentials.credentials
+
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
+
     auth_service = AuthService(db)
 
     try:
@@ -152,13 +242,15 @@ async def get_current_user(
                 detail="无效的认证凭据"
             )
 
-    except (JWTError, ValueError):
+    except (JWTError, ValueError, TypeError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="无效的认证凭据"
         )
 
-    user = auth_service.get_user_by_id(user_id)
+    # 查询之前读取版本号：查询期间用户被修改 / 删除时不缓存查到的旧快照
+    generation = token_cache.generation(user_id)
+    user = await auth_service.get_user_by_id_async(user_id)
 
     if user is None:
         raise HTTPException(
@@ -172,14 +264,16 @@ async def get_current_user(
             detail="用户已被禁用"
         )
 
-    return user
+    snapshot = UserSnapshot.from_user(user)
+    token_cache.set(token, snapshot, token_exp=payload.get("exp"), generation=generation)
+    return snapshot
 
 
 # 可选的依赖注入：获取当前用户（如果已登录）
 async def get_current_user_optional(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False)),
-    db: Session = Depends(get_db)
-) -> Optional[User]:
+    db: AsyncSession = Depends(get_async_db)
+) -> Optional[UserSnapshot]:
     """
     可选的用户认证，如果未登录返回 None
     """
@@ -0,0 +1,155 @@
+"""
+增量生成：按章节指纹复用上一次生成的结果
+
+- 章节指纹：功能需求名称、角色、功能过程、子过程和数据组（ExcelParser 的解析结果）的 blake2b 哈希，
+  工作簿中只改了几行时，只有对应章节的指纹会变化
+- descriptions.json：章节指纹 -> AI 描述
+- fragments/<key>.json：Word 章节片段（ChapterFragment），key 为章节全部内容（含描述、图片路径）的哈希；
+  读取时更新修改时间，超过上限时删除最久未使用的片段
+
+数据放在用户缓存目录下（cache/user_{id}/chapters），清理缓存时一并删除；
+写入采用临时文件 + os.replace，多个进程同时写入时以最后一次为准（丢失的条目只会导致重新生成）
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+from .docx_writer import ChapterFragment
+
+logger = logging.getLogger(__name__)
+
+# 片段版式变化时递增，使旧片段失效
+FRAGMENT_VERSION = 2
+
+
+def chapter_fingerprint(feature_name: str, feature_data: Dict[str, Any]) -> str:
+    """章节指纹，feature_data 为 ExcelParser.parse() 结果中的一项"""
+    processes = [[name, list(value[0]), list(value[1])] for name, value in feature_data.items() if name != "角色"]
+    payload = json.dumps([feature_name, feature_data.get("角色", ""), processes], ensure_ascii=False, default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _image_if_exists(path: str) -> str:
+    # 片段生成时图片不存在会写入「生成失败」提示，图片之后生成时不能再复用该片段
+    return path if path and os.path.exists(path) else ""
+
+
+def fragment_key(chapter: Dict[str, Any]) -> str:
+    """Word 片段的缓存键：章节中写入文档的全部字段（含图片路径）"""
+    content = {
+        "version": FRAGMENT_VERSION,
+        "name": chapter.get("name", ""),
+        "description": chapter.get("description", ""),
+        "functions": chapter.get("functions", []),
+        "structure_image": _image_if_exists(chapter.get("structure_image", "")),
+        "features": [
+            {**{key: feature.get(key, "") for key in ("scenario", "process", "input", "output")},
+             "flow_chart": _image_if_exists(feature.get("flow_chart", ""))}
+            for feature in chapter.get("features", [])
+        ],
+    }
+    payload = json.dumps(content, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def write_json_atomic(path: str, data: Any):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class ChapterStore:
+    """按用户保存章节描述和 Word 片段"""
+
+    def __init__(self, base_dir: str, max_descriptions: int = 5000, max_fragments: int = 2000):
+        self.base_dir = base_dir
+        self.max_descriptions = max_descriptions
+        self.max_fragments = max_fragments
+        self._lock = threading.Lock()
+
+    def _user_dir(self, user_id: int) -> str:
+        return os.path.join(self.base_dir, f"user_{user_id}", "chapters")
+
+    def load_descriptions(self, user_id: int) -> Dict[str, str]:
+        path = os.path.join(self._user_dir(user_id), "descriptions.json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning("读取章节描述失败，将全部重新生成: %s", e, extra={"user_id": user_id})
+            return {}
+
+    def save_descriptions(self, user_id: int, descriptions: Dict[str, str]):
+        """合并写入；超过上限时丢弃最早写入的条目"""
+        with self._lock:
+            merged = OrderedDict(self.load_descriptions(user_id))
+            for fingerprint, description in descriptions.items():
+                merged.pop(fingerprint, None)
+                merged[fingerprint] = description
+            while len(merged) > self.max_descriptions:
+                merged.popitem(last=False)
+            write_json_atomic(os.path.join(self._user_dir(user_id), "descriptions.json"), merged)
+
+    def _fragment_dir(self, user_id: int) -> str:
+        return os.path.join(self._user_dir(user_id), "fragments")
+
+    def get_fragment(self, user_id: int, key: str) -> Optional[ChapterFragment]:
+        """读取片段；片段引用的图片已被清理时视为不存在。命中时更新修改时间（清理时按最久未使用删除）"""
+        path = os.path.join(self._fragment_dir(user_id), f"{key}.json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                fragment = ChapterFragment.from_dict(json.load(f))
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("读取章节片段失败: %s", e, extra={"user_id": user_id})
+            return None
+        return fragment if fragment.images_available() else None
+
+    def put_fragment(self, user_id: int, key: str, fragment: ChapterFragment):
+        write_json_atomic(os.path.join(self._fragment_dir(user_id), f"{key}.json"), fragment.to_dict())
+
+    def prune_fragments(self, user_id: int, keep: Iterable[str] = ()):
+        """片段超过上限时删除最久未使用的；keep 为本次文档用到的片段，不会被删除"""
+        keep_names = {f"{key}.json" for key in keep}
+        with self._lock:
+            try:
+                entries = list(os.scandir(self._fragment_dir(user_id)))
+            except FileNotFoundError:
+                return
+            fragments = []
+            for entry in entries:
+                if entry.name.endswith(".json") and entry.name not in keep_names:
+                    try:
+                        fragments.append((entry.stat().st_mtime_ns, entry.path))
+                    except FileNotFoundError:
+                        continue
+            fragments.sort(reverse=True)
+            for _, path in fragments[max(self.max_fragments - len(keep_names), 0):]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+# 全局实例（与 Mermaid 图片缓存共用用户缓存目录）
+chapter_store = ChapterStore(
+    os.path.join(tempfile.gettempdir(), "spec-desktop-backend", "cache"),
+    max_fragments=int(os.getenv("CHAPTER_MAX_FRAGMENTS", "2000")),
+)
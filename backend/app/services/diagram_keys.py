@@ -0,0 +1,43 @@
+"""
+图表标识：imageMapping 的图片键和 Mermaid 代码的内容哈希
+
+- 图片键：/mermaid-images 返回、generate_word 读取时使用
+  - 结构图 structure_{功能需求名称}：同一工作表中功能需求名称唯一
+  - 流程图 flow_{功能需求名称长度}_{功能需求名称}_{功能过程名称}：功能过程名称只在章节内唯一，
+    不同章节的同名功能过程各有自己的流程图；名称长度前缀使键与 (章节, 场景) 一一对应，名称中含 _ 也不会混淆
+- 内容哈希：Mermaid 代码的 blake2b（16 字节，32 位十六进制），每张图只计算一次，
+  同时用作 PNG 缓存文件名、失败缓存的键、图片响应的 ETag，生成 Word 时按图片路径去重
+"""
+import hashlib
+from dataclasses import dataclass
+
+DIAGRAM_HASH_SIZE = 16
+
+
+def diagram_hash(mermaid_code: str) -> str:
+    """Mermaid 代码的内容哈希"""
+    return hashlib.blake2b(mermaid_code.encode("utf-8"), digest_size=DIAGRAM_HASH_SIZE).hexdigest()
+
+
+def structure_key(chapter_name: str) -> str:
+    return f"structure_{chapter_name}"
+
+
+def flow_key(chapter_name: str, scenario: str) -> str:
+    return f"flow_{len(chapter_name)}_{chapter_name}_{scenario}"
+
+
+def legacy_flow_key(scenario: str) -> str:
+    """旧版客户端保存的 imageMapping 中的流程图键（不同章节的同名功能过程会互相覆盖）"""
+    return f"flow_{scenario}"
+
+
+@dataclass(frozen=True)
+class Diagram:
+    """一张待生成的图：Mermaid 代码及其内容哈希"""
+    code: str
+    content_hash: str
+
+    @classmethod
+    def from_code(cls, mermaid_code: str) -> "Diagram":
+        return cls(mermaid_code, diagram_hash(mermaid_code))
@@ -3,45 +3,72 @@
 整合 Excel 解析、AI 生成、Word 输出
 """
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
+import os
 import json
 import asyncio
+import logging
+import contextvars
+import threading
+import time
 from concurrent.futures import ThreadPoolExecutor
 
+from fastapi.concurrency import run_in_threadpool
+
+from .chapter_store import chapter_fingerprint, chapter_store, fragment_key
+from .diagram_keys import flow_key, legacy_flow_key, structure_key
+from .docx_build_pool import docx_build_pool
 from .excel_parser import ExcelParser
+from .excel_parse_pool import excel_parse_pool
 from .ai_service import ai_service
-from .docx_writer import DocxWriter
+from .docx_writer import ChapterFragment, DocxWriter
+from .metrics import abandoned_work_total, excel_parse_seconds
+from .ooxml_writer import OoxmlWriter
+from .output_store import document_key, output_store
+
+logger = logging.getLogger(__name__)
+
+# Word 生成方式：python-docx（DocxWriter，章节多时可并行生成）或 ooxml（OoxmlWriter，直接输出 XML，更快、更省内存）
+WORD_WRITERS = ("python-docx", "ooxml")
+DEFAULT_WORD_WRITER = os.getenv("DOCX_WRITER", "python-docx")
 
 
 class DocumentService:
     """文档生成服务 - 简化版"""
 
     def __init__(self):
+        # 生成的 Word 文档保存在 output_store（按用户、按内容寻址），见 generate_user_document
         self.upload_dir = Path("temp/uploads")
-        self.output_dir = Path("temp/outputs")
         self.cache_dir = Path("temp/cache")
 
         # 确保目录存在
-        for dir_path in [self.upload_dir, self.output_dir, self.cache_dir]:
+        for dir_path in [self.upload_dir, self.cache_dir]:
             dir_path.mkdir(parents=True, exist_ok=True)
 
         self.executor = ThreadPoolExecutor(max_workers=5)
 
-    async def process_excel(self, file_path: str) -> Dict[str, Any]:
+    async def process_excel(self, file_path: str, sheet_name: Optional[str] = None,
+                            user_id: Optional[int] = None, incremental: bool = False) -> Dict[str, Any]:
         """
         处理 Excel 文件，生成文档
 
+        每个章节附带 fingerprint（章节指纹）；指定 user_id 时保存本次的 AI 描述，
+        incremental 为 True 时指纹未变化的章节直接复用上次的描述，并在结果中返回 reuse 统计
+
         Args:
             file_path: Excel 文件路径
-            mermaid_images: 从前端传来的 Mermaid 图片路径字典
+            sheet_name: 工作表名，默认「功能点拆分表」
+            user_id: 用户 ID（增量生成的数据按用户保存）
+            incremental: 是否复用上次生成的描述
 
         Returns:
             处理结果
         """
         try:
             # 1. 验证 Excel
-            parser = ExcelParser(file_path)
-            validation_result = parser.validate()
+            parser = ExcelParser(file_path, sheet_name)
+            with excel_parse_seconds.time(stage="validate"):
+                validation_result = parser.validate()
 
             # 如果验证失败，返回详细错误信息
             if not validation_result["valid"]:
@@ -53,55 +80,44 @@ class DocumentService:
 
             # 如果有警告，也一并返回（但继续处理）
             if validation_result["warnings"]:
-                print(f"⚠️  Excel 验证警告:")
                 for warning in validation_result["warnings"]:
-                    print(f"   - {warning['message']} ({warning['location']})")
+                    logger.warning("Excel 验证警告: %s", warning["message"], extra={"location": warning["location"]})
 
             # 2. 解析 Excel
-            data = parser.parse()
+            with excel_parse_seconds.time(stage="parse"):
+                data = parser.parse()
 
             # 3. 生成描述（使用 AI）
             chapters = []
 
-            for feature_name, feature_data in data.items():
-                role = feature_data.get("角色", "")
-                functions = [k for k in feature_data.keys() if k != "角色"]
-
-                # 使用 AI 生成描述
-                loop = asyncio.get_event_loop()
-                description = await loop.run_in_executor(
-                    self.executor,
-                    ai_service.generate_description,
-                    feature_name,
-                    functions
-                )
-
-                # 构建章节数据（图片路径由前端提供）
-                chapter = {
-                    "name": feature_name,
-                    "description": description,
-                    "role": role,
-                    "functions": functions,
-                    "features": []
-                }
-
-                # 处理每个功能过程
-                for func_process, process_data in feature_data.items():
-                    if func_process == "角色":
-                        continue
-
-                    sub_processes, data_groups = process_data
-
-                    feature = {
-                        "scenario": func_process,
-                        "process": sub_processes,
-                        "input": data_groups[0] if data_groups else "",
-                        "output": data_groups[-1] if data_groups else "",
-                        "role": role.split("，")
-                    }
-                    chapter["features"].append(feature)
-
-                chapters.append(chapter)
+            previous = (await run_in_threadpool(chapter_store.load_descriptions, user_id)
+                        if incremental and user_id is not None else {})
+            generated: Dict[str, str] = {}
+            regenerated: List[str] = []
+
+            fingerprints = [chapter_fingerprint(name, feature_data) for name, feature_data in data.items()]
+            try:
+                for (feature_name, feature_data), fingerprint in zip(data.items(), fingerprints):
+                    description = previous.get(fingerprint)
+                    if description is None:
+                        functions = [k for k in feature_data.keys() if k != "角色"]
+                        description, from_ai = await self._describe(feature_name, functions)
+                        regenerated.append(feature_name)
+                        if from_ai:
+                            generated[fingerprint] = description
+                    else:
+                        generated[fingerprint] = description
+                    chapter = self._build_chapter(feature_name, feature_data, description)
+                    chapter["fingerprint"] = fingerprint
+                    chapters.append(chapter)
+            except asyncio.CancelledError:
+                # 请求被取消（客户端断开）：其余功能不再调用 AI；已生成的描述照常保存，下次增量处理时复用
+                skipped = sum(1 for fingerprint in fingerprints[len(chapters) + 1:] if fingerprint not in previous)
+                abandoned_work_total.inc(skipped, kind="ai_call", outcome="cancelled")
+                await self._save_descriptions(user_id, previous, generated)
+                raise
+
+            await self._save_descriptions(user_id, previous, generated)
 
             # 返回结构化数据，等待前端生成图片后再生成 Word
             result = {
@@ -113,6 +129,13 @@ class DocumentService:
             if validation_result.get("warnings"):
                 result["warnings"] = validation_result["warnings"]
 
+            if incremental:
+                result["reuse"] = {
+                    "chapters": len(chapters),
+                    "reused": len(chapters) - len(regenerated),
+                    "regenerated": regenerated,
+                }
+
             return result
 
         except Exception as e:
@@ -121,36 +144,251 @@ class DocumentService:
                 "error": str(e)
             }
 
-    def generate_word(self, chapters: List[Dict], image_mapping: Dict[str, str], output_filename: str = "需求说明书.docx") -> str:
+    @staticmethod
+    async def _save_descriptions(user_id: Optional[int], previous: Dict[str, str], generated: Dict[str, str]):
+        """只写入新生成（与 previous 不同）的描述；文件读写在线程池中进行，不阻塞事件循环"""
+        changed = {fingerprint: description for fingerprint, description in generated.items()
+                   if previous.get(fingerprint) != description}
+        if user_id is not None and changed:
+            await run_in_threadpool(chapter_store.save_descriptions, user_id, changed)
+
+    async def _describe(self, feature_name: str, functions: List[str]) -> Tuple[str, bool]:
+        """
+        使用 AI 生成描述（复制上下文，使线程中的指标能拿到当前路由）
+        返回 (描述, 是否由 AI 生成)；被取消时记录 abandoned_work_total
         """
-        生成 Word 文档
+        loop = asyncio.get_running_loop()
+        started = threading.Event()
+
+        def describe() -> Tuple[str, bool]:
+            started.set()
+            return ai_service.generate_description_with_status(feature_name, functions)
+
+        try:
+            return await loop.run_in_executor(self.executor, contextvars.copy_context().run, describe)
+        except asyncio.CancelledError:
+            # 尚未开始的调用随 Future 一起从线程池队列中取消；已经开始的只能在线程中运行完，结果丢弃
+            abandoned_work_total.inc(kind="ai_call", outcome="continued" if started.is_set() else "cancelled")
+            raise
+
+    @staticmethod
+    def _build_chapter(feature_name: str, feature_data: Dict[str, Any], description: str) -> Dict[str, Any]:
+        """构建章节数据（图片路径由前端提供）"""
+        role = feature_data.get("角色", "")
+        chapter = {
+            "name": feature_name,
+            "description": description,
+            "role": role,
+            "functions": [k for k in feature_data.keys() if k != "角色"],
+            "features": []
+        }
+
+        # 处理每个功能过程
+        for func_process, process_data in feature_data.items():
+            if func_process == "角色":
+                continue
+
+            sub_processes, data_groups = process_data
+
+            feature = {
+                "scenario": func_process,
+                "process": sub_processes,
+                "input": data_groups[0] if data_groups else "",
+                "output": data_groups[-1] if data_groups else "",
+                "role": role.split("，")
+            }
+            chapter["features"].append(feature)
+
+        return chapter
+
+    async def process_batch(self, items: List[Tuple[str, Optional[List[str]]]]) -> Dict[str, Any]:
+        """
+        批量处理多个工作簿 / 工作表
+
+        - 未指定工作表时，处理工作簿中表头符合格式的全部工作表（都不符合时按默认工作表处理并报告错误）
+        - 所有工作表在解析进程池中并行解析
+        - 名称和功能过程完全相同的功能需求只调用一次 AI，结果在整个批次内共享
+
+        Args:
+            items: [(文件路径, 工作表名列表或 None), ...]
+
+        Returns:
+            {"results": [每个工作表的结果，格式同 process_excel 并附带 file_path / sheet_name], "stats": {...}}
+        """
+        batch_start = time.perf_counter()
+
+        # 1. 确定要处理的工作表
+        async def resolve_sheets(file_path: str, sheet_names: Optional[List[str]]) -> List[Optional[str]]:
+            if sheet_names:
+                return list(dict.fromkeys(sheet_names))
+            return await excel_parse_pool.find_spec_sheets(file_path) or [None]
+
+        sheet_lists = await asyncio.gather(*(resolve_sheets(path, names) for path, names in items))
+        targets = [(path, sheet) for (path, _), sheets in zip(items, sheet_lists) for sheet in sheets]
+
+        # 2. 并行解析
+        parse_start = time.perf_counter()
+        parsed = await asyncio.gather(*(excel_parse_pool.parse_sheet(path, sheet) for path, sheet in targets))
+        parse_seconds = time.perf_counter() - parse_start
+        for sheet in parsed:
+            outcome = "success" if sheet["validation"]["valid"] else "error"
+            excel_parse_seconds.observe(sheet["parse_ms"] / 1000, stage="batch_parse", outcome=outcome)
+
+        # 3. 去重后并发生成描述
+        ai_start = time.perf_counter()
+        description_tasks: Dict[Tuple[str, Tuple[str, ...]], asyncio.Future] = {}
+        feature_count = 0
+        for sheet in parsed:
+            for feature_name, feature_data in (sheet["data"] or {}).items():
+                feature_count += 1
+                functions = tuple(k for k in feature_data.keys() if k != "角色")
+                key = (feature_name, functions)
+                if key not in description_tasks:
+                    description_tasks[key] = asyncio.ensure_future(self._describe(feature_name, list(functions)))
+        if description_tasks:
+            await asyncio.gather(*description_tasks.values())
+        ai_seconds = time.perf_counter() - ai_start
+
+        # 4. 组装结果
+        results = []
+        for (file_path, _), sheet in zip(targets, parsed):
+            validation = sheet["validation"]
+            result: Dict[str, Any] = {"file_path": file_path, "sheet_name": sheet["sheet_name"],
+                                      "parse_ms": round(sheet["parse_ms"], 1)}
+            if not validation["valid"]:
+                result.update({"success": False, "error": "Excel 文件验证失败", "validation": validation})
+            else:
+                chapters = []
+                for feature_name, feature_data in sheet["data"].items():
+                    functions = tuple(k for k in feature_data.keys() if k != "角色")
+                    description, _ = description_tasks[(feature_name, functions)].result()
+                    chapters.append(self._build_chapter(feature_name, feature_data, description))
+                result.update({"success": True, "chapters": chapters})
+                if validation["warnings"]:
+                    result["warnings"] = validation["warnings"]
+            results.append(result)
+
+        return {
+            "results": results,
+            "stats": {
+                "workbooks": len(items),
+                "sheets": len(targets),
+                "failed_sheets": sum(1 for result in results if not result["success"]),
+                "features": feature_count,
+                "ai_calls": len(description_tasks),
+                "ai_calls_deduplicated": feature_count - len(description_tasks),
+                "timing_ms": {
+                    "parse": round(parse_seconds * 1000, 1),
+                    "ai": round(ai_seconds * 1000, 1),
+                    "total": round((time.perf_counter() - batch_start) * 1000, 1),
+                },
+            },
+        }
+
+    def generate_user_document(self, chapters: List[Dict], image_mapping: Dict[str, str], user_id: int,
+                               writer_name: Optional[str] = None,
+                               incremental: bool = False) -> Tuple[str, str, Dict[str, int]]:
+        """
+        生成 Word 文档并保存到用户的文档存储（OutputStore，按内容寻址）；
+        内容相同的文档已经生成过时直接返回，不重新生成
 
         Args:
             chapters: 章节数据列表
-            image_mapping: 图片映射 {"structure_key": "/path/to/image.png", "flow_key": "/path/to/image.png"}
-            output_filename: 输出文件名
+            image_mapping: 图片映射 {图片键: "/path/to/image.png"}，图片键见 diagram_keys
+            user_id: 用户 ID，文档保存在该用户的目录下
+            writer_name: Word 生成方式（WORD_WRITERS），默认取环境变量 DOCX_WRITER
+            incremental: 为 true 时复用内容未变化的章节片段（始终使用 python-docx）
 
         Returns:
-            生成的文档路径（绝对路径）
+            (文档路径, 文档 key, {"chapters": 章节数, "reused": 复用的章节数})
         """
-        output_path = (self.output_dir / output_filename).resolve()
-        writer = DocxWriter(str(output_path))
+        key = document_key(chapters, image_mapping)
+        existing = output_store.get(user_id, key)
+        if existing is not None:
+            return existing, key, {"chapters": len(chapters), "reused": len(chapters)}
 
-        writer.add_title("软件需求说明书")
+        temp_path = output_store.temp_path(user_id)
+        try:
+            if incremental:
+                reuse = self._write_word_incremental(chapters, image_mapping, user_id, temp_path)
+            else:
+                self._write_word(chapters, image_mapping, temp_path, writer_name)
+                reuse = {"chapters": len(chapters), "reused": 0}
+            return output_store.commit(user_id, key, temp_path), key, reuse
+        except BaseException:
+            output_store.discard(temp_path)
+            raise
+
+    def _write_word(self, chapters: List[Dict], image_mapping: Dict[str, str], output_path: str,
+                    writer_name: Optional[str] = None):
+        writer_name = writer_name or DEFAULT_WORD_WRITER
+        if writer_name not in WORD_WRITERS:
+            raise ValueError(f"未知的 Word 生成方式: {writer_name}")
 
         for chapter in chapters:
-            # 添加结构图路径
-            structure_key = f"structure_{chapter['name']}"
-            chapter['structure_image'] = image_mapping.get(structure_key, '')
+            self._attach_images(chapter, image_mapping)
+
+        if writer_name == "ooxml":
+            ooxml_writer = OoxmlWriter(output_path)
+            try:
+                ooxml_writer.add_title("软件需求说明书")
+                for chapter in chapters:
+                    ooxml_writer.add_chapter(chapter)
+            except BaseException:
+                ooxml_writer.discard()
+                raise
+            ooxml_writer.save()
+            return
+
+        writer = DocxWriter(output_path)
+        writer.add_title("软件需求说明书")
+
+        # 章节较多时在进程池中并行生成各章节片段，再按顺序合并
+        if docx_build_pool.parallel_for(len(chapters)):
+            for fragment in docx_build_pool.build_fragments(chapters):
+                writer.add_fragment(fragment)
+        else:
+            for chapter in chapters:
+                writer.add_chapter(chapter)
 
-            # 为每个 feature 添加流程图路径
-            for feature in chapter.get('features', []):
-                flow_key = f"flow_{feature['scenario']}"
-                feature['flow_chart'] = image_mapping.get(flow_key, '')
+        writer.save()
 
-            writer.add_chapter(chapter)
+    def _write_word_incremental(self, chapters: List[Dict], image_mapping: Dict[str, str], user_id: int,
+                                output_path: str) -> Dict[str, int]:
+        writer = DocxWriter(output_path)
+        writer.add_title("软件需求说明书")
 
-        return writer.save()
+        keys = []
+        fragments: List[Optional[ChapterFragment]] = []
+        for chapter in chapters:
+            self._attach_images(chapter, image_mapping)
+            keys.append(fragment_key(chapter))
+            fragments.append(chapter_store.get_fragment(user_id, keys[-1]))
+
+        # 需要重新生成的章节较多时同样使用进程池
+        missing = [i for i, fragment in enumerate(fragments) if fragment is None]
+        built = docx_build_pool.build_fragments([chapters[i] for i in missing])
+        for i, fragment in zip(missing, built):
+            fragments[i] = fragment
+            chapter_store.put_fragment(user_id, keys[i], fragment)
+        if missing:
+            chapter_store.prune_fragments(user_id, keep=keys)
+
+        for fragment in fragments:
+            writer.add_fragment(fragment)
+
+        writer.save()
+        return {"chapters": len(chapters), "reused": len(chapters) - len(missing)}
+
+    @staticmethod
+    def _attach_images(chapter: Dict[str, Any], image_mapping: Dict[str, str]):
+        # 添加结构图路径
+        chapter['structure_image'] = image_mapping.get(structure_key(chapter['name']), '')
+
+        # 为每个 feature 添加流程图路径（兼容旧版客户端只按功能过程名称生成的键）
+        for feature in chapter.get('features', []):
+            feature['flow_chart'] = (image_mapping.get(flow_key(chapter['name'], feature['scenario']))
+                                     or image_mapping.get(legacy_flow_key(feature['scenario']), ''))
 
 
 # 全局实例
@@ -0,0 +1,88 @@
+"""
+Word 章节并行生成进程池
+章节较多时，各章节在子进程中分别写成片段（ChapterFragment），再由主进程按顺序合并到最终文档：
+章节序号在合并时按顺序填入，图片关系 ID / docPr id 在合并时重新分配（见 DocxWriter.add_fragment）
+
+注意：本模块会被进程池的子进程导入，保持依赖尽量轻量，不要导入 FastAPI / 数据库相关模块。
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from .docx_writer import ChapterFragment, DocxWriter
+from .tracing import current_span, traced
+
+# 进程池大小，0 或 1 表示始终在当前线程中逐章生成（单个子进程只会增加通信开销）
+BUILD_WORKERS = int(os.getenv("DOCX_BUILD_WORKERS", str(min(4, os.cpu_count() or 1))))
+# 章节数达到该值才使用进程池（章节少时子进程通信和合并的开销大于收益）
+PARALLEL_MIN_CHAPTERS = int(os.getenv("DOCX_PARALLEL_MIN_CHAPTERS", "50"))
+
+
+def build_fragments(chapters: List[Dict[str, Any]]) -> List[ChapterFragment]:
+    """把一组章节逐个写成片段（同步，在子进程中执行）"""
+    scratch = DocxWriter(None)
+    return [scratch.build_fragment(chapter) for chapter in chapters]
+
+
+class DocxBuildPool:
+    """
+    在有界进程池中并行生成章节片段
+
+    进程池延迟创建，使用 spawn 启动方式，与密码哈希进程池一致。
+    """
+
+    def __init__(self, max_workers: int = BUILD_WORKERS, min_chapters: int = PARALLEL_MIN_CHAPTERS):
+        self.max_workers = max_workers
+        self.min_chapters = min_chapters
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+        return self._executor
+
+    def parallel_for(self, chapter_count: int) -> bool:
+        """该数量的章节是否使用进程池生成"""
+        return self.max_workers > 1 and chapter_count >= self.min_chapters
+
+    @traced("DocxBuildPool.build_fragments")
+    def build_fragments(self, chapters: List[Dict[str, Any]]) -> List[ChapterFragment]:
+        """
+        生成章节片段，返回顺序与 chapters 一致
+
+        章节按顺序切成连续的若干块（每个进程两块，平衡各章节大小不一造成的负载不均），
+        每块在子进程中用一个草稿文档生成
+        """
+        span = current_span()
+        span.set_attribute("docx.chapters", len(chapters))
+        if not self.parallel_for(len(chapters)):
+            span.set_attribute("docx.workers", 0)
+            return build_fragments(chapters)
+
+        chunk_count = min(len(chapters), self.max_workers * 2)
+        chunk_size = -(-len(chapters) // chunk_count)
+        chunks = [chapters[i:i + chunk_size] for i in range(0, len(chapters), chunk_size)]
+        span.set_attribute("docx.workers", self.max_workers)
+
+        fragments: List[ChapterFragment] = []
+        for chunk in self._get_executor().map(build_fragments, chunks):
+            fragments.extend(chunk)
+        return fragments
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+
+# 全局实例
+docx_build_pool = DocxBuildPool()
@@ -1,87 +1,303 @@
 """
 Word 文档生成器 - 使用 python-docx 生成文档
+python-docx 在创建第一个文档时才导入，以加快服务启动
+
+章节片段（ChapterFragment）：单独生成的一个章节的正文 XML 和引用的图片，
+章节序号写为占位符，合并时再替换为实际序号，因此同一片段可以放在文档的任意位置复用
 """
 import os
-from typing import Dict, List, Any
-from docx import Document
-from docx.shared import Inches
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Any, Optional, Tuple
+
+from .tracing import current_span, traced
+
+# 片段中的章节序号占位符（Unicode 私有区字符），只写在标题段落首个文本的开头（见 chapter_blocks）
+CHAPTER_INDEX_PLACEHOLDER = "\ue000"
+
+# 片段中写有章节序号占位符的文本：标题段落（样式 Heading n）第一个 run 的第一个 w:t
+_PLACEHOLDER_TEXT_XPATH = "./w:p[starts-with(w:pPr/w:pStyle/@w:val, 'Heading')]/w:r[1]/w:t[1]"
+
+
+# chapter_blocks 产生的内容块类型
+HEADING = "heading"
+PARAGRAPH = "paragraph"
+PICTURE = "picture"
+
+
+def chapter_blocks(chapter: Dict[str, Any], idx: str) -> Iterator[Tuple[str, Any, Any]]:
+    """
+    章节版式，依次产生内容块：
+        (HEADING, 标题, 级别)
+        (PARAGRAPH, 文本, 段落样式名或 None)
+        (PICTURE, 图片路径, 图片不存在或无法插入时改为插入的提示文字)
+
+    DocxWriter 和 OoxmlWriter 共用，两种写法生成的文档内容一致
+    """
+    name = chapter.get('name', '')
+    description = chapter.get('description', '')
+    functions = chapter.get('functions', [])
+
+    # H1: 章节标题
+    yield HEADING, f'{idx}. {name}', 1
+
+    # H2: 1. 产品概述
+    yield HEADING, f'{idx}.1. 产品概述', 2
+    yield PARAGRAPH, description, None
+
+    # H2: 2. 产品结构（功能摘要)
+    yield HEADING, f'{idx}.2. 产品结构（功能摘要)', 2
+    yield PARAGRAPH, '产品结构如图：', None
+    yield PICTURE, chapter.get('structure_image', ''), '结构图生成失败，未能插入图片。'
+
+    yield PARAGRAPH, '主要包括如下功能', None
+    for fn in functions:
+        yield PARAGRAPH, fn, 'List Bullet'
+
+    # H2: 3. 特性说明
+    yield HEADING, f'{idx}.3. 特性说明', 2
+
+    for loc, feature in enumerate(chapter.get('features', []), start=1):
+        scenario = feature.get('scenario', '')
+        process = feature.get('process', [])
+        input_data = feature.get('input', '')
+        output_data = feature.get('output', '')
+
+        # H3: 特性子标题 (用户场景)
+        yield HEADING, f'{idx}.3.{loc}. {scenario}', 3
+        yield PARAGRAPH, f'用户场景： {scenario}', 'List Bullet'
+
+        yield PARAGRAPH, '流程图', 'List Bullet'
+        yield PICTURE, feature.get('flow_chart', ''), '流程图生成失败，未能插入图片。'
+
+        if process:
+            yield PARAGRAPH, '功能过程:', 'List Bullet'
+            for step, order in enumerate(process, start=1):
+                yield PARAGRAPH, f'{step}. {order}'.rstrip(), None
+
+        yield PARAGRAPH, f'输入：{input_data}', 'List Bullet'
+        yield PARAGRAPH, f'输出：{output_data}', 'List Bullet'
+
+
+def _image_width():
+    """插图宽度（7 英寸）"""
+    from docx.shared import Inches
+    return Inches(7)
+
+
+@dataclass
+class ChapterFragment:
+    """一个章节的正文片段"""
+    # 包含章节各段落的 <w:body> 元素序列化后的 XML，章节序号为 CHAPTER_INDEX_PLACEHOLDER
+    xml: str
+    # 片段内的图片关系 ID -> 图片路径
+    images: Dict[str, str] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"xml": self.xml, "images": self.images}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ChapterFragment":
+        return cls(xml=data["xml"], images=dict(data.get("images", {})))
+
+    def images_available(self) -> bool:
+        return all(os.path.exists(path) for path in self.images.values())
 
 
 class DocxWriter:
     """Word 文档生成器"""
 
-    def __init__(self, output_path: str):
+    def __init__(self, output_path: Optional[str]):
+        from docx import Document
+
         self.output_path = output_path
         self.doc = Document()
 
         self.chapter_index = 0
+        # 图片 SHA1 -> (关系 ID, Image)，以及下一个图片编号 / 关系 ID 编号 / docPr id，见 _get_or_add_image
+        self._images: Dict[str, Tuple[str, Any]] = {}
+        # 图片路径 -> (关系 ID, Image)：同一张图（如多个章节共用的流程图）只读取、哈希一次
+        self._images_by_path: Dict[str, Tuple[str, Any]] = {}
+        self._next_image_number = len(self.doc.part.package.image_parts) + 1
+        self._next_rid_number = 1
+        self._next_shape_id: Optional[int] = None
+        # 记录插入的图片（生成片段时使用）
+        self._image_rids: Dict[str, str] = {}
+        # 段落样式名 -> 样式 ID，见 _add_paragraph
+        self._style_ids: Dict[str, Optional[str]] = {}
+        # 正文末尾的节属性，新内容都插入到它之前（body.sectPr 每次都要遍历整个正文查找）
+        self._sect_pr = self.doc.element.body.sectPr
 
     def add_title(self, title: str):
-        self.doc.add_heading(title, level=0)
+        self._add_heading(title, level=0)
 
+    @traced("DocxWriter.add_chapter")
     def add_chapter(self, chapter: Dict[str, Any]):
         self.chapter_index += 1
         idx = self.chapter_index
+        current_span().set_attribute("chapter.index", idx)
+        self._write_chapter(chapter, str(idx))
+
+    def build_fragment(self, chapter: Dict[str, Any]) -> ChapterFragment:
+        """
+        把章节写成独立片段（不计入本文档的章节序号）
+
+        本文档只作为草稿使用：生成后清空正文，可以连续生成多个片段
+        """
+        from docx.oxml.ns import qn
+        from lxml import etree
+
+        body = self.doc.element.body
+        self._image_rids = {}
+        self._write_chapter(chapter, CHAPTER_INDEX_PLACEHOLDER)
+
+        # 移到一个声明了全部命名空间的 <w:body> 中再序列化，命名空间只声明一次
+        wrapper = etree.Element(qn("w:body"), nsmap=body.nsmap)
+        for element in [element for element in body if element is not self._sect_pr]:
+            wrapper.append(element)
+        return ChapterFragment(xml=etree.tostring(wrapper, encoding="unicode"), images=self._image_rids)
 
-        name = chapter.get('name', '')
-        description = chapter.get('description', '')
-        functions = chapter.get('functions', [])
+    @traced("DocxWriter.add_fragment")
+    def add_fragment(self, fragment: ChapterFragment):
+        """
+        按顺序追加片段：替换章节序号占位符，并重新映射图片关系 ID 和 docPr id
 
-        # H1: 章节标题
-        self.doc.add_heading(f'{idx}. {name}', level=1)
+        先解析再按元素 / 属性修改，正文中恰好含有 r:embed="..." 或占位符字符的文本不受影响
+        """
+        from docx.oxml import parse_xml
+        from docx.oxml.ns import qn
 
-        # H2: 1. 产品概述
-        self.doc.add_heading(f'{idx}.1. 产品概述', level=2)
-        self.doc.add_paragraph(description)
+        self.chapter_index += 1
+        current_span().set_attribute("chapter.index", self.chapter_index)
+        wrapper = parse_xml(fragment.xml)
+
+        index = str(self.chapter_index)
+        for text in wrapper.xpath(_PLACEHOLDER_TEXT_XPATH):
+            if text.text and text.text.startswith(CHAPTER_INDEX_PLACEHOLDER):
+                text.text = index + text.text[len(CHAPTER_INDEX_PLACEHOLDER):]
+
+        if fragment.images:
+            rid_map = {}
+            for old_rid, path in fragment.images.items():
+                rid_map[old_rid], _ = self._get_or_add_image(path)
+            embed = qn("r:embed")
+            for blip in wrapper.iter(qn("a:blip")):
+                old_rid = blip.get(embed)
+                if old_rid in rid_map:
+                    blip.set(embed, rid_map[old_rid])
 
-        # H2: 2. 产品结构（功能摘要)
-        self.doc.add_heading(f'{idx}.2. 产品结构（功能摘要)', level=2)
-        self.doc.add_paragraph('产品结构如图：')
+            for doc_pr in wrapper.iter(qn("wp:docPr")):
+                shape_id = self._new_shape_id()
+                doc_pr.set("id", str(shape_id))
+                doc_pr.set("name", f"Picture {shape_id}")
 
-        structure_image = chapter.get('structure_image', '')
-        if structure_image and os.path.exists(structure_image):
-            try:
-                self.doc.add_picture(structure_image, width=Inches(7))
-            except Exception:
-                self.doc.add_paragraph('结构图生成失败，未能插入图片。')
+        for element in list(wrapper):
+            self._append_to_body(element)
+
+    def _append_to_body(self, element):
+        if self._sect_pr is not None:
+            self._sect_pr.addprevious(element)
         else:
-            self.doc.add_paragraph('结构图生成失败，未能插入图片。')
+            self.doc.element.body.append(element)
+
+    def _add_paragraph(self, text: str = '', style: Optional[str] = None):
+        """
+        在正文末尾（sectPr 之前）添加段落，等同于 doc.add_paragraph(text, style)
+
+        python-docx 每添加一个段落都要从头查找 sectPr，并为样式名遍历全部样式查找默认样式，
+        正文越长越慢；这里缓存 sectPr 和样式 ID
+        """
+        from docx.enum.style import WD_STYLE_TYPE
+        from docx.oxml import OxmlElement
+        from docx.text.paragraph import Paragraph
 
-        self.doc.add_paragraph('主要包括如下功能')
-        for fn in functions:
-            self.doc.add_paragraph(fn, style='List Bullet')
+        p = OxmlElement('w:p')
+        self._append_to_body(p)
 
-        # H2: 3. 特性说明
-        self.doc.add_heading(f'{idx}.3. 特性说明', level=2)
+        if style is not None:
+            if style not in self._style_ids:
+                self._style_ids[style] = self.doc.part.get_style_id(style, WD_STYLE_TYPE.PARAGRAPH)
+            p.style = self._style_ids[style]
 
-        for loc, feature in enumerate(chapter.get('features', []), start=1):
-            scenario = feature.get('scenario', '')
-            process = feature.get('process', [])
-            input_data = feature.get('input', '')
-            output_data = feature.get('output', '')
-            flow_chart = feature.get('flow_chart', '')
+        paragraph = Paragraph(p, self.doc)
+        if text:
+            paragraph.add_run(text)
+        return paragraph
 
-            # H3: 特性子标题 (用户场景)
-            self.doc.add_heading(f'{idx}.3.{loc}. {scenario}', level=3)
-            self.doc.add_paragraph(f'用户场景： {scenario}', style='List Bullet')
+    def _add_heading(self, text: str, level: int):
+        """等同于 doc.add_heading(text, level)"""
+        return self._add_paragraph(text, "Title" if level == 0 else f"Heading {level}")
 
-            self.doc.add_paragraph('流程图', style='List Bullet')
-            if flow_chart and os.path.exists(flow_chart):
+    def _get_or_add_image(self, path: str) -> Tuple[str, Any]:
+        """
+        添加图片部件并返回 (关系 ID, Image)
+
+        与 python-docx 的 part.get_or_add_image 结果相同（按内容去重，部件名 / 关系 ID 依次编号），
+        但 python-docx 每添加一张图都要遍历全部图片部件和关系来查重、分配编号，图片多时总耗时为 O(n²)；
+        这里用字典和计数器，要求文档中的图片都经由本方法添加
+        """
+        from docx.image.image import Image
+        from docx.opc.constants import RELATIONSHIP_TYPE as RT
+        from docx.opc.packuri import PackURI
+        from docx.parts.image import ImagePart
+
+        known = self._images_by_path.get(path)
+        if known is not None:
+            return known
+
+        image = Image.from_file(path)
+        known = self._images.get(image.sha1)
+        if known is not None:
+            self._images_by_path[path] = known
+            return known
+
+        partname = PackURI(f"/word/media/image{self._next_image_number}.{image.ext}")
+        self._next_image_number += 1
+        image_part = ImagePart.from_image(image, partname)
+        self.doc.part.package.image_parts.append(image_part)
+
+        rels = self.doc.part.rels
+        while f"rId{self._next_rid_number}" in rels:
+            self._next_rid_number += 1
+        rid = f"rId{self._next_rid_number}"
+        rels.add_relationship(RT.IMAGE, image_part, rid)
+
+        self._images[image.sha1] = self._images_by_path[path] = (rid, image)
+        return rid, image
+
+    def _new_shape_id(self) -> int:
+        """分配图片 docPr id（python-docx 每次都扫描整个文档取最大 id，这里只扫描一次）"""
+        if self._next_shape_id is None:
+            self._next_shape_id = self.doc.part.next_id
+        shape_id = self._next_shape_id
+        self._next_shape_id += 1
+        return shape_id
+
+    def _add_picture(self, path: str):
+        """插入独占一段的图片，等同于 doc.add_picture(path, width=_image_width())"""
+        from docx.oxml.shape import CT_Inline
+
+        rid, image = self._get_or_add_image(path)
+        cx, cy = image.scaled_dimensions(_image_width(), None)
+        inline = CT_Inline.new_pic_inline(self._new_shape_id(), rid, image.filename, cx, cy)
+        self._image_rids[rid] = path
+        self._add_paragraph().add_run()._r.add_drawing(inline)
+
+    def _write_chapter(self, chapter: Dict[str, Any], idx: str):
+        for kind, value, option in chapter_blocks(chapter, idx):
+            if kind == HEADING:
+                self._add_heading(value, level=option)
+            elif kind == PARAGRAPH:
+                self._add_paragraph(value, style=option)
+            elif value and os.path.exists(value):
                 try:
-                    self.doc.add_picture(flow_chart, width=Inches(7))
+                    self._add_picture(value)
                 except Exception:
-                    self.doc.add_paragraph('流程图生成失败，未能插入图片。')
+                    self._add_paragraph(option)
             else:
-                self.doc.add_paragraph('流程图生成失败，未能插入图片。')
-
-            if process:
-                self.doc.add_paragraph('功能过程:', style='List Bullet')
-                for step, order in enumerate(process, start=1):
-                    self.doc.add_paragraph(f'{step}. {order}'.rstrip())
-
-            self.doc.add_paragraph(f'输入：{input_data}', style='List Bullet')
-            self.doc.add_paragraph(f'输出：{output_data}', style='List Bullet')
+                self._add_paragraph(option)
 
+    @traced("DocxWriter.save")
     def save(self) -> str:
         self.doc.save(self.output_path)
+        current_span().set_attribute("docx.bytes", os.path.getsize(self.output_path))
         return self.output_path
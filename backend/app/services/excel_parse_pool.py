@@ -0,0 +1,95 @@
+"""
+Excel 解析进程池
+批量处理多个工作簿 / 工作表时，pandas 解析在独立的进程池中并行执行，不占用事件循环（同时绕开 GIL）
+
+注意：本模块会被进程池的子进程导入，保持依赖尽量轻量，不要导入 FastAPI / 数据库相关模块。
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from .excel_parser import ExcelParser
+
+# 进程池大小，0 表示在线程池中解析（用于测试或无法创建子进程的环境）
+PARSE_WORKERS = int(os.getenv("EXCEL_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+def parse_sheet(file_path: str, sheet_name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    解析并验证一个工作表（同步，在子进程中执行）
+
+    Returns:
+        {"sheet_name": ..., "validation": {...}, "data": 解析结果或 None, "parse_ms": 耗时}
+    """
+    start = time.perf_counter()
+    parser = ExcelParser(file_path, sheet_name)
+    try:
+        data = parser.parse()
+    except Exception as e:
+        validation, data = ExcelParser.parse_error(e), None
+    else:
+        validation = parser.validate_data(data)
+    return {
+        "sheet_name": parser.sheet_name,
+        "validation": validation,
+        "data": data if validation["valid"] else None,
+        "parse_ms": (time.perf_counter() - start) * 1000,
+    }
+
+
+def find_spec_sheets(file_path: str) -> List[str]:
+    """查找格式符合的工作表（同步，在子进程中执行）；文件无法读取时返回空列表，由解析步骤报告错误"""
+    try:
+        return ExcelParser.find_spec_sheets(file_path)
+    except Exception:
+        return []
+
+
+class ExcelParsePool:
+    """
+    在有界进程池中解析 Excel 的异步封装
+
+    进程池延迟创建，使用 spawn 启动方式，与密码哈希进程池一致。
+    """
+
+    def __init__(self, max_workers: int = PARSE_WORKERS):
+        self.max_workers = max_workers
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+        return self._executor
+
+    async def _run(self, func, *args):
+        if self.max_workers <= 0:
+            return await asyncio.to_thread(func, *args)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), func, *args)
+
+    async def parse_sheet(self, file_path: str, sheet_name: Optional[str] = None) -> Dict[str, Any]:
+        return await self._run(parse_sheet, file_path, sheet_name)
+
+    async def find_spec_sheets(self, file_path: str) -> List[str]:
+        return await self._run(find_spec_sheets, file_path)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+
+# 全局实例
+excel_parse_pool = ExcelParsePool()
@@ -1,22 +1,51 @@
 """
 Excel 文件解析服务 - 简化版
 从 Excel 中提取需求数据
+
+pandas / openpyxl 导入耗时较长，在首次解析时才导入，以加快服务启动
 """
-import openpyxl
-import pandas as pd
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from pathlib import Path
 from collections import OrderedDict
 
+from .tracing import current_span, traced
+
+
+DEFAULT_SHEET_NAME = "功能点拆分表"
+COLUMNS = ['功能用户需求', '触发事件', '功能过程', '子过程描述', '数据组', '功能用户', '角色']
+
 
 class ExcelParser:
     """Excel 解析器 - 简化版"""
 
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, sheet_name: Optional[str] = None):
         self.file_path = Path(file_path)
-        self.sheet_name = "功能点拆分表"
-        self.columns = ['功能用户需求', '触发事件', '功能过程', '子过程描述', '数据组', '功能用户', '角色']
+        self.sheet_name = sheet_name or DEFAULT_SHEET_NAME
+        self.columns = list(COLUMNS)
+
+    @staticmethod
+    def find_spec_sheets(file_path: str) -> List[str]:
+        """
+        查找表头包含全部必需列的工作表（与「功能点拆分表」格式相同的 Sheet）
+
+        Returns:
+            按工作簿中顺序排列的工作表名，没有符合的返回空列表
+        """
+        import openpyxl
+
+        workbook = openpyxl.load_workbook(file_path, read_only=True)
+        try:
+            sheets = []
+            for sheet in workbook.worksheets:
+                header = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True), ())
+                names = {str(value).strip() for value in header if value is not None}
+                if all(column in names for column in COLUMNS):
+                    sheets.append(sheet.title)
+            return sheets
+        finally:
+            workbook.close()
 
+    @traced("ExcelParser.parse")
     def parse(self) -> Dict[str, Any]:
         """
         解析 Excel 文件为结构化数据
@@ -30,6 +59,9 @@ class ExcelParser:
                 }
             }
         """
+        import openpyxl
+        import pandas as pd
+
         if not self.file_path.exists():
             raise FileNotFoundError(f"文件不存在: {self.file_path}")
 
@@ -82,6 +114,7 @@ class ExcelParser:
                 f"请确保工作表中包含有效的需求数据。"
             )
 
+        current_span().set_attribute("excel.rows", len(df))
         result_dict = OrderedDict()
 
         # 当前值（用于合并单元格的前向填充）
@@ -151,12 +184,14 @@ class ExcelParser:
                     else:
                         sub_proc_list.append(f"执行{func_process}")
 
+        current_span().set_attribute("excel.features", len(result_dict))
         return result_dict
 
     def _clean_text(self, text: str) -> str:
         """清理文本中的空白字符"""
         return str(text).strip().replace(" ", "").replace("\t", "").replace("\n", "")
 
+    @traced("ExcelParser.validate")
     def validate(self) -> Dict[str, Any]:
         """
         验证 Excel 数据
@@ -175,24 +210,34 @@ class ExcelParser:
                 "warnings": [...]
             }
         """
-        result = {
-            "valid": True,
-            "errors": [],
-            "warnings": []
-        }
-
         try:
             data = self.parse()
         except Exception as e:
             # 解析失败（Sheet不存在、列名错误等）
-            result["valid"] = False
-            result["errors"].append({
+            return self.parse_error(e)
+        return self.validate_data(data)
+
+    @staticmethod
+    def parse_error(error: Exception) -> Dict[str, Any]:
+        """解析失败时的验证结果"""
+        return {
+            "valid": False,
+            "errors": [{
                 "type": "parse_error",
                 "message": "Excel 文件解析失败",
                 "location": "文件结构",
-                "details": str(e)
-            })
-            return result
+                "details": str(error)
+            }],
+            "warnings": []
+        }
+
+    def validate_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """验证 parse() 的结果，返回格式同 validate()（已解析过时避免重复读取文件）"""
+        result = {
+            "valid": True,
+            "errors": [],
+            "warnings": []
+        }
 
         # 检查是否有数据
         if not data:
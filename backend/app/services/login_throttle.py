@@ -0,0 +1,183 @@
+"""
+登录限流服务
+在 bcrypt 校验之前按 IP、按（用户名, IP）进行滑动窗口限流，并限制同时进行的密码校验数量，
+保证认证消耗的 CPU 有上限
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Hashable, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+
+class SlidingWindowLimiter:
+    """
+    滑动窗口计数器
+    每个 key 记录窗口内的事件时间戳，超过 limit 次即被限流；
+    key 数量达到 max_keys 时先清理空闲的 key，仍然已满则淘汰最久没有新事件的 key
+    """
+
+    def __init__(self, limit: int, window_seconds: float, max_keys: int = 100000):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        # 按最近一次事件的先后排列（hit 时移到末尾）
+        self._events: "OrderedDict[Hashable, Deque[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def retry_after(self, key: Hashable, now: Optional[float] = None) -> float:
+        """
+        返回需要等待的秒数，0 表示未被限流
+        """
+        if self.limit <= 0:
+            return 0.0
+
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            events = self._events.get(key)
+            if not events:
+                return 0.0
+            self._prune(events, now)
+            if len(events) < self.limit:
+                return 0.0
+            return max(0.0, events[0] + self.window_seconds - now)
+
+    def hit(self, key: Hashable, now: Optional[float] = None):
+        """记录一次事件"""
+        if self.limit <= 0:
+            return
+
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            events = self._events.get(key)
+            if events is None:
+                if len(self._events) >= self.max_keys:
+                    self._evict_idle(now)
+                    while self._events and len(self._events) >= self.max_keys:
+                        self._events.popitem(last=False)
+                events = self._events[key] = deque()
+            else:
+                self._events.move_to_end(key)
+            self._prune(events, now)
+            events.append(now)
+
+    def reset(self, key: Hashable):
+        with self._lock:
+            self._events.pop(key, None)
+
+    def _prune(self, events: Deque[float], now: float):
+        cutoff = now - self.window_seconds
+        while events and events[0] <= cutoff:
+            events.popleft()
+
+    def _evict_idle(self, now: float):
+        """
+        清理窗口内已无事件的 key，防止内存无限增长（调用方需持有锁）
+        key 按最近一次事件的先后排列，空闲的 key 都在最前面，从头清理到第一个仍有事件的 key 即可
+        """
+        cutoff = now - self.window_seconds
+        while self._events:
+            key, events = next(iter(self._events.items()))
+            if events and events[-1] > cutoff:
+                break
+            del self._events[key]
+
+
+class LoginThrottle:
+    """
+    登录限流
+
+    - 每个 IP 在窗口内的登录尝试次数有上限
+    - 每个（用户名, IP）在窗口内的失败次数有上限，登录成功后清零；
+      按 IP 区分，其他地址的失败尝试不会锁定该用户（对单个用户名的分布式猜测由 IP 限流约束）
+    - 全局同时进行的 bcrypt 校验数量有上限，排队超时直接拒绝
+    - 不存在的用户名不做 bcrypt 校验，而是异步等待与一次校验相近的时间，避免通过耗时探测用户名
+    """
+
+    def __init__(
+        self,
+        ip_limit: int = 30,
+        ip_window_seconds: float = 60,
+        username_failure_limit: int = 5,
+        username_window_seconds: float = 300,
+        max_concurrent_verify: int = 4,
+        verify_queue_timeout: float = 2.0,
+    ):
+        self.ip_limiter = SlidingWindowLimiter(ip_limit, ip_window_seconds)
+        # key 为 (用户名, IP)，见 _failure_key
+        self.failure_limiter = SlidingWindowLimiter(username_failure_limit, username_window_seconds)
+        self.max_concurrent_verify = max_concurrent_verify
+        self.verify_queue_timeout = verify_queue_timeout
+        self._verify_semaphore = asyncio.Semaphore(max_concurrent_verify)
+        # 最近 bcrypt 校验耗时的指数移动平均，用于不存在用户名时的等待时间
+        self._verify_seconds_ema = 0.2
+
+    def check(self, username: str, client_ip: str):
+        """
+        登录前检查是否被限流，并记录本次 IP 尝试
+        被限流时抛出 429
+        """
+        wait = max(
+            self.ip_limiter.retry_after(client_ip),
+            self.failure_limiter.retry_after(self._failure_key(username, client_ip)),
+        )
+        if wait > 0:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="登录尝试过于频繁，请稍后再试",
+                headers={"Retry-After": str(int(wait) + 1)},
+            )
+
+        self.ip_limiter.hit(client_ip)
+
+    def record_failure(self, username: str, client_ip: str):
+        self.failure_limiter.hit(self._failure_key(username, client_ip))
+
+    def record_success(self, username: str, client_ip: str):
+        self.failure_limiter.reset(self._failure_key(username, client_ip))
+
+    @staticmethod
+    def _failure_key(username: str, client_ip: str) -> Tuple[str, str]:
+        return username, client_ip
+
+    @asynccontextmanager
+    async def verify_slot(self):
+        """
+        获取一个 bcrypt 校验名额，超时未获取到则抛出 503
+        """
+        try:
+            await asyncio.wait_for(self._verify_semaphore.acquire(), timeout=self.verify_queue_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="登录请求过多，请稍后再试",
+                headers={"Retry-After": "1"},
+            )
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._verify_semaphore.release()
+            elapsed = time.perf_counter() - start
+            self._verify_seconds_ema = self._verify_seconds_ema * 0.8 + elapsed * 0.2
+
+    async def delay_unknown_user(self):
+        """不存在的用户名：不消耗 CPU，仅等待与一次 bcrypt 校验相近的时间"""
+        await asyncio.sleep(self._verify_seconds_ema * random.uniform(0.9, 1.1))
+
+
+# 全局实例
+login_throttle = LoginThrottle(
+    ip_limit=int(os.getenv("AUTH_LOGIN_IP_LIMIT", "30")),
+    ip_window_seconds=float(os.getenv("AUTH_LOGIN_IP_WINDOW", "60")),
+    username_failure_limit=int(os.getenv("AUTH_LOGIN_USER_FAILURE_LIMIT", "5")),
+    username_window_seconds=float(os.getenv("AUTH_LOGIN_USER_WINDOW", "300")),
+    max_concurrent_verify=int(os.getenv("AUTH_MAX_CONCURRENT_VERIFY", "4")),
+    verify_queue_timeout=float(os.getenv("AUTH_VERIFY_QUEUE_TIMEOUT", "2")),
+)
@@ -0,0 +1,306 @@
+"""
+进程内指标服务
+提供 Prometheus 文本格式的计数器 / 直方图，不依赖外部服务，通过 /metrics 暴露
+
+每次记录只是一次加锁的数组累加，开销在微秒级，可以在生产环境常开。
+阶段指标会自动带上当前请求的路由模板（route 标签），路由由 MetricsMiddleware 记录。
+"""
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 当前请求的 ASGI scope；路由匹配后 scope["route"] 才会被填充，因此读取时再解析
+_request_scope: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("metrics_request_scope", default=None)
+
+# 默认耗时分桶（秒），覆盖毫秒级的缓存命中到分钟级的 AI 调用 / mmdc 渲染
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 文件大小分桶（字节）：1KB ~ 100MB
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 512 * 1024, 1024 ** 2, 5 * 1024 ** 2, 10 * 1024 ** 2, 50 * 1024 ** 2, 100 * 1024 ** 2)
+# Token 数分桶
+TOKEN_BUCKETS = (50, 100, 200, 500, 1000, 2000, 5000, 10000, 50000)
+
+
+def route_template(scope: dict) -> str:
+    """从 ASGI scope 中取出匹配到的路由模板（如 /api/generate/mermaid），未匹配时返回 unmatched"""
+    # 较新版本的 FastAPI 不再展开 include_router 的路由，scope["route"].path 不含前缀，
+    # 完整的路径模板在有效路由上下文中
+    context = (scope.get("fastapi") or {}).get("effective_route_context")
+    path = getattr(context, "path_format", None)
+    if path:
+        return path
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def current_route() -> str:
+    """当前请求的路由模板，不在请求中时返回 none"""
+    scope = _request_scope.get()
+    if scope is None:
+        return "none"
+    return route_template(scope)
+
+
+def outcome_for_status(status_code: int) -> str:
+    if status_code >= 500:
+        return "error"
+    if status_code >= 400:
+        return "client_error"
+    return "success"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _label_values(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if "route" in self.labelnames and "route" not in labels:
+            labels["route"] = current_route()
+        try:
+            return tuple(str(labels[name]) for name in self.labelnames)
+        except KeyError as e:
+            raise ValueError(f"指标 {self.name} 缺少标签 {e.args[0]}")
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        key = self._label_values(labels)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def _render_samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}"
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(_Metric):
+    """分桶直方图（累计分桶在输出时计算，记录时只累加一个桶）"""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [各桶计数..., +Inf 桶计数], sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._label_values(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        记录代码块耗时；若直方图有 outcome 标签且未指定，按是否抛出异常记为 success / error
+        """
+        start = time.perf_counter()
+        auto_outcome = "outcome" in self.labelnames and "outcome" not in labels
+        try:
+            yield
+        except BaseException:
+            if auto_outcome:
+                labels["outcome"] = "error"
+            self.observe(time.perf_counter() - start, **labels)
+            raise
+        if auto_outcome:
+            labels["outcome"] = "success"
+        self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        key = self._label_values(labels)
+        with self._lock:
+            series = self._series.get(key)
+            return sum(series[0]) if series else 0
+
+    def _render_samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._series.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_number(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_number(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class MetricsRegistry:
+    """指标注册表，负责输出 Prometheus 文本格式"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: Dict[str, _Metric] = {}
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"指标 {metric.name} 已注册")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        """清空所有已记录的数据（用于测试）"""
+        for metric in self._metrics.values():
+            metric.clear()
+
+
+class MetricsMiddleware:
+    """
+    ASGI 中间件：记录每个 HTTP 请求的耗时和状态码，并让阶段指标获取当前路由
+    （纯 ASGI 实现，不缓冲响应体，对流式响应无额外开销）
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not registry.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        token = _request_scope.set(scope)
+        status_holder = [500]
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = current_route()
+            method = scope.get("method", "")
+            status_code = status_holder[0]
+            http_request_seconds.observe(elapsed, route=route, method=method, outcome=outcome_for_status(status_code))
+            http_requests_total.inc(route=route, method=method, status=str(status_code))
+            _request_scope.reset(token)
+
+
+# 全局注册表
+registry = MetricsRegistry(enabled=os.getenv("METRICS_ENABLED", "true").lower() not in ("0", "false", "no"))
+
+# --- HTTP ---
+http_requests_total = registry.counter(
+    "http_requests_total", "HTTP 请求数", ("route", "method", "status"))
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "HTTP 请求耗时", ("route", "method", "outcome"))
+
+# --- 上传 ---
+upload_bytes = registry.histogram(
+    "upload_size_bytes", "上传文件大小", ("route", "outcome"), buckets=SIZE_BUCKETS)
+
+# --- Excel 解析 ---
+excel_parse_seconds = registry.histogram(
+    "excel_parse_duration_seconds", "Excel 校验 / 解析耗时", ("route", "stage", "outcome"))
+
+# --- AI 描述生成 ---
+ai_request_seconds = registry.histogram(
+    "ai_request_duration_seconds", "AI 接口调用耗时", ("route", "model", "outcome"))
+ai_tokens = registry.histogram(
+    "ai_tokens", "AI 单次调用消耗的 token 数", ("route", "model", "kind"), buckets=TOKEN_BUCKETS)
+ai_fallbacks_total = registry.counter(
+    "ai_fallbacks_total", "AI 不可用时使用模板描述的次数", ("route", "reason"))
+
+# --- Mermaid 渲染 ---
+mermaid_render_seconds = registry.histogram(
+    "mermaid_render_duration_seconds", "mmdc 渲染耗时（不含排队）", ("route", "outcome"))
+mermaid_queue_wait_seconds = registry.histogram(
+    "mermaid_queue_wait_seconds", "等待 mmdc 并发名额的时间", ("route", "priority"))
+mermaid_cache_total = registry.counter(
+    "mermaid_cache_lookups_total", "Mermaid 图片缓存查找结果", ("route", "result"))
+
+# --- 客户端断开 ---
+client_disconnects_total = registry.counter(
+    "client_disconnects_total", "生成完成前客户端已断开的请求数", ("route",))
+abandoned_work_total = registry.counter(
+    "abandoned_work_total", "请求被取消后的生成工作：cancelled 已取消（节省），continued 已在运行或仍被其他请求共享而继续",
+    ("route", "kind", "outcome"))
+
+# --- Word 生成 ---
+docx_build_seconds = registry.histogram(
+    "docx_build_duration_seconds", "Word 文档生成耗时", ("route", "outcome"))
+docx_bytes = registry.histogram(
+    "docx_size_bytes", "生成的 Word 文档大小", ("route",), buckets=SIZE_BUCKETS)
@@ -0,0 +1,281 @@
+"""
+Word 文档生成器 - 直接输出 WordprocessingML
+
+章节版式固定（见 docx_writer.chapter_blocks），每种内容块对应一个预先写好的 XML 模板，
+生成时只做字符串替换，边生成边写入 zip（word/document.xml 流式压缩），不构建 python-docx 的对象树：
+速度更快，内存占用与文档大小基本无关（图片在保存时才从磁盘读入压缩包）
+
+样式、主题、编号等其余部件来自 python-docx 默认模板（python-docx 保存一个空文档得到，进程内只生成一次），
+段落、图片、关系和内容类型的写法与 DocxWriter 逐字节一致
+"""
+import os
+import re
+import tempfile
+import threading
+import zipfile
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from .docx_writer import HEADING, PARAGRAPH, _image_width, chapter_blocks
+from .tracing import current_span, traced
+
+_DOCUMENT_PART = "word/document.xml"
+_DOCUMENT_RELS_PART = "word/_rels/document.xml.rels"
+_CONTENT_TYPES_PART = "[Content_Types].xml"
+_IMAGE_RELTYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"
+
+# 内容块模板
+_STYLED_PARAGRAPH = '<w:p><w:pPr><w:pStyle w:val="{style}"/></w:pPr>{runs}</w:p>'
+_PARAGRAPH = '<w:p>{runs}</w:p>'
+_EMPTY_PARAGRAPH = '<w:p/>'
+_PICTURE = (
+    '<w:p><w:r><w:drawing><wp:inline xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+    'xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+    '<wp:extent cx="{cx}" cy="{cy}"/><wp:docPr id="{shape_id}" name="Picture {shape_id}"/>'
+    '<wp:cNvGraphicFramePr><a:graphicFrameLocks noChangeAspect="1"/></wp:cNvGraphicFramePr>'
+    '<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture"><pic:pic>'
+    '<pic:nvPicPr><pic:cNvPr id="0" name="{filename}"/><pic:cNvPicPr/></pic:nvPicPr>'
+    '<pic:blipFill><a:blip r:embed="{rid}"/><a:stretch><a:fillRect/></a:stretch></pic:blipFill>'
+    '<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm><a:prstGeom prst="rect"/></pic:spPr>'
+    '</pic:pic></a:graphicData></a:graphic></wp:inline></w:drawing></w:r></w:p>'
+)
+_IMAGE_RELATIONSHIP = '<Relationship Id="{rid}" Type="{reltype}" Target="{target}"/>'
+_XML_DECLARATION = "<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n"
+
+# 与 python-docx 的 Run.text 一致：制表符为 <w:tab/>，换行 / 回车为 <w:br/>，其余连续字符放在一个 <w:t> 中
+_RUN_SPECIAL_CHARS = re.compile(r"[\t\r\n]")
+# XML 1.0 不允许的字符（python-docx / lxml 遇到时会报错）
+_INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+_ATTRIBUTE_ENTITIES = {'"': "&quot;", "\n": "&#10;", "\r": "&#13;", "\t": "&#9;"}
+
+_CONTENT_TYPE_PATTERN = re.compile(r'<(Default|Override) (?:Extension|PartName)="([^"]+)" ContentType="([^"]+)"/>')
+
+
+@dataclass
+class _Skeleton:
+    """空文档的各个部件"""
+    parts: Dict[str, bytes]
+    # word/document.xml 在正文内容之前 / 之后的部分
+    document_head: str
+    document_tail: str
+    style_ids: Dict[str, Optional[str]]
+    first_shape_id: int
+    defaults: Dict[str, str]
+    overrides: Dict[str, str]
+
+
+_skeleton: Optional[_Skeleton] = None
+_skeleton_lock = threading.Lock()
+
+
+def _get_skeleton() -> _Skeleton:
+    global _skeleton
+    if _skeleton is None:
+        with _skeleton_lock:
+            if _skeleton is None:
+                _skeleton = _build_skeleton()
+    return _skeleton
+
+
+def _build_skeleton() -> _Skeleton:
+    import io
+
+    from docx import Document
+    from docx.enum.style import WD_STYLE_TYPE
+
+    doc = Document()
+    style_ids = {
+        name: doc.part.get_style_id(name, WD_STYLE_TYPE.PARAGRAPH)
+        for name in ("Title", "Heading 1", "Heading 2", "Heading 3", "List Bullet")
+    }
+    first_shape_id = doc.part.next_id
+    buffer = io.BytesIO()
+    doc.save(buffer)
+
+    with zipfile.ZipFile(buffer) as archive:
+        parts = {name: archive.read(name) for name in archive.namelist()}
+
+    document = parts.pop(_DOCUMENT_PART).decode("utf-8")
+    split = document.index("<w:sectPr")
+    defaults, overrides = {}, {}
+    for kind, key, content_type in _CONTENT_TYPE_PATTERN.findall(parts.pop(_CONTENT_TYPES_PART).decode("utf-8")):
+        (defaults if kind == "Default" else overrides)[key] = content_type
+
+    return _Skeleton(
+        parts=parts,
+        document_head=document[:split],
+        document_tail=document[split:],
+        style_ids=style_ids,
+        first_shape_id=first_shape_id,
+        defaults=defaults,
+        overrides=overrides,
+    )
+
+
+def _run_xml(text: str) -> str:
+    if _INVALID_XML_CHARS.search(text):
+        raise ValueError("All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters")
+
+    runs = []
+    position = 0
+    for match in _RUN_SPECIAL_CHARS.finditer(text):
+        runs.append(_text_xml(text[position:match.start()]))
+        runs.append("<w:tab/>" if match.group() == "\t" else "<w:br/>")
+        position = match.end()
+    runs.append(_text_xml(text[position:]))
+    return f"<w:r>{''.join(runs)}</w:r>"
+
+
+def _text_xml(text: str) -> str:
+    if not text:
+        return ""
+    if len(text.strip()) < len(text):
+        return f'<w:t xml:space="preserve">{escape(text)}</w:t>'
+    return f"<w:t>{escape(text)}</w:t>"
+
+
+class OoxmlWriter:
+    """
+    直接输出 WordprocessingML 的 Word 文档生成器，接口与 DocxWriter 相同（add_title / add_chapter / save）
+
+    生成过程中写入同目录的临时文件，save() 时替换为 output_path；中途出错时调用 discard() 删除临时文件
+    """
+
+    def __init__(self, output_path: str):
+        self.output_path = output_path
+        self.chapter_index = 0
+        self._skeleton = _get_skeleton()
+
+        # 图片 SHA1 -> (关系 ID, 文件名)；[(部件名, 图片路径)]，保存时再写入
+        self._images: Dict[str, Tuple[str, str]] = {}
+        # 图片路径 -> (关系 ID, 文件名, 宽, 高)：同一张图（如多个章节共用的流程图）只读取、哈希一次
+        self._pictures: Dict[str, Tuple[str, str, int, int]] = {}
+        self._media: List[Tuple[str, str]] = []
+        self._image_relationships: List[str] = []
+        self._defaults = dict(self._skeleton.defaults)
+        self._overrides = dict(self._skeleton.overrides)
+        self._next_rid_number = 1
+        self._next_shape_id = self._skeleton.first_shape_id
+        self._rels_xml = self._skeleton.parts[_DOCUMENT_RELS_PART].decode("utf-8")
+
+        directory = os.path.dirname(os.path.abspath(output_path))
+        fd, self._temp_path = tempfile.mkstemp(dir=directory, suffix=".docx.tmp")
+        os.close(fd)
+        self._zip = zipfile.ZipFile(self._temp_path, "w", zipfile.ZIP_DEFLATED)
+        self._document = self._zip.open(_DOCUMENT_PART, "w", force_zip64=True)
+        self._document.write(self._skeleton.document_head.encode("utf-8"))
+
+    def add_title(self, title: str):
+        self._document.write(self._paragraph(title, "Title").encode("utf-8"))
+
+    @traced("OoxmlWriter.add_chapter")
+    def add_chapter(self, chapter: Dict[str, Any]):
+        self.chapter_index += 1
+        idx = self.chapter_index
+        current_span().set_attribute("chapter.index", idx)
+
+        xml = []
+        for kind, value, option in chapter_blocks(chapter, str(idx)):
+            if kind == HEADING:
+                xml.append(self._paragraph(value, f"Heading {option}"))
+            elif kind == PARAGRAPH:
+                xml.append(self._paragraph(value, option))
+            elif value and os.path.exists(value):
+                try:
+                    xml.append(self._picture(value))
+                except Exception:
+                    xml.append(self._paragraph(option, None))
+            else:
+                xml.append(self._paragraph(option, None))
+        self._document.write("".join(xml).encode("utf-8"))
+
+    def _paragraph(self, text: Any, style: Optional[str]) -> str:
+        runs = _run_xml(str(text)) if text else ""
+        style_id = self._skeleton.style_ids[style] if style is not None else None
+        if style_id is not None:
+            return _STYLED_PARAGRAPH.format(style=style_id, runs=runs)
+        return _PARAGRAPH.format(runs=runs) if runs else _EMPTY_PARAGRAPH
+
+    def _picture(self, path: str) -> str:
+        """与 DocxWriter._add_picture 相同：按内容去重，部件名 / 关系 ID / docPr id 依次编号"""
+        picture = self._pictures.get(path)
+        if picture is None:
+            picture = self._pictures[path] = self._add_image(path)
+
+        rid, filename, cx, cy = picture
+        shape_id = self._next_shape_id
+        self._next_shape_id += 1
+        return _PICTURE.format(cx=cx, cy=cy, shape_id=shape_id, rid=rid,
+                               filename=escape(filename, _ATTRIBUTE_ENTITIES))
+
+    def _add_image(self, path: str) -> Tuple[str, str, int, int]:
+        """读取图片，内容未出现过时登记图片部件，返回 (关系 ID, 文件名, 宽, 高)"""
+        from docx.image.image import Image
+        from docx.opc.spec import default_content_types
+
+        image = Image.from_file(path)
+        known = self._images.get(image.sha1)
+        if known is None:
+            partname = f"/word/media/image{len(self._media) + 1}.{image.ext}"
+            while f'Id="rId{self._next_rid_number}"' in self._rels_xml:
+                self._next_rid_number += 1
+            rid = f"rId{self._next_rid_number}"
+            self._next_rid_number += 1
+
+            self._media.append((partname, path))
+            self._image_relationships.append(
+                _IMAGE_RELATIONSHIP.format(rid=rid, reltype=_IMAGE_RELTYPE, target=partname[len("/word/"):])
+            )
+            if (image.ext.lower(), image.content_type) in default_content_types:
+                # 扩展名不区分大小写，沿用先出现的写法
+                existing = next((ext for ext in self._defaults if ext.lower() == image.ext.lower()), image.ext)
+                self._defaults[existing] = image.content_type
+            else:
+                self._overrides[partname] = image.content_type
+            known = self._images[image.sha1] = (rid, image.filename)
+
+        rid, filename = known
+        cx, cy = image.scaled_dimensions(_image_width(), None)
+        return rid, filename, cx, cy
+
+    def _content_types_xml(self) -> str:
+        elements = [f'<Default Extension="{ext}" ContentType="{content_type}"/>'
+                    for ext, content_type in sorted(self._defaults.items(), key=lambda item: item[0].lower())]
+        elements += [f'<Override PartName="{partname}" ContentType="{content_type}"/>'
+                     for partname, content_type in sorted(self._overrides.items())]
+        return (f'{_XML_DECLARATION}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                f'{"".join(elements)}</Types>')
+
+    @traced("OoxmlWriter.save")
+    def save(self) -> str:
+        try:
+            self._document.write(self._skeleton.document_tail.encode("utf-8"))
+            self._document.close()
+
+            rels = self._rels_xml.replace("</Relationships>", "".join(self._image_relationships) + "</Relationships>")
+            self._zip.writestr(_DOCUMENT_RELS_PART, rels)
+            self._zip.writestr(_CONTENT_TYPES_PART, self._content_types_xml())
+            for name, blob in self._skeleton.parts.items():
+                if name != _DOCUMENT_RELS_PART:
+                    self._zip.writestr(name, blob)
+            for partname, path in self._media:
+                self._zip.write(path, partname.lstrip("/"))
+            self._zip.close()
+            os.replace(self._temp_path, self.output_path)
+        except BaseException:
+            self.discard()
+            raise
+
+        current_span().set_attribute("docx.bytes", os.path.getsize(self.output_path))
+        return self.output_path
+
+    def discard(self):
+        """放弃生成，删除临时文件"""
+        try:
+            self._document.close()
+            self._zip.close()
+        except Exception:
+            pass
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
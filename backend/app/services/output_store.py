@@ -0,0 +1,129 @@
+"""
+生成的 Word 文档存储（按用户、按内容寻址）
+
+- 文档 key：生成请求内容（章节数据、引用图片的路径 / 大小 / 修改时间、版式版本）的 blake2b 哈希，
+  同一用户请求内容完全相同的文档时直接返回已有文件，不重新生成；不同用户、不同内容的文档互不覆盖
+- 文件位置：outputs/user_{id}/{key}.docx（与 CacheService 统计 / 清理的输出目录一致）
+- 写入：先生成到同目录的临时文件，完成后 os.replace，读取方不会看到写了一半的文件
+- key 同时作为下载响应的 ETag；每个用户最多保留 max_documents 个文档，超出时删除最久未使用的
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 文档版式变化时递增，使旧文档失效
+OUTPUT_VERSION = 1
+
+_KEY_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+_DOCUMENT_SUFFIX = ".docx"
+_TEMP_SUFFIX = ".docx.tmp"
+
+
+def _image_stamp(path: str) -> Optional[List[Any]]:
+    # 图片不存在时文档中写入「生成失败」提示，图片之后生成出来时 key 随之变化
+    try:
+        stat = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    return [path, stat.st_size, stat.st_mtime_ns]
+
+
+def document_key(chapters: List[Dict[str, Any]], image_mapping: Dict[str, str]) -> str:
+    """文档 key：决定文档内容的全部输入的哈希（Word 生成方式、是否增量不影响文档内容，不参与计算）"""
+    content = {
+        "version": OUTPUT_VERSION,
+        "chapters": chapters,
+        "images": {key: _image_stamp(path) for key, path in sorted(image_mapping.items())},
+    }
+    payload = json.dumps(content, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def is_document_key(value: str) -> bool:
+    return bool(_KEY_PATTERN.match(value))
+
+
+class OutputStore:
+    """按用户保存生成的 Word 文档"""
+
+    def __init__(self, base_dir: str, max_documents: int = 20):
+        self.base_dir = base_dir
+        self.max_documents = max_documents
+        self._lock = threading.Lock()
+
+    def _user_dir(self, user_id: int) -> str:
+        user_dir = os.path.join(self.base_dir, f"user_{user_id}")
+        os.makedirs(user_dir, exist_ok=True)
+        return user_dir
+
+    def path(self, user_id: int, key: str) -> str:
+        if not is_document_key(key):
+            raise ValueError(f"无效的文档 ID: {key}")
+        return os.path.join(self._user_dir(user_id), key + _DOCUMENT_SUFFIX)
+
+    def get(self, user_id: int, key: str) -> Optional[str]:
+        """
+        已生成的文档路径，不存在时返回 None；命中时更新修改时间（清理时按最久未使用删除）
+
+        更新修改时间与 _prune 持有同一把锁：刚命中的文档是最近使用的，不会被同时进行的清理删除
+        """
+        if not is_document_key(key):
+            return None
+        path = self.path(user_id, key)
+        with self._lock:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                return None
+        return path
+
+    def temp_path(self, user_id: int) -> str:
+        """在用户目录中创建一个临时文件，生成完成后交给 commit()"""
+        fd, temp_path = tempfile.mkstemp(dir=self._user_dir(user_id), suffix=_TEMP_SUFFIX)
+        os.close(fd)
+        return temp_path
+
+    def commit(self, user_id: int, key: str, temp_path: str) -> str:
+        """把生成好的临时文件原子地替换为文档 key 对应的文件"""
+        path = self.path(user_id, key)
+        os.replace(temp_path, path)
+        self._prune(user_id, keep=path)
+        return path
+
+    @staticmethod
+    def discard(temp_path: str):
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    def _prune(self, user_id: int, keep: str):
+        with self._lock:
+            user_dir = self._user_dir(user_id)
+            documents = []
+            for entry in os.scandir(user_dir):
+                if entry.name.endswith(_DOCUMENT_SUFFIX) and entry.path != keep:
+                    try:
+                        documents.append((entry.stat().st_mtime_ns, entry.path))
+                    except FileNotFoundError:
+                        continue
+            documents.sort(reverse=True)
+            for _, path in documents[max(self.max_documents - 1, 0):]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                else:
+                    logger.info("删除最久未使用的 Word 文档", extra={"user_id": user_id, "path": path})
+
+
+# 全局实例
+output_store = OutputStore(
+    os.path.join(tempfile.gettempdir(), "spec-desktop-backend", "outputs"),
+    max_documents=int(os.getenv("OUTPUT_MAX_DOCUMENTS", "20")),
+)
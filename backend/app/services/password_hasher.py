@@ -0,0 +1,77 @@
+"""
+密码哈希服务
+bcrypt 计算在独立的进程池中执行，避免阻塞事件循环（同时绕开 GIL）
+
+注意：本模块会被进程池的子进程导入，保持依赖尽量轻量，不要导入 FastAPI / 数据库相关模块。
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Optional
+
+from passlib.context import CryptContext
+
+# 密码加密上下文
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# 进程池大小，0 表示在调用线程内直接计算（用于测试或无法创建子进程的环境）
+HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", str(min(2, os.cpu_count() or 1))))
+
+
+def hash_password(password: str) -> str:
+    """对密码进行 bcrypt 加密（同步）"""
+    return pwd_context.hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """验证密码是否正确（同步）"""
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    在有界进程池中执行 bcrypt 的异步封装
+
+    进程池在首次 hash / verify 时才创建（启动应用不会拉起子进程），使用 spawn 启动方式，
+    避免在多线程进程中 fork 带来的死锁风险；打包后由 server.py 在导入应用前调用 freeze_support。
+    """
+
+    def __init__(self, max_workers: int = HASH_WORKERS):
+        self.max_workers = max_workers
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+        return self._executor
+
+    async def _run(self, func, *args):
+        if self.max_workers <= 0:
+            return func(*args)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), func, *args)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+
+# 全局实例
+password_hasher = PasswordHasher()
@@ -0,0 +1,82 @@
+"""
+Mermaid 渲染失败缓存（负缓存）
+
+mmdc 对某段代码渲染失败（通常是语法错误，如场景名中未转义的字符）后，在一段时间内记住失败原因：
+同一段代码再次请求时直接返回该错误，不再排队启动 mmdc；用户重试整份文档时只重新渲染真正需要的图。
+按代码内容哈希缓存，与用户无关；代码修改后哈希变化，自然不受影响。
+
+只缓存由代码本身决定的失败（is_code_error：mmdc 输出 Mermaid 的解析 / 语法错误）；
+Chromium 启动失败、超时、资源不足等临时故障不缓存，下次请求照常重新渲染
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+# Mermaid 解析代码失败时 mmdc 输出的错误（jison 解析器、图表类型识别）
+_CODE_ERROR_PATTERN = re.compile(
+    r"Parse error on line|Lexical error on line|Syntax error in|No diagram type detected|UnknownDiagramError"
+)
+
+
+def is_code_error(stderr: str) -> bool:
+    """mmdc 的错误输出是否表示代码本身有误（同一段代码再次渲染必然失败）"""
+    return bool(_CODE_ERROR_PATTERN.search(stderr))
+
+
+class RenderFailureCache:
+    """
+    内容哈希 -> 失败原因的进程内 TTL 缓存
+
+    - 超出容量时淘汰最早写入的条目
+    - ttl_seconds 为 0 时禁用
+    """
+
+    def __init__(self, ttl_seconds: float = 120.0, max_entries: int = 1000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def get(self, content_hash: str) -> Optional[str]:
+        """失败原因，未记录或已过期返回 None"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(content_hash)
+            if entry is None:
+                return None
+            detail, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[content_hash]
+                return None
+            return detail
+
+    def set(self, content_hash: str, detail: str):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._entries.pop(content_hash, None)
+            self._entries[content_hash] = (detail, time.monotonic() + self.ttl_seconds)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# 全局实例
+render_failure_cache = RenderFailureCache(
+    ttl_seconds=float(os.getenv("MERMAID_FAILURE_CACHE_TTL", "120")),
+    max_entries=int(os.getenv("MERMAID_FAILURE_CACHE_SIZE", "1000")),
+)
@@ -0,0 +1,76 @@
+"""
+Mermaid 图片生成清单：一份章节数据（/mermaid-images 请求）对应的完整 imageMapping
+
+清单按请求中所有图表相关字段（章节名称、功能过程、场景、角色、子过程）的哈希保存，
+同一份数据再次请求时一次读取即可返回全部图片路径，不再逐张生成代码、计算哈希、检查文件。
+
+清单放在用户缓存目录下（cache/user_{id}/manifests），清理缓存时与图片一起删除；
+单张图片被删除的情况由调用方在返回之后检查（validate），发现缺失时删除清单，下次请求重新生成
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from typing import Dict, List, Optional
+
+from .chapter_store import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# 图表代码或图片键的生成方式变化时递增，使旧清单失效
+MANIFEST_VERSION = 2
+
+
+def diagram_request_key(chapters: List[Dict]) -> str:
+    """请求哈希：只包含决定图表内容的字段（chapters 为 ChapterModel.model_dump() 的结果）"""
+    content = [
+        MANIFEST_VERSION,
+        [[chapter.get("name"), chapter.get("functions"),
+          [[feature.get("scenario"), feature.get("role"), feature.get("process")]
+           for feature in chapter.get("features") or []]]
+         for chapter in chapters],
+    ]
+    payload = json.dumps(content, ensure_ascii=False)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class RenderManifest:
+    """按用户保存 Mermaid 图片生成清单"""
+
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+
+    def _path(self, user_id: int, key: str) -> str:
+        return os.path.join(self.base_dir, f"user_{user_id}", "manifests", f"{key}.json")
+
+    def get(self, user_id: int, key: str) -> Optional[Dict[str, str]]:
+        try:
+            with open(self._path(user_id, key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("读取图片清单失败: %s", e, extra={"user_id": user_id})
+            return None
+
+    def put(self, user_id: int, key: str, image_mapping: Dict[str, str]):
+        write_json_atomic(self._path(user_id, key), image_mapping)
+
+    def invalidate(self, user_id: int, key: str):
+        try:
+            os.remove(self._path(user_id, key))
+        except FileNotFoundError:
+            pass
+
+    def validate(self, user_id: int, key: str, image_mapping: Dict[str, str]) -> bool:
+        """检查清单中的图片是否都还存在，有缺失时删除清单"""
+        if all(os.path.exists(path) for path in image_mapping.values()):
+            return True
+        logger.info("图片清单中的图片已被删除，清单失效", extra={"user_id": user_id, "manifest": key[:8]})
+        self.invalidate(user_id, key)
+        return False
+
+
+# 全局实例（与 Mermaid 图片缓存共用用户缓存目录）
+render_manifest = RenderManifest(os.path.join(tempfile.gettempdir(), "spec-desktop-backend", "cache"))
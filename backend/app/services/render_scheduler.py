@@ -0,0 +1,139 @@
+"""
+Mermaid 渲染调度：限制同时运行的 mmdc 进程数，并按优先级分配名额
+
+- interactive：单张图预览（/mermaid），有空闲名额时优先分配
+- bulk：整份文档的图片（/mermaid-images、批量接口），按用户轮流分配，
+  一个用户几百张图的批次不会让其他用户的批次一直排队
+- 正在排队的 bulk 渲染被 interactive 请求共享时（同一张图），提升为 interactive
+
+每个优先级的排队时间记录在 mermaid_queue_wait_seconds{priority=...}
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Optional
+
+from .metrics import mermaid_queue_wait_seconds
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, BULK)
+
+
+class RenderTicket:
+    """一次渲染的名额申请，用法：async with scheduler.ticket(priority, user_id): ..."""
+
+    def __init__(self, scheduler: "RenderScheduler", priority: str, user_id: Any):
+        if priority not in PRIORITIES:
+            raise ValueError(f"未知的渲染优先级: {priority}")
+        self.priority = priority
+        self.user_id = user_id
+        # 排队时间（秒），获得名额后设置
+        self.queue_wait = 0.0
+        self._scheduler = scheduler
+        self._waiter: Optional[asyncio.Future] = None
+
+    @property
+    def waiting(self) -> bool:
+        return self._waiter is not None and not self._waiter.done()
+
+    def promote(self):
+        """仍在排队时提升为 interactive"""
+        self._scheduler._promote(self)
+
+    async def __aenter__(self) -> "RenderTicket":
+        await self._scheduler._acquire(self)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._scheduler._release()
+
+
+class RenderScheduler:
+    """按优先级分配 mmdc 并发名额（只在一个事件循环中使用）"""
+
+    def __init__(self, max_concurrent: int):
+        self.max_concurrent = max_concurrent
+        self._active = 0
+        self._interactive: Deque[RenderTicket] = deque()
+        # 用户 -> 该用户排队中的 bulk 渲染；分配时取第一个用户，其仍有排队时移到末尾
+        self._bulk: "OrderedDict[Any, Deque[RenderTicket]]" = OrderedDict()
+
+    def ticket(self, priority: str, user_id: Any) -> RenderTicket:
+        return RenderTicket(self, priority, user_id)
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def queued(self, priority: str) -> int:
+        if priority == INTERACTIVE:
+            return len(self._interactive)
+        return sum(len(queue) for queue in self._bulk.values())
+
+    async def _acquire(self, ticket: RenderTicket):
+        start = time.perf_counter()
+        if self._active < self.max_concurrent and not self._interactive and not self._bulk:
+            self._active += 1
+        else:
+            ticket._waiter = asyncio.get_running_loop().create_future()
+            self._enqueue(ticket)
+            try:
+                await ticket._waiter
+            except asyncio.CancelledError:
+                if ticket._waiter.done() and not ticket._waiter.cancelled():
+                    # 名额已分配但任务随即被取消：转交给下一个
+                    self._release()
+                else:
+                    self._remove(ticket)
+                raise
+        ticket.queue_wait = time.perf_counter() - start
+        mermaid_queue_wait_seconds.observe(ticket.queue_wait, priority=ticket.priority)
+
+    def _release(self):
+        ticket = self._next()
+        if ticket is None:
+            self._active -= 1
+        else:
+            # 名额直接转交，_active 不变
+            ticket._waiter.set_result(None)
+
+    def _enqueue(self, ticket: RenderTicket):
+        if ticket.priority == INTERACTIVE:
+            self._interactive.append(ticket)
+        else:
+            self._bulk.setdefault(ticket.user_id, deque()).append(ticket)
+
+    def _remove(self, ticket: RenderTicket):
+        if ticket.priority == INTERACTIVE:
+            if ticket in self._interactive:
+                self._interactive.remove(ticket)
+            return
+        queue = self._bulk.get(ticket.user_id)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self._bulk[ticket.user_id]
+
+    def _promote(self, ticket: RenderTicket):
+        if ticket.priority == INTERACTIVE or not ticket.waiting:
+            return
+        self._remove(ticket)
+        ticket.priority = INTERACTIVE
+        self._interactive.append(ticket)
+
+    def _next(self) -> Optional[RenderTicket]:
+        while self._interactive:
+            ticket = self._interactive.popleft()
+            if ticket.waiting:
+                return ticket
+        while self._bulk:
+            user_id, queue = next(iter(self._bulk.items()))
+            ticket = queue.popleft()
+            if queue:
+                self._bulk.move_to_end(user_id)
+            else:
+                del self._bulk[user_id]
+            if ticket.waiting:
+                return ticket
+        return None
@@ -0,0 +1,147 @@
+"""
+JWT 验证结果缓存
+缓存已验证 Token 对应的用户快照，避免每个请求都查询数据库
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Set, Tuple
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """
+    当前登录用户的只读快照
+    字段与路由中使用到的 User 属性保持一致
+    """
+    id: int
+    username: str
+    real_name: str
+    is_admin: bool
+    is_active: bool
+
+    @classmethod
+    def from_user(cls, user) -> "UserSnapshot":
+        return cls(
+            id=user.id,
+            username=user.username,
+            real_name=user.real_name,
+            is_admin=bool(user.is_admin),
+            is_active=bool(user.is_active),
+        )
+
+
+class TokenCache:
+    """
+    Token -> 用户快照的进程内 TTL 缓存
+
+    - 条目过期时间取 TTL 与 Token 自身 exp 的较小值
+    - 超出容量时淘汰最久未使用的条目
+    - 用户被修改/删除/重置密码时按用户 ID 失效；失效同时递增该用户的版本号，
+      失效之前开始的查询（版本号已变化）不能再写入旧快照
+    """
+
+    def __init__(self, ttl_seconds: float = 30.0, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[UserSnapshot, float]]" = OrderedDict()
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+        # 用户 ID -> 版本号（invalidate_user 时递增，未失效过的用户为 0）
+        self._generations: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def get(self, token: str) -> Optional[UserSnapshot]:
+        """获取缓存的用户快照，未命中或已过期返回 None"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+
+            snapshot, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(token)
+                return None
+
+            self._entries.move_to_end(token)
+            return snapshot
+
+    def generation(self, user_id: int) -> int:
+        """用户当前的版本号，在查询数据库之前读取，查询结果交给 set() 时一并传入"""
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def set(self, token: str, snapshot: UserSnapshot, token_exp: Optional[float] = None,
+            generation: Optional[int] = None):
+        """
+        缓存用户快照
+
+        Args:
+            token: 原始 JWT 字符串
+            snapshot: 用户快照
+            token_exp: Token 的 exp（Unix 时间戳），用于限制缓存时间不超过 Token 有效期
+            generation: 查询快照之前读取的 generation(snapshot.id)；期间用户已失效时不缓存
+        """
+        if not self.enabled:
+            return
+
+        ttl = self.ttl_seconds
+        if token_exp is not None:
+            ttl = min(ttl, token_exp - time.time())
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            if generation is not None and generation != self._generations.get(snapshot.id, 0):
+                return
+            self._remove(token)
+            self._entries[token] = (snapshot, time.monotonic() + ttl)
+            self._tokens_by_user.setdefault(snapshot.id, set()).add(token)
+
+            while len(self._entries) > self.max_entries:
+                oldest_token = next(iter(self._entries))
+                self._remove(oldest_token)
+
+    def invalidate_user(self, user_id: int):
+        """使某个用户的所有缓存 Token 失效（用户被修改、删除或重置密码时调用）"""
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            for token in self._tokens_by_user.pop(user_id, set()):
+                self._entries.pop(token, None)
+
+    def clear(self):
+        # 版本号保留：清空前开始的查询同样不能写入失效前的快照
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, token: str):
+        """删除单个条目（调用方需持有锁）"""
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+
+        user_id = entry[0].id
+        tokens = self._tokens_by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user_id]
+
+
+# 全局实例
+token_cache = TokenCache(
+    ttl_seconds=float(os.getenv("AUTH_TOKEN_CACHE_TTL", "30")),
+    max_entries=int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000")),
+)
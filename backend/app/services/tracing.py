@@ -0,0 +1,397 @@
+"""
+请求级链路追踪
+轻量实现，数据模型与 OpenTelemetry Span 一致（traceId / spanId / parentSpanId / 属性 / 事件 / 状态），
+可导出到本地 JSON Lines 文件或控制台，用于定位一次文档生成的时间花在了哪一步
+
+- TracingMiddleware 为每个请求创建根 Span，并在响应头 X-Request-ID 中返回请求 ID（即 traceId）
+- 子 Span 通过 contextvars 自动关联父 Span；asyncio 任务会继承上下文，
+  线程池中执行时需使用 contextvars.copy_context().run
+- 同一个请求的 Span 在根 Span 结束时一次性导出；写文件在后台线程中进行，不阻塞事件循环
+- TRACING_EXPORTER=none（默认）时只生成请求 ID，不记录 Span
+"""
+import atexit
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import re
+import secrets
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from .metrics import route_template
+
+logger = logging.getLogger(__name__)
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# 客户端传入的请求 ID 只接受较短的安全字符，避免日志注入
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._\-]{1,64}$")
+_TRACE_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class Span:
+    """一个计时区间，字段命名与 OTLP JSON 保持一致"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_span_id", "kind", "start_time_unix_nano",
+                 "end_time_unix_nano", "attributes", "events", "status_code", "status_message", "_buffer")
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: Optional[str], kind: str,
+                 attributes: Optional[Dict[str, Any]], buffer: "_TraceBuffer"):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.kind = kind
+        self.start_time_unix_nano = time.time_ns()
+        self.end_time_unix_nano: Optional[int] = None
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.events: List[Dict[str, Any]] = []
+        self.status_code = "UNSET"
+        self.status_message = ""
+        self._buffer = buffer
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.events.append({"name": name, "timeUnixNano": time.time_ns(), "attributes": dict(attributes or {})})
+
+    def set_status(self, code: str, message: str = ""):
+        self.status_code = code
+        self.status_message = message
+
+    def record_exception(self, exc: BaseException):
+        self.add_event("exception", {"exception.type": type(exc).__name__, "exception.message": str(exc)})
+        self.set_status("ERROR", str(exc))
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        if self.end_time_unix_nano is None:
+            return None
+        return (self.end_time_unix_nano - self.start_time_unix_nano) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id or "",
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": self.start_time_unix_nano,
+            "endTimeUnixNano": self.end_time_unix_nano,
+            "durationMs": self.duration_ms,
+            "attributes": self.attributes,
+            "events": self.events,
+            "status": {"code": self.status_code, "message": self.status_message},
+        }
+
+
+class _NoopSpan:
+    """追踪关闭时使用，所有操作为空"""
+    trace_id = ""
+    span_id = ""
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def add_event(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        pass
+
+    def set_status(self, code: str, message: str = ""):
+        pass
+
+    def record_exception(self, exc: BaseException):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _TraceBuffer:
+    """收集同一个 trace 中已结束的 Span，根 Span 结束时统一导出"""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> bool:
+        """加入缓冲区；根 Span 已导出（例如线程中的任务晚于请求结束）时返回 False"""
+        with self._lock:
+            if self.closed:
+                return False
+            self.spans.append(span)
+            return True
+
+    def drain(self) -> List[Span]:
+        with self._lock:
+            self.closed = True
+            spans, self.spans = self.spans, []
+            return spans
+
+
+class ConsoleSpanExporter:
+    """每个 trace 输出一段缩进的耗时树到标准错误"""
+
+    def export(self, spans: List[Span]):
+        children: Dict[str, List[Span]] = {}
+        span_ids = {span.span_id for span in spans}
+        roots = []
+        for span in sorted(spans, key=lambda s: s.start_time_unix_nano):
+            if span.parent_span_id and span.parent_span_id in span_ids:
+                children.setdefault(span.parent_span_id, []).append(span)
+            else:
+                roots.append(span)
+
+        lines = []
+
+        def walk(span: Span, depth: int):
+            status = "" if span.status_code != "ERROR" else f" [ERROR: {span.status_message}]"
+            lines.append(f"{'  ' * depth}{span.name} {span.duration_ms:.1f}ms{status}")
+            for child in children.get(span.span_id, []):
+                walk(child, depth + 1)
+
+        for root in roots:
+            lines.append(f"trace {root.trace_id}")
+            walk(root, 1)
+        sys.stderr.write("\n".join(lines) + "\n")
+
+
+class JsonFileSpanExporter:
+    """
+    以 JSON Lines 追加写入本地文件，每行一个 Span
+
+    与日志相同（见 logging_setup）：export() 只把 Span 放入内存队列，
+    JSON 序列化和写文件在后台线程中完成，不阻塞事件循环；队列满时丢弃并计数（dropped），而不是阻塞调用方
+    """
+
+    def __init__(self, path: str, queue_size: int = 10000):
+        self.path = path
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[List[Dict[str, Any]]]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def export(self, spans: List[Span]):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait([span.to_dict() for span in spans])
+        except queue.Full:
+            self.dropped += len(spans)
+
+    def shutdown(self):
+        """写出队列中剩余的 Span 并停止后台线程（之后再导出时重新启动）"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            # 一次写出队列中已有的全部 trace
+            batches = [self._queue.get()]
+            while batches[-1] is not None:
+                try:
+                    batches.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batches[-1] is None
+            payload = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n"
+                              for batch in batches if batch is not None for record in batch)
+            if payload:
+                try:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(payload)
+                except OSError as e:
+                    logger.warning("追踪数据写入失败: %s", e)
+            if stop:
+                return
+
+
+class InMemorySpanExporter:
+    """保存在内存中（用于测试）"""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+
+    def export(self, spans: List[Span]):
+        self.spans.extend(spans)
+
+    def clear(self):
+        self.spans.clear()
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("tracing_current_span", default=None)
+_current_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("tracing_request_id", default=None)
+
+
+class Tracer:
+    """创建 Span 并在 trace 结束时交给导出器"""
+
+    def __init__(self, exporter=None, service_name: str = "spec-backend"):
+        self.exporter = exporter
+        self.service_name = service_name
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def shutdown(self):
+        """导出器有后台线程时（JsonFileSpanExporter）写出剩余数据并停止"""
+        shutdown = getattr(self.exporter, "shutdown", None)
+        if shutdown is not None:
+            shutdown()
+
+    @contextmanager
+    def start_span(self, name: str, attributes: Optional[Dict[str, Any]] = None, kind: str = "INTERNAL",
+                   trace_id: Optional[str] = None) -> Iterator[Any]:
+        """
+        开始一个 Span，作为当前 Span 的子 Span；代码块抛出异常时记录异常并标记为 ERROR
+        """
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+
+        parent = _current_span.get()
+        if parent is not None:
+            span = Span(name, parent.trace_id, parent.span_id, kind, attributes, parent._buffer)
+        else:
+            span = Span(name, trace_id or secrets.token_hex(16), None, kind, attributes, _TraceBuffer())
+            span.set_attribute("service.name", self.service_name)
+
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_time_unix_nano = time.time_ns()
+            self._finish(span, is_root=parent is None)
+
+    def _finish(self, span: Span, is_root: bool):
+        if not is_root:
+            if span._buffer.add(span):
+                return
+            spans = [span]
+        else:
+            span._buffer.add(span)
+            spans = span._buffer.drain()
+
+        try:
+            self.exporter.export(spans)
+        except Exception as e:  # noqa: BLE001 - 导出失败不影响业务
+            logger.warning("追踪数据导出失败: %s", e)
+
+
+def current_span():
+    """当前 Span（追踪关闭或不在 Span 内时返回空 Span）"""
+    return _current_span.get() or NOOP_SPAN
+
+
+def current_request_id() -> Optional[str]:
+    return _current_request_id.get()
+
+
+def traced(name: Optional[str] = None):
+    """装饰器：为同步函数创建 Span"""
+
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.start_span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class TracingMiddleware:
+    """
+    ASGI 中间件：为每个 HTTP 请求分配请求 ID 并创建根 Span
+
+    客户端传入合法的 X-Request-ID 时沿用；若它是 32 位十六进制则直接作为 traceId
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for key, value in scope.get("headers", []):
+            if key == b"x-request-id":
+                candidate = value.decode("latin-1")
+                if _REQUEST_ID_PATTERN.match(candidate):
+                    request_id = candidate
+                break
+
+        trace_id = request_id if request_id and _TRACE_ID_PATTERN.match(request_id) else secrets.token_hex(16)
+        request_id = request_id or trace_id
+        request_id_token = _current_request_id.set(request_id)
+        header_value = request_id.encode("latin-1")
+
+        method = scope.get("method", "")
+        with tracer.start_span(f"{method} {scope.get('path', '')}", kind="SERVER", trace_id=trace_id,
+                               attributes={"http.method": method, "http.target": scope.get("path", ""),
+                                           "request.id": request_id}) as span:
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (REQUEST_ID_HEADER.lower().encode("latin-1"), header_value)
+                    ]
+                    span.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.set_status("ERROR", f"HTTP {message['status']}")
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                if tracer.enabled:
+                    route = route_template(scope)
+                    span.name = f"{method} {route}"
+                    span.set_attribute("http.route", route)
+                _current_request_id.reset(request_id_token)
+
+
+def _create_exporter():
+    exporter_name = os.getenv("TRACING_EXPORTER", "none").lower()
+    if exporter_name == "console":
+        return ConsoleSpanExporter()
+    if exporter_name == "file":
+        default_path = os.path.join(tempfile.gettempdir(), "spec-desktop-backend", "traces.jsonl")
+        return JsonFileSpanExporter(os.getenv("TRACING_FILE", default_path))
+    return None
+
+
+# 全局实例
+tracer = Tracer(exporter=_create_exporter())
+atexit.register(tracer.shutdown)
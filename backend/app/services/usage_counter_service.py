@@ -0,0 +1,119 @@
+"""
+使用量计数服务
+生成流程中只在内存里累加，定期合并写入 usage_counters 表，避免每次生成都产生一次数据库写入；
+读取统计时把已落库的值与内存中的增量相加，不触发写入
+"""
+import asyncio
+import logging
+import os
+import threading
+from typing import Dict
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.usage_counter import UsageCounter
+
+logger = logging.getLogger(__name__)
+
+# 计数名称
+DOCUMENTS_GENERATED = "documents_generated"
+DIAGRAMS_RENDERED = "diagrams_rendered"
+AI_CALLS = "ai_calls"
+
+COUNTER_NAMES = (DOCUMENTS_GENERATED, DIAGRAMS_RENDERED, AI_CALLS)
+
+# 支持的数据库方言的 INSERT ... ON CONFLICT DO UPDATE
+_UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+class UsageCounterService:
+    """进程内累加 + 批量落库的计数器"""
+
+    def __init__(self, flush_interval_seconds: float = 30):
+        self.flush_interval_seconds = flush_interval_seconds
+        self._pending: Dict[str, int] = {}
+        # 正在写入数据库的增量（flush 进行中），读取时同样计入
+        self._flushing: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, amount: int = 1):
+        """累加计数（线程安全，可在线程池中调用）"""
+        if amount <= 0:
+            return
+        with self._lock:
+            self._pending[name] = self._pending.get(name, 0) + amount
+
+    def pending(self) -> Dict[str, int]:
+        """尚未写入数据库的增量"""
+        with self._lock:
+            return dict(self._pending)
+
+    async def flush(self, db: AsyncSession):
+        """
+        将内存中的增量写入数据库，写入失败时增量会被放回
+        每个计数一条 INSERT ... ON CONFLICT DO UPDATE，多个进程同时写入同一行时由数据库累加
+        """
+        with self._lock:
+            deltas, self._pending = self._pending, {}
+            for name, delta in deltas.items():
+                self._flushing[name] = self._flushing.get(name, 0) + delta
+        if not deltas:
+            return
+
+        insert = _UPSERT_INSERTS[db.get_bind().dialect.name]
+        statement = insert(UsageCounter)
+        statement = statement.on_conflict_do_update(
+            index_elements=[UsageCounter.name],
+            set_={"value": UsageCounter.value + statement.excluded.value, "updated_at": func.now()},
+        )
+        try:
+            await db.execute(statement, [{"name": name, "value": delta} for name, delta in deltas.items()])
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            self._finish_flush(deltas)
+            for name, delta in deltas.items():
+                self.increment(name, delta)
+            raise
+        self._finish_flush(deltas)
+
+    def _finish_flush(self, deltas: Dict[str, int]):
+        with self._lock:
+            for name, delta in deltas.items():
+                remaining = self._flushing.pop(name) - delta
+                if remaining:
+                    self._flushing[name] = remaining
+
+    async def read(self, db: AsyncSession) -> Dict[str, int]:
+        """读取所有计数：已落库的值加上内存中尚未写入的增量（只读，不写入数据库）"""
+        rows = (await db.execute(select(UsageCounter.name, UsageCounter.value))).all()
+        counters = {name: 0 for name in COUNTER_NAMES}
+        counters.update({row.name: row.value for row in rows})
+        with self._lock:
+            for deltas in (self._pending, self._flushing):
+                for name, delta in deltas.items():
+                    counters[name] = counters.get(name, 0) + delta
+        return counters
+
+    async def run_periodic_flush(self, session_factory):
+        """后台任务：每隔 flush_interval_seconds 写入一次，取消时做最后一次写入"""
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval_seconds)
+                try:
+                    async with session_factory() as db:
+                        await self.flush(db)
+                except Exception as e:
+                    logger.warning("使用量计数写入失败: %s", e)
+        finally:
+            if self.pending():
+                async with session_factory() as db:
+                    await self.flush(db)
+
+
+# 全局实例
+usage_counter_service = UsageCounterService(
+    flush_interval_seconds=float(os.getenv("USAGE_COUNTER_FLUSH_INTERVAL", "30"))
+)
@@ -0,0 +1,176 @@
+"""
+结构化日志配置
+- 每个模块使用 logging.getLogger(__name__)
+- 业务线程 / 事件循环只把日志记录放入内存队列（QueueHandler），
+  格式化和写 stdout 在后台线程（QueueListener）中完成，不阻塞事件循环
+- 默认输出 JSON Lines，自动附带请求 ID / traceId；LOG_FORMAT=text 时输出便于本地阅读的文本
+- 高频日志（如图片缓存命中）可通过 extra={"sample_every": N} 每 N 条只保留 1 条
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# LogRecord 自带的属性，其余通过 extra 传入的字段会原样输出到 JSON
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "request_id", "trace_id", "span_id", "sample_every", "sampled",
+}
+
+
+class ContextFilter(logging.Filter):
+    """在产生日志的线程中附加请求 ID / traceId / spanId（contextvars 无法跨线程读取）"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # 延迟导入，避免 tracing -> metrics 等模块在日志初始化前被加载
+        from app.services.tracing import current_request_id, current_span
+
+        record.request_id = current_request_id()
+        span = current_span()
+        record.trace_id = span.trace_id or None
+        record.span_id = span.span_id or None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    按 (logger, 消息模板) 计数，带 sample_every=N 的日志每 N 条只保留第 1 条，
+    保留的记录带上 sampled=N，便于还原真实数量；WARNING 及以上级别不采样
+    """
+
+    def __init__(self, max_keys: int = 10000):
+        super().__init__()
+        self.max_keys = max_keys
+        self._counters: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        every = getattr(record, "sample_every", None)
+        if not every or every <= 1 or record.levelno >= logging.WARNING:
+            return True
+
+        key = (record.name, str(record.msg))
+        with self._lock:
+            if key not in self._counters and len(self._counters) >= self.max_keys:
+                self._counters.clear()
+            count = self._counters.get(key, 0)
+            self._counters[key] = count + 1
+
+        if count % every != 0:
+            return False
+        record.sampled = every
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出一行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in ("request_id", "trace_id", "span_id", "sampled"):
+            value = getattr(record, key, None)
+            if value:
+                payload[key] = value
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc_info"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """本地开发用的文本格式，附带请求 ID"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s%(request_suffix)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        request_id = getattr(record, "request_id", None)
+        record.request_suffix = f" [{request_id}]" if request_id else ""
+        return super().format(record)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    只做最少的工作后入队：合并消息参数、预先格式化异常堆栈（traceback 对象不能跨线程安全持有），
+    JSON 序列化留给后台线程；队列满时丢弃并计数，而不是阻塞调用方
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.stack_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(level: Optional[str] = None, fmt: Optional[str] = None, stream=None) -> logging.Handler:
+    """
+    配置根 logger：QueueHandler（调用方） -> QueueListener 后台线程 -> stdout
+    重复调用会先停止之前的后台线程
+    """
+    global _listener
+
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT", "json")).lower()
+    queue_size = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+    shutdown_logging()
+
+    output_handler = logging.StreamHandler(stream or sys.stdout)
+    output_handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+    queue_handler.addFilter(SamplingFilter())
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, NonBlockingQueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, output_handler, respect_handler_level=True)
+    _listener.start()
+    return queue_handler
+
+
+def shutdown_logging():
+    """停止后台线程，并写出队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
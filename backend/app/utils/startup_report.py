@@ -0,0 +1,111 @@
+"""
+启动耗时统计
+
+- startup_report 记录 app.main 中各阶段（日志配置、路由导入、数据库初始化等）的耗时，
+  应用可以处理请求时以一条 INFO 日志输出
+- python -m app.utils.startup_report 用 -X importtime 统计导入 app.main 时每个模块的耗时，
+  按累计耗时排序输出，用于找出拖慢冷启动的依赖
+"""
+import logging
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# -X importtime 的输出格式: "import time:  self [us] | cumulative | imported package"
+_IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+class StartupReport:
+    """记录启动各阶段耗时，起点为本模块被导入的时刻"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.steps: List[Tuple[str, float]] = []
+        self.ready_seconds: Optional[float] = None
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - start))
+
+    def ready(self):
+        """应用可以处理请求时调用，输出启动报告"""
+        self.ready_seconds = time.perf_counter() - self.started
+        logger.info("启动完成，耗时 %.0fms", self.ready_seconds * 1000, extra={"startup": self.as_dict()})
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "total_ms": round(self.ready_seconds * 1000, 1) if self.ready_seconds is not None else None,
+            "steps_ms": {name: round(seconds * 1000, 1) for name, seconds in self.steps},
+        }
+
+
+def import_times(module: str = "app.main") -> List[Dict[str, object]]:
+    """
+    在子进程中导入 module，返回每个被导入模块的耗时（微秒）
+
+    Returns:
+        [{"module": "pandas", "self_us": 648, "cumulative_us": 312473, "depth": 2}, ...]
+    """
+    import subprocess
+
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{completed.stderr[-2000:]}")
+
+    result = []
+    for line in completed.stderr.splitlines():
+        match = _IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            result.append({
+                "module": name,
+                "self_us": int(self_us),
+                "cumulative_us": int(cumulative_us),
+                # 每层嵌套缩进两个空格，顶层为 1 个空格
+                "depth": (len(indent) - 1) // 2,
+            })
+    return result
+
+
+# 全局实例（由 app.main 最先导入）
+startup_report = StartupReport()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="统计导入各模块的耗时")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--top", type=int, default=30)
+    parser.add_argument("--max-depth", type=int, help="只显示嵌套深度不超过该值的模块（0 为顶层）")
+    args = parser.parse_args()
+
+    rows = import_times(args.module)
+    total = next((row["cumulative_us"] for row in rows if row["module"] == args.module), None)
+    if args.max_depth is not None:
+        rows = [row for row in rows if row["depth"] <= args.max_depth]
+    rows.sort(key=lambda row: row["cumulative_us"], reverse=True)
+
+    if total is not None:
+        print(f"导入 {args.module} 共耗时 {total / 1000:.1f}ms")
+    print(f"{'累计(ms)':>10}{'自身(ms)':>10}  模块")
+    for row in rows[:args.top]:
+        print(f"{row['cumulative_us'] / 1000:>10.1f}{row['self_us'] / 1000:>10.1f}  {row['module']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+认证开销基准测试
+对比 get_current_user 在禁用 / 启用 Token 缓存时的单次请求耗时
+
+使用方式:
+    uv run python -m benchmarks.bench_auth --iterations 5000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base, create_async_db_engine
+from app.models.user import User
+from app.services.auth_service import AuthService, get_current_user
+from app.services.token_cache import token_cache
+
+
+def _setup_database(db_path: str):
+    database_url = f"sqlite:///{db_path}"
+    engine = create_engine(database_url, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    db = session_factory()
+    user = User(username="bench", hashed_password="x", real_name="基准测试", is_admin=False, is_active=True)
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    token = AuthService(db).create_access_token(user)
+    db.close()
+    engine.dispose()
+
+    return database_url, token
+
+
+async def _measure(database_url: str, token: str, iterations: int) -> list:
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    async_engine = create_async_db_engine(database_url)
+    session_factory = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    samples = []
+
+    try:
+        for _ in range(iterations):
+            start = time.perf_counter()
+            # 与 get_async_db 依赖一致：每个请求一个会话
+            async with session_factory() as db:
+                await get_current_user(credentials, db)
+            samples.append(time.perf_counter() - start)
+    finally:
+        await async_engine.dispose()
+
+    return samples
+
+
+def _summary(samples: list) -> dict:
+    ordered = sorted(samples)
+    return {
+        "mean_us": statistics.mean(ordered) * 1e6,
+        "p50_us": ordered[len(ordered) // 2] * 1e6,
+        "p99_us": ordered[int(len(ordered) * 0.99) - 1] * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="认证开销基准测试")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_url, token = _setup_database(os.path.join(tmp_dir, "bench.db"))
+
+        original_ttl = token_cache.ttl_seconds
+        try:
+            token_cache.ttl_seconds = 0
+            token_cache.clear()
+            before = _summary(asyncio.run(_measure(database_url, token, args.iterations)))
+
+            token_cache.ttl_seconds = 30
+            token_cache.clear()
+            after = _summary(asyncio.run(_measure(database_url, token, args.iterations)))
+        finally:
+            token_cache.ttl_seconds = original_ttl
+            token_cache.clear()
+
+    print(f"{'模式':<12}{'mean(us)':>12}{'p50(us)':>12}{'p99(us)':>12}")
+    for label, result in (("无缓存", before), ("Token 缓存", after)):
+        print(f"{label:<12}{result['mean_us']:>12.1f}{result['p50_us']:>12.1f}{result['p99_us']:>12.1f}")
+    print(f"平均加速: {before['mean_us'] / after['mean_us']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Word 生成基准测试，对比三种写法：
+    serial        DocxWriter 逐章生成（python-docx）
+    parallel_N    N 个进程并行生成章节片段后按顺序合并（DocxBuildPool）
+    ooxml         OoxmlWriter 直接输出 WordprocessingML
+
+章节来自合成的「功能点拆分表」（REALISTIC_SHAPE），每个结构图 / 流程图是一张内容不同的小 PNG，
+与真实文档一样每张图都是独立的图片部件。每个规模先校验各写法生成的文档与 serial 一致，再计时。
+并行方式的耗时包含进程池启动之外的全部开销（子进程通信、片段解析、图片关系重映射）。
+
+--memory 时每种写法在单独的子进程中生成一次，报告生成过程中峰值 RSS 的增长
+（parallel 只统计主进程，不含工作进程）。
+
+使用方式:
+    uv run python -m benchmarks.bench_docx --chapters 100,500,1000 --workers 2,4 --repeat 3
+    uv run python -m benchmarks.bench_docx --chapters 1000 --workers 0 --memory
+"""
+import argparse
+import json
+import os
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from typing import Callable, Dict, List, Optional
+
+from app.services.document_service import DocumentService
+from app.services.docx_build_pool import DocxBuildPool
+from app.services.docx_writer import DocxWriter
+from app.services.ooxml_writer import OoxmlWriter
+from benchmarks.fakes import STUB_PNG
+from benchmarks.workbook_generator import REALISTIC_SHAPE, WorkbookShape, generate_workbook
+
+
+def make_chapters(count: int, image_dir: str, seed: int) -> List[Dict]:
+    """生成 count 个章节，并为每张图写入一个不同的 PNG（IEND 之后追加序号，内容哈希不同）"""
+    workbook = generate_workbook(WorkbookShape(features=count, **REALISTIC_SHAPE), seed=seed)
+    chapters = []
+    for name, data in workbook.expected.items():
+        chapter = DocumentService._build_chapter(name, data, f"{name}的功能概述。" * 8)
+        chapters.append(chapter)
+
+    def image(n: int) -> str:
+        path = os.path.join(image_dir, f"{n}.png")
+        with open(path, "wb") as f:
+            f.write(STUB_PNG + str(n).encode())
+        return path
+
+    n = 0
+    for chapter in chapters:
+        chapter["structure_image"] = image(n)
+        n += 1
+        for feature in chapter["features"]:
+            feature["flow_chart"] = image(n)
+            n += 1
+    return chapters
+
+
+def build_serial(chapters: List[Dict], path: str) -> str:
+    writer = DocxWriter(path)
+    writer.add_title("软件需求说明书")
+    for chapter in chapters:
+        writer.add_chapter(chapter)
+    return writer.save()
+
+
+def build_parallel(pool: DocxBuildPool, chapters: List[Dict], path: str) -> str:
+    writer = DocxWriter(path)
+    writer.add_title("软件需求说明书")
+    for fragment in pool.build_fragments(chapters):
+        writer.add_fragment(fragment)
+    return writer.save()
+
+
+def build_ooxml(chapters: List[Dict], path: str) -> str:
+    writer = OoxmlWriter(path)
+    writer.add_title("软件需求说明书")
+    for chapter in chapters:
+        writer.add_chapter(chapter)
+    return writer.save()
+
+
+def package_parts(path: str) -> Dict[str, bytes]:
+    with zipfile.ZipFile(path) as archive:
+        parts = {name: archive.read(name) for name in archive.namelist()}
+    # rsid 等随机属性不参与比较
+    parts["word/document.xml"] = re.sub(rb' w:rsid\w*="[^"]*"', b"", parts["word/document.xml"])
+    return parts
+
+
+def measure(func, repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _builders(pools: Dict[int, DocxBuildPool]) -> Dict[str, Callable[[List[Dict], str], str]]:
+    builders = {"serial": build_serial, "ooxml": build_ooxml}
+    for workers, pool in pools.items():
+        builders[f"parallel_{workers}"] = lambda chapters, path, pool=pool: build_parallel(pool, chapters, path)
+    return builders
+
+
+def _peak_rss_kb() -> int:
+    # Linux 上 ru_maxrss 会从父进程继承（fork 后 exec 不重置），优先读取 VmHWM
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 上单位为字节
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def measure_memory(mode: str, count: int, seed: int) -> Dict[str, float]:
+    """在当前进程中生成一次（由 --child 子进程调用），返回耗时和峰值 RSS 增长"""
+    workers = int(mode.split("_")[1]) if mode.startswith("parallel_") else 0
+    pools = {workers: DocxBuildPool(max_workers=workers, min_chapters=1)} if workers else {}
+    build = _builders(pools)[mode]
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # 预热：导入 python-docx、生成 ooxml 模板、启动工作进程，不计入增长
+            warmup = make_chapters(max(workers, 1), tmp_dir, seed)
+            build(warmup, os.path.join(tmp_dir, "warmup.docx"))
+            chapters = make_chapters(count, tmp_dir, seed)
+
+            before = _peak_rss_kb()
+            start = time.perf_counter()
+            path = build(chapters, os.path.join(tmp_dir, "out.docx"))
+            elapsed = time.perf_counter() - start
+            return {"seconds": elapsed, "peak_rss_growth_mb": (_peak_rss_kb() - before) / 1024,
+                    "docx_bytes": os.path.getsize(path)}
+    finally:
+        for pool in pools.values():
+            pool.shutdown()
+
+
+def run_memory(modes: List[str], counts: List[int], seed: int) -> List[dict]:
+    results = []
+    print(f"\n{'mode':<14}{'chapters':>10}{'time(ms)':>12}{'峰值 RSS 增长(MB)':>20}")
+    for count in counts:
+        for mode in modes:
+            completed = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_docx", "--child", mode,
+                 "--chapters", str(count), "--seed", str(seed)],
+                capture_output=True, text=True, check=True,
+            )
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            results.append({"mode": mode, "chapters": count, **result})
+            print(f"{mode:<14}{count:>10}{result['seconds'] * 1000:>12.1f}{result['peak_rss_growth_mb']:>20.1f}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Word 生成方式对比")
+    parser.add_argument("--chapters", default="100,500,1000", help="章节数，逗号分隔")
+    parser.add_argument("--workers", default="2,4", help="并行进程数，逗号分隔；0 表示不测并行")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--memory", action="store_true", help="同时在子进程中测量峰值内存")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="结果 JSON 路径")
+    args = parser.parse_args()
+
+    counts = [int(value) for value in args.chapters.split(",") if value.strip()]
+    if args.child:
+        print(json.dumps(measure_memory(args.child, counts[0], args.seed)))
+        return
+
+    worker_counts = [int(value) for value in args.workers.split(",") if value.strip() and int(value) > 0]
+    results: List[dict] = []
+
+    print(f"CPU: {os.cpu_count()}")
+    print(f"{'mode':<14}{'chapters':>10}{'median(ms)':>14}{'min(ms)':>12}{'speedup':>10}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pools = {workers: DocxBuildPool(max_workers=workers, min_chapters=1) for workers in worker_counts}
+        builders = _builders(pools)
+        try:
+            # 预热：启动子进程并导入 python-docx，不计入耗时
+            for pool in pools.values():
+                pool.build_fragments([{"name": "预热", "features": []}] * pool.max_workers)
+
+            for count in counts:
+                image_dir = os.path.join(tmp_dir, f"images_{count}")
+                os.makedirs(image_dir)
+                chapters = make_chapters(count, image_dir, args.seed)
+                expected = package_parts(build_serial(chapters, os.path.join(tmp_dir, "expected.docx")))
+
+                serial_median: Optional[float] = None
+                for mode, build in builders.items():
+                    path = os.path.join(tmp_dir, f"{mode}_{count}.docx")
+                    if package_parts(build(chapters, path)) != expected:
+                        raise RuntimeError(f"{mode} 生成的文档与 serial 不一致（{count} 章）")
+                    samples = measure(lambda: build(chapters, path), args.repeat)
+                    median = statistics.median(samples)
+                    serial_median = serial_median or median
+                    results.append({"mode": mode, "chapters": count, "median_s": median, "min_s": min(samples),
+                                    "speedup": serial_median / median, "docx_bytes": os.path.getsize(path)})
+                    print(f"{mode:<14}{count:>10}{median * 1000:>14.1f}"
+                          f"{min(samples) * 1000:>12.1f}{serial_median / median:>10.2f}")
+        finally:
+            for pool in pools.values():
+                pool.shutdown()
+
+    memory = run_memory(list(builders), counts, args.seed) if args.memory else []
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"cpu_count": os.cpu_count(), "results": results, "memory": memory},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
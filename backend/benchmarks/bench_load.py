@@ -0,0 +1,343 @@
+"""
+HTTP 压测：多个虚拟用户按真实比例调用文档生成接口，评估单个后端实例能承载的并发用户数
+
+每个虚拟用户先登录，然后循环执行「会话」：
+    上传工作簿 -> process-excel -> mermaid-images（--mix 次）-> generate-word（--mix 次）
+会话之间有随机思考时间。--mix 中的小数表示概率，例如 mermaid-images=1.5 表示每个会话
+调用 1 次，另有 50% 概率再调用 1 次（第二次通常命中图片缓存）
+
+默认在子进程中启动 uvicorn，使用临时 SQLite 数据库、临时 TMPDIR、假 OpenAI 服务和假 mmdc，
+不依赖任何外部服务；也可以用 --target 压测已经启动的实例（需自行准备 load1..loadN 用户）
+
+输出每个接口的请求数、错误数、吞吐量和 p50 / p95 / p99 延迟
+
+使用方式:
+    uv run python -m benchmarks.bench_load --users 20 --duration 60
+    uv run python -m benchmarks.bench_load --users 50 --workers 4 --ai-latency 1.0 --mmdc-latency 0.8
+    uv run python -m benchmarks.bench_load --target http://10.0.0.5:8000 --users 10 --password secret
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.fakes import FakeOpenAIServer, stub_mmdc
+from benchmarks.workbook_generator import REALISTIC_SHAPE, write_workbook
+
+ENDPOINTS = ("login", "upload", "process-excel", "mermaid-images", "generate-word")
+DEFAULT_MIX = "mermaid-images=1.5,generate-word=1.2"
+USERNAME_PATTERN = "load{n}"
+DEFAULT_PASSWORD = "load-password"
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def _parse_mix(text: str) -> Dict[str, float]:
+    mix = {"mermaid-images": 1.0, "generate-word": 1.0}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        name, _, value = item.partition("=")
+        if name not in mix:
+            raise SystemExit(f"--mix 只支持 {', '.join(mix)}，收到 {name}")
+        mix[name] = float(value)
+    return mix
+
+
+def _times(rng: random.Random, ratio: float) -> int:
+    """ratio 的整数部分必定执行，小数部分按概率再执行一次"""
+    whole = int(ratio)
+    return whole + (1 if rng.random() < ratio - whole else 0)
+
+
+class Stats:
+    """按接口记录延迟和错误"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {name: [] for name in ENDPOINTS}
+        self.errors: Dict[str, Dict[str, int]] = {name: {} for name in ENDPOINTS}
+        self.sessions = 0
+
+    def record(self, endpoint: str, elapsed: float, error: Optional[str] = None):
+        if error is None:
+            self.latencies[endpoint].append(elapsed)
+        else:
+            self.errors[endpoint][error] = self.errors[endpoint].get(error, 0) + 1
+
+    def summary(self, elapsed: float) -> List[dict]:
+        rows = []
+        for endpoint in ENDPOINTS:
+            samples = self.latencies[endpoint]
+            errors = sum(self.errors[endpoint].values())
+            row = {"endpoint": endpoint, "ok": len(samples), "errors": errors,
+                   "error_kinds": self.errors[endpoint], "throughput_rps": len(samples) / elapsed}
+            if samples:
+                row.update({
+                    "p50_ms": _percentile(samples, 0.50) * 1000,
+                    "p95_ms": _percentile(samples, 0.95) * 1000,
+                    "p99_ms": _percentile(samples, 0.99) * 1000,
+                    "max_ms": max(samples) * 1000,
+                })
+            rows.append(row)
+        return rows
+
+
+class VirtualUser:
+    def __init__(self, index: int, client: httpx.AsyncClient, args, workbooks: List[str], stats: Stats):
+        self.username = USERNAME_PATTERN.format(n=index)
+        self.client = client
+        self.args = args
+        self.workbooks = workbooks
+        self.stats = stats
+        self.rng = random.Random(args.seed * 1000 + index)
+        self.headers: Dict[str, str] = {}
+
+    async def call(self, endpoint: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        """发送请求并记录耗时；429 / 503 按 Retry-After 重试（重试等待计入延迟）"""
+        start = time.perf_counter()
+        for _ in range(5):
+            try:
+                response = await self.client.request(method, url, headers=self.headers, **kwargs)
+            except httpx.HTTPError as e:
+                self.stats.record(endpoint, time.perf_counter() - start, type(e).__name__)
+                return None
+            if response.status_code in (429, 503):
+                await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+                continue
+            break
+        elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            self.stats.record(endpoint, elapsed, f"HTTP {response.status_code}")
+            return None
+        self.stats.record(endpoint, elapsed)
+        return response
+
+    async def login(self) -> bool:
+        response = await self.call("login", "POST", "/api/auth/login",
+                                   json={"username": self.username, "password": self.args.password})
+        if response is None:
+            return False
+        self.headers = {"Authorization": f"Bearer {response.json()['data']['accessToken']}"}
+        return True
+
+    async def session(self, mix: Dict[str, float]):
+        workbook = self.rng.choice(self.workbooks)
+        with open(workbook, "rb") as f:
+            content = f.read()
+        response = await self.call("upload", "POST", "/api/upload/excel",
+                                   files={"file": (os.path.basename(workbook), content, XLSX_MIME)})
+        if response is None:
+            return
+        file_path = response.json()["data"]["file_path"]
+
+        response = await self.call("process-excel", "POST", "/api/generate/process-excel",
+                                   json={"file_path": file_path})
+        if response is None:
+            return
+        chapters = response.json()["data"]["chapters"]
+
+        image_mapping: Dict[str, str] = {}
+        for _ in range(max(1, _times(self.rng, mix["mermaid-images"]))):
+            response = await self.call("mermaid-images", "POST", "/api/generate/mermaid-images",
+                                       json={"chapters": chapters})
+            if response is None:
+                return
+            image_mapping = response.json()["data"]["imageMapping"]
+
+        for _ in range(_times(self.rng, mix["generate-word"])):
+            await self.call("generate-word", "POST", "/api/generate/generate-word",
+                            json={"chapters": chapters, "image_mapping": image_mapping,
+                                  "output_filename": f"{self.username}.docx"})
+        self.stats.sessions += 1
+
+    async def run(self, deadline: float, mix: Dict[str, float]):
+        if not await self.login():
+            return
+        while time.perf_counter() < deadline:
+            await self.session(mix)
+            # 思考时间服从指数分布，均值为 --think
+            if self.args.think > 0:
+                await asyncio.sleep(min(self.rng.expovariate(1 / self.args.think), max(0.0, deadline - time.perf_counter())))
+
+
+async def run_load(base_url: str, args, workbooks: List[str]) -> dict:
+    stats = Stats()
+    mix = _parse_mix(args.mix)
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+    timeout = httpx.Timeout(args.request_timeout)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        start = time.perf_counter()
+        deadline = start + args.duration
+        tasks = []
+        for index in range(1, args.users + 1):
+            user = VirtualUser(index, client, args, workbooks, stats)
+            tasks.append(asyncio.create_task(user.run(deadline, mix)))
+            # 在 --ramp-up 秒内均匀启动虚拟用户
+            if args.ramp_up > 0 and index < args.users:
+                await asyncio.sleep(args.ramp_up / args.users)
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+    return {"elapsed_s": elapsed, "sessions": stats.sessions, "endpoints": stats.summary(elapsed)}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _seed_users(database_url: str, users: int, password: str):
+    # 延迟导入：--target 模式不需要加载应用
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    from app.database import Base
+    from app.models.user import User
+    from app.services.password_hasher import hash_password
+
+    engine = create_engine(database_url)
+    Base.metadata.create_all(bind=engine)
+    hashed = hash_password(password)
+    with Session(engine) as db:
+        db.add_all(User(username=USERNAME_PATTERN.format(n=n), hashed_password=hashed, real_name=f"压测{n}",
+                        is_active=True) for n in range(1, users + 1))
+        db.commit()
+    engine.dispose()
+
+
+def _start_server(args, tmp_dir: str, ai_base_url: str, port: int) -> subprocess.Popen:
+    server_tmp = os.path.join(tmp_dir, "tmp")
+    os.makedirs(server_tmp, exist_ok=True)
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(tmp_dir, 'load.db')}",
+        # 上传目录和图片缓存都基于 tempfile.gettempdir()，与本机真实用户数据隔离
+        "TMPDIR": server_tmp,
+        "AI_BASE_URL": ai_base_url,
+        "AI_API_KEY": "load-test",
+        "AI_MODEL": "fake-model",
+        # 所有虚拟用户来自同一个 IP，关闭 IP 限流；登录排队超时放宽，避免启动阶段集中登录被拒绝
+        "AUTH_LOGIN_IP_LIMIT": "0",
+        "AUTH_VERIFY_QUEUE_TIMEOUT": "60",
+        "LOG_LEVEL": args.server_log_level,
+    })
+    command = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(args.workers), "--log-level", "warning"]
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+
+
+async def _wait_healthy(base_url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.perf_counter() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn 启动失败，退出码 {process.returncode}")
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("等待 uvicorn 启动超时")
+
+
+def _print_report(report: dict):
+    print(f"\n{report['users']} 个虚拟用户，{report['elapsed_s']:.1f}s，完成 {report['sessions']} 个会话"
+          f"（{report['sessions'] / report['elapsed_s'] * 60:.1f} 会话/分钟）")
+    print(f"{'endpoint':<16}{'ok':>7}{'errors':>8}{'req/s':>9}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}")
+    for row in report["endpoints"]:
+        if not row["ok"] and not row["errors"]:
+            continue
+        latencies = "".join(f"{row.get(key, float('nan')):>10.1f}" for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms"))
+        print(f"{row['endpoint']:<16}{row['ok']:>7}{row['errors']:>8}{row['throughput_rps']:>9.2f}{latencies}")
+        for kind, count in row["error_kinds"].items():
+            print(f"    {kind}: {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP 压测")
+    parser.add_argument("--users", type=int, default=10, help="虚拟用户数")
+    parser.add_argument("--duration", type=float, default=60, help="压测时长（秒）")
+    parser.add_argument("--ramp-up", type=float, default=5, help="在该时间内逐步启动虚拟用户（秒）")
+    parser.add_argument("--think", type=float, default=1.0, help="会话之间的平均思考时间（秒）")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="每个会话的 mermaid-images / generate-word 调用次数")
+    parser.add_argument("--rows", type=int, default=200, help="上传工作簿的行数")
+    parser.add_argument("--workbooks", type=int, default=8, help="不同工作簿的数量（越少图片缓存命中越多）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--request-timeout", type=float, default=300)
+    parser.add_argument("--target", help="压测已启动的实例，例如 http://127.0.0.1:8000")
+    parser.add_argument("--password", default=DEFAULT_PASSWORD, help="虚拟用户 load1..loadN 的密码")
+    parser.add_argument("--workers", type=int, default=1, help="本地启动 uvicorn 的进程数")
+    parser.add_argument("--ai-latency", type=float, default=0.5, help="假 OpenAI 服务的响应延迟（秒）")
+    parser.add_argument("--mmdc-latency", type=float, default=0.5, help="假 mmdc 的渲染延迟（秒）")
+    parser.add_argument("--server-log-level", default="WARNING")
+    parser.add_argument("--output", help="结果 JSON 路径")
+    args = parser.parse_args()
+
+    with ExitStack() as stack:
+        tmp_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix="bench-load-"))
+        workbook_dir = os.path.join(tmp_dir, "workbooks")
+        os.makedirs(workbook_dir)
+        workbooks = [
+            write_workbook(os.path.join(workbook_dir, f"load_{i}.xlsx"), args.rows, seed=args.seed + i, **REALISTIC_SHAPE)
+            for i in range(args.workbooks)
+        ]
+
+        process = None
+        if args.target:
+            base_url = args.target.rstrip("/")
+        else:
+            fake_ai = stack.enter_context(FakeOpenAIServer(latency=args.ai_latency, jitter=args.ai_latency * 0.2,
+                                                           seed=args.seed))
+            # 假 mmdc 通过 PATH 传给 uvicorn 子进程
+            stack.enter_context(stub_mmdc(latency=args.mmdc_latency))
+            _seed_users(f"sqlite:///{os.path.join(tmp_dir, 'load.db')}", args.users, args.password)
+            port = _free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            process = _start_server(args, tmp_dir, fake_ai.base_url, port)
+
+        try:
+            if process is not None:
+                asyncio.run(_wait_healthy(base_url, process))
+            print(f"压测 {base_url}：{args.users} 个用户，{args.duration:.0f}s")
+            report = asyncio.run(run_load(base_url, args, workbooks))
+        finally:
+            if process is not None:
+                process.terminate()
+                try:
+                    process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    report.update({
+        "users": args.users,
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "target": args.target or "local",
+            "params": {k: v for k, v in vars(args).items() if k not in ("password", "output")},
+        },
+    })
+    _print_report(report)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
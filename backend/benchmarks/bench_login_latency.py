@@ -0,0 +1,134 @@
+"""
+并发登录时 /health 延迟测试
+模拟早高峰集中登录，测量事件循环上其他请求的 p50 / p99 延迟
+
+对比两种模式：
+    inline - bcrypt 在事件循环线程内同步执行（改造前的行为）
+    pool   - bcrypt 在密码哈希进程池中执行
+
+使用方式:
+    uv run python -m benchmarks.bench_login_latency --logins 40 --concurrency 20
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base, create_async_db_engine, get_async_db
+from app.main import app
+from app.models.user import User
+from app.services.login_throttle import login_throttle
+from app.services.password_hasher import hash_password, password_hasher
+
+USERNAME = "bench"
+PASSWORD = "bench-password"
+
+
+def _percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def _run_scenario(logins: int, concurrency: int, probe_interval: float) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        semaphore = asyncio.Semaphore(concurrency)
+        done = asyncio.Event()
+        health_latencies = []
+
+        async def login_once():
+            async with semaphore:
+                response = await client.post("/api/auth/login", json={"username": USERNAME, "password": PASSWORD})
+                response.raise_for_status()
+
+        async def probe_health():
+            # 延迟从计划发出时刻算起，事件循环被阻塞的时间也会计入
+            while not done.is_set():
+                due = time.perf_counter() + probe_interval
+                await asyncio.sleep(probe_interval)
+                await client.get("/health")
+                health_latencies.append(time.perf_counter() - due)
+
+        prober = asyncio.create_task(probe_health())
+        start = time.perf_counter()
+        await asyncio.gather(*(login_once() for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await prober
+
+    return {
+        "logins_per_second": logins / elapsed,
+        "health_samples": len(health_latencies),
+        "health_p50_ms": _percentile(health_latencies, 0.50) * 1000,
+        "health_p99_ms": _percentile(health_latencies, 0.99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发登录时 /health 延迟测试")
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--probe-interval", type=float, default=0.005)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_url = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+        engine = create_engine(database_url, connect_args={"check_same_thread": False})
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        db = session_factory()
+        db.add(User(username=USERNAME, hashed_password=hash_password(PASSWORD), real_name="基准测试", is_active=True))
+        db.commit()
+        db.close()
+        engine.dispose()
+
+        async_engine = None
+
+        async def override_get_async_db():
+            # 异步引擎需要在 asyncio.run 创建的事件循环内使用，每个场景结束后释放
+            async with async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)() as session:
+                yield session
+
+        app.dependency_overrides[get_async_db] = override_get_async_db
+        # 所有请求来自同一 IP，测试期间关闭登录限流，只保留并发校验名额
+        login_throttle.ip_limiter.limit = 0
+        login_throttle.verify_queue_timeout = 60
+        original_workers = password_hasher.max_workers
+        results = {}
+        try:
+            for mode, workers in (("inline", 0), ("pool", original_workers or 2)):
+                password_hasher.max_workers = workers
+                async_engine = create_async_db_engine(database_url)
+
+                async def scenario():
+                    # 先创建并预热进程池，子进程启动开销不计入登录耗时
+                    if workers > 0:
+                        await password_hasher.hash("warmup")
+                    try:
+                        return await _run_scenario(args.logins, args.concurrency, args.probe_interval)
+                    finally:
+                        await async_engine.dispose()
+
+                results[mode] = asyncio.run(scenario())
+        finally:
+            password_hasher.shutdown()
+            password_hasher.max_workers = original_workers
+            app.dependency_overrides.pop(get_async_db, None)
+
+    print(f"{'模式':<8}{'登录/秒':>10}{'/health p50(ms)':>18}{'/health p99(ms)':>18}{'样本数':>8}")
+    for mode, result in results.items():
+        print(
+            f"{mode:<8}{result['logins_per_second']:>10.1f}"
+            f"{result['health_p50_ms']:>18.1f}{result['health_p99_ms']:>18.1f}{result['health_samples']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
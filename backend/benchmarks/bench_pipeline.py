@@ -0,0 +1,263 @@
+"""
+需求说明书生成流水线基准测试
+使用合成的「功能点拆分表」工作簿（REALISTIC_SHAPE，含合并单元格、空行等）、假 OpenAI 服务和假 mmdc，分别测量：
+
+    excel_parse       ExcelParser.parse
+    process_excel     DocumentService.process_excel（校验 + 解析 + AI 描述）
+    mermaid_cold      generate_mermaid_images（无缓存，每张图都调用 mmdc）
+    mermaid_warm      generate_mermaid_images（清单已删除，逐张命中图片缓存）
+    mermaid_manifest  generate_mermaid_images（同一份章节数据再次请求，直接返回保存的清单）
+    generate_word     DocumentService.generate_user_document（每次先删除保存的文档，测量完整生成）
+
+结果写入 JSON，可用 --baseline 与上一个版本的结果对比，发现性能回退
+
+使用方式:
+    uv run python -m benchmarks.bench_pipeline --sizes 100,1000,10000,50000 --repeat 3
+    uv run python -m benchmarks.bench_pipeline --sizes 1000 --baseline benchmarks/results/v1.0.json
+"""
+import argparse
+import asyncio
+import copy
+import inspect
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from fastapi import BackgroundTasks
+from openai import OpenAI
+from starlette.requests import Request
+
+from app.models.schemas import GenerateMermaidImagesRequest
+from app.routers import generate
+from app.services.ai_service import ai_service
+from app.services.document_service import document_service
+from app.services.excel_parser import ExcelParser
+from app.services.output_store import output_store
+from app.services.render_manifest import diagram_request_key, render_manifest
+from app.services.token_cache import UserSnapshot
+from benchmarks.fakes import FakeOpenAIServer, stub_mmdc
+from benchmarks.workbook_generator import REALISTIC_SHAPE, write_workbook
+
+BENCHMARKS = ("excel_parse", "process_excel", "mermaid_cold", "mermaid_warm", "mermaid_manifest", "generate_word")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+# 基准测试专用的用户 ID，避免与真实用户的图片缓存目录冲突
+BENCH_USER_ID = 990000
+
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    return {
+        "min_s": min(samples),
+        "mean_s": statistics.mean(samples),
+        "median_s": statistics.median(samples),
+        "max_s": max(samples),
+        "stdev_s": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+    }
+
+
+async def _measure(func: Callable[[], object], repeat: int, setup: Optional[Callable[[], None]] = None) -> List[float]:
+    """func 可以是普通函数或协程函数；所有测量在同一个事件循环中进行（mermaid 信号量绑定事件循环）"""
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = func()
+        if inspect.isawaitable(result):
+            await result
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _connected_request(path: str) -> Request:
+    """一直保持连接的请求（receive 永远不返回 http.disconnect），供直接调用路由函数时使用"""
+    async def receive():
+        await asyncio.get_running_loop().create_future()
+
+    return Request({"type": "http", "method": "POST", "path": path, "headers": []}, receive)
+
+
+def _bench_user_cache_dir() -> str:
+    return os.path.join(generate.TEMP_DIR, "cache", f"user_{BENCH_USER_ID}")
+
+
+def _clear_bench_documents():
+    """删除基准测试用户保存的 Word 文档（内容相同的文档不会重新生成）"""
+    shutil.rmtree(os.path.join(output_store.base_dir, f"user_{BENCH_USER_ID}"), ignore_errors=True)
+
+
+async def run_size(rows: int, args, workbook_dir: str) -> List[dict]:
+    """对一个规模运行所有选中的基准测试"""
+    selected = set(args.only or BENCHMARKS)
+    results = []
+
+    def record(name: str, samples: List[float], **extra):
+        result = {"benchmark": name, "rows": rows, "repeat": len(samples), **_summary(samples), **extra}
+        result["rows_per_s"] = rows / result["median_s"] if result["median_s"] else None
+        results.append(result)
+        print(f"{name:<18}{rows:>8}{result['median_s'] * 1000:>14.1f}{result['min_s'] * 1000:>14.1f}")
+
+    path = write_workbook(os.path.join(workbook_dir, f"bench_{rows}.xlsx"), rows, seed=args.seed, **REALISTIC_SHAPE)
+
+    if "excel_parse" in selected:
+        record("excel_parse", await _measure(lambda: ExcelParser(path).parse(), args.repeat))
+
+    # 后续步骤都需要 process_excel 的输出
+    process_result = {}
+
+    async def process_excel():
+        process_result.update(await document_service.process_excel(path))
+
+    samples = await _measure(process_excel, args.repeat if "process_excel" in selected else 1)
+    if not process_result.get("success"):
+        raise RuntimeError(f"process_excel 失败: {process_result.get('error') or process_result.get('validation')}")
+    chapters = process_result["chapters"]
+    if "process_excel" in selected:
+        record("process_excel", samples, chapters=len(chapters))
+
+    request = GenerateMermaidImagesRequest(chapters=chapters)
+    user = UserSnapshot(id=BENCH_USER_ID, username="bench", real_name="基准测试", is_admin=False, is_active=True)
+    manifest_key = diagram_request_key([chapter.model_dump() for chapter in request.chapters])
+    image_mapping = {}
+
+    async def render():
+        # 清单命中时的检查作为 BackgroundTask 在响应之后执行，不计入耗时
+        response = await generate.generate_mermaid_images(
+            request, _connected_request("/api/generate/mermaid-images"), BackgroundTasks(), current_user=user)
+        image_mapping.update(response["data"]["imageMapping"])
+
+    def clear_image_cache():
+        # 清单也在用户缓存目录下，一并删除
+        shutil.rmtree(_bench_user_cache_dir(), ignore_errors=True)
+
+    def clear_manifest():
+        render_manifest.invalidate(BENCH_USER_ID, manifest_key)
+
+    if "mermaid_cold" in selected:
+        record("mermaid_cold", await _measure(render, args.repeat, setup=clear_image_cache))
+    if {"mermaid_warm", "mermaid_manifest", "generate_word"} & selected:
+        await render()
+        if "mermaid_warm" in selected:
+            record("mermaid_warm", await _measure(render, args.repeat, setup=clear_manifest),
+                   images=len(image_mapping))
+        if "mermaid_manifest" in selected:
+            # 上面的 render() 全部成功后已保存清单
+            record("mermaid_manifest", await _measure(render, args.repeat), images=len(image_mapping))
+
+    if "generate_word" in selected:
+        output_paths = []
+
+        def build_word():
+            path, _, _ = document_service.generate_user_document(copy.deepcopy(chapters), image_mapping, BENCH_USER_ID)
+            output_paths.append(path)
+
+        samples = await _measure(build_word, args.repeat, setup=_clear_bench_documents)
+        record("generate_word", samples, docx_bytes=os.path.getsize(output_paths[-1]))
+
+    clear_image_cache()
+    _clear_bench_documents()
+    return results
+
+
+def compare(results: List[dict], baseline_path: str, threshold: float) -> List[dict]:
+    """与基线结果按 (benchmark, rows) 对比中位数，超过阈值的视为回退"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(r["benchmark"], r["rows"]): r for r in json.load(f)["results"]}
+
+    regressions = []
+    print(f"\n与基线对比: {baseline_path}")
+    print(f"{'benchmark':<18}{'rows':>8}{'基线(ms)':>12}{'当前(ms)':>12}{'比值':>8}")
+    for result in results:
+        base = baseline.get((result["benchmark"], result["rows"]))
+        if base is None:
+            continue
+        ratio = result["median_s"] / base["median_s"] if base["median_s"] else float("inf")
+        flag = " <- 回退" if ratio > 1 + threshold else ""
+        print(f"{result['benchmark']:<18}{result['rows']:>8}{base['median_s'] * 1000:>12.1f}"
+              f"{result['median_s'] * 1000:>12.1f}{ratio:>8.2f}{flag}")
+        if flag:
+            regressions.append({**result, "baseline_median_s": base["median_s"], "ratio": ratio})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="需求说明书生成流水线基准测试")
+    parser.add_argument("--sizes", default="100,1000,10000,50000", help="工作簿行数，逗号分隔")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="*", choices=BENCHMARKS, help="只运行指定的基准测试")
+    parser.add_argument("--ai-latency", type=float, default=0.005, help="假 OpenAI 服务的响应延迟（秒）")
+    parser.add_argument("--mmdc-latency", type=float, default=0.0, help="假 mmdc 的渲染延迟（秒）")
+    parser.add_argument("--output", help="结果 JSON 路径，默认 benchmarks/results/pipeline-<时间>.json")
+    parser.add_argument("--baseline", help="用于对比的历史结果 JSON")
+    parser.add_argument("--threshold", type=float, default=0.2, help="中位数变慢超过该比例视为回退")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+
+    original_client, original_model = ai_service.client, ai_service.model
+    results = []
+    with FakeOpenAIServer(latency=args.ai_latency) as fake_ai, stub_mmdc(latency=args.mmdc_latency), \
+            tempfile.TemporaryDirectory() as workbook_dir:
+        ai_service.client = OpenAI(api_key="bench", base_url=fake_ai.base_url)
+        ai_service.model = "fake-model"
+        try:
+            print(f"{'benchmark':<18}{'rows':>8}{'median(ms)':>14}{'min(ms)':>14}")
+
+            async def run_all():
+                for rows in sizes:
+                    results.extend(await run_size(rows, args, workbook_dir))
+
+            asyncio.run(run_all())
+        finally:
+            ai_service.client, ai_service.model = original_client, original_model
+        ai_requests = fake_ai.requests
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+            "ai_requests": ai_requests,
+        },
+        "results": results,
+    }
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"pipeline-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入 {output}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.threshold)
+        if regressions:
+            print(f"发现 {len(regressions)} 项性能回退")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+基准测试 / 压测用的外部依赖替身
+- FakeOpenAIServer: 本地 OpenAI 兼容接口（/v1/chat/completions），延迟可配置
+- stub_mmdc: 临时放到 PATH 最前面的假 mmdc，直接复制一张固定的 PNG
+"""
+import base64
+import json
+import os
+import random
+import stat
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, Optional
+
+# 1x1 透明 PNG
+STUB_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+
+
+class FakeOpenAIServer:
+    """
+    OpenAI 兼容的假服务，在后台线程运行
+
+    每个请求等待 latency ± jitter 秒后返回固定长度的描述，并带上 usage 字段
+    """
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _delay(self) -> float:
+        with self._lock:
+            self.requests += 1
+            jitter = self._rng.uniform(-self.jitter, self.jitter) if self.jitter else 0.0
+        return max(0.0, self.latency + jitter)
+
+    def start(self) -> "FakeOpenAIServer":
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # 响应头和响应体分两次写出，关闭 Nagle 以免每个请求多出约 40ms 的延迟确认等待
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if not self.path.endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                request = json.loads(body or b"{}")
+                time.sleep(fake._delay())
+
+                prompt = "".join(m.get("content", "") for m in request.get("messages", []))
+                content = "该功能模块用于" + "处理业务数据并提供查询与统计能力，" * 4
+                payload = json.dumps({
+                    "id": f"chatcmpl-fake-{fake.requests}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "fake"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {
+                        "prompt_tokens": len(prompt),
+                        "completion_tokens": len(content),
+                        "total_tokens": len(prompt) + len(content),
+                    },
+                }, ensure_ascii=False).encode("utf-8")
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+_MMDC_SCRIPT = """#!/bin/sh
+# 假 mmdc：解析 -o 参数，等待 FAKE_MMDC_LATENCY 秒后复制固定 PNG
+out=""
+while [ $# -gt 0 ]; do
+    case "$1" in
+        -o) out="$2"; shift ;;
+    esac
+    shift
+done
+if [ -n "$FAKE_MMDC_LATENCY" ] && [ "$FAKE_MMDC_LATENCY" != "0" ]; then
+    sleep "$FAKE_MMDC_LATENCY"
+fi
+cp "{png_path}" "$out"
+"""
+
+
+@contextmanager
+def stub_mmdc(latency: float = 0.0) -> Iterator[str]:
+    """
+    在 PATH 最前面放一个假的 mmdc（POSIX shell 脚本），退出时恢复 PATH
+    返回假 mmdc 所在目录
+    """
+    with tempfile.TemporaryDirectory(prefix="fake-mmdc-") as bin_dir:
+        png_path = os.path.join(bin_dir, "stub.png")
+        with open(png_path, "wb") as f:
+            f.write(STUB_PNG)
+
+        script_path = os.path.join(bin_dir, "mmdc")
+        with open(script_path, "w", encoding="utf-8") as f:
+            f.write(_MMDC_SCRIPT.replace("{png_path}", png_path))
+        os.chmod(script_path, os.stat(script_path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+        original_path = os.environ.get("PATH", "")
+        original_latency = os.environ.get("FAKE_MMDC_LATENCY")
+        os.environ["PATH"] = bin_dir + os.pathsep + original_path
+        os.environ["FAKE_MMDC_LATENCY"] = str(latency)
+        try:
+            yield bin_dir
+        finally:
+            os.environ["PATH"] = original_path
+            if original_latency is None:
+                os.environ.pop("FAKE_MMDC_LATENCY", None)
+            else:
+                os.environ["FAKE_MMDC_LATENCY"] = original_latency
@@ -0,0 +1,205 @@
+"""
+合成「功能点拆分表」工作簿
+用于基准测试、压测和解析器正确性测试，同一 seed 生成的内容完全一致
+
+可控制的形状参数见 WorkbookShape：
+- 功能用户需求数量、每个需求的功能过程数、每个过程的子过程数（固定值或 (最小, 最大) 区间）
+- 合并单元格比例：功能用户需求 / 角色 / 功能过程 / 触发事件 列使用合并单元格（只有首行有值）
+  而不是每行重复填写
+- 空行比例、角色分隔符变体（全角逗号、半角逗号、混用、带空格）、数据组缺失比例
+
+generate_workbook 同时给出 ExcelParser.parse 应得到的结果（expected），正确性测试可直接比对
+"""
+import random
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.cell_range import CellRange, MultiCellRange
+
+SHEET_NAME = "功能点拆分表"
+COLUMNS = ['功能用户需求', '触发事件', '功能过程', '子过程描述', '数据组', '功能用户', '角色']
+
+_ROLES = ["管理员", "操作员", "审核员", "系统", "访客", "财务", "运维"]
+_VERBS = ["新增", "编辑", "删除", "查询", "导出", "审核", "同步", "归档"]
+_OBJECTS = ["用户", "订单", "合同", "发票", "库存", "报表", "权限", "日志"]
+# 角色列的分隔符写法，解析后都应规范为全角逗号
+_ROLE_SEPARATORS = ["，", ",", "， ", ", "]
+# 前向填充的列：合并单元格时只有首行有值
+_FEATURE_COLUMNS = ('功能用户需求', '角色')
+_PROCESS_COLUMNS = ('触发事件', '功能过程')
+
+Count = Union[int, Tuple[int, int]]
+
+# 接近真实需求表的形状：过程数和子过程数不固定，一半合并单元格，偶有空行、半角逗号和缺失数据组
+REALISTIC_SHAPE = {
+    "processes_per_feature": (2, 6),
+    "sub_processes_per_process": (2, 5),
+    "merged_ratio": 0.5,
+    "blank_row_ratio": 0.05,
+    "role_variant_ratio": 0.2,
+    "missing_data_group_ratio": 0.1,
+}
+
+
+@dataclass
+class WorkbookShape:
+    """工作簿的形状分布"""
+    features: int = 50
+    processes_per_feature: Count = 4
+    sub_processes_per_process: Count = 3
+    # 使用合并单元格的功能需求 / 功能过程比例，其余每行重复填写
+    merged_ratio: float = 0.0
+    # 每个功能过程之后插入空行的概率
+    blank_row_ratio: float = 0.0
+    # 角色使用非全角逗号分隔的比例
+    role_variant_ratio: float = 0.0
+    # 子过程行缺少数据组的比例
+    missing_data_group_ratio: float = 0.0
+
+    @classmethod
+    def for_rows(cls, rows: int, **shape) -> "WorkbookShape":
+        """按目标数据行数估算功能需求数量（实际行数在 rows 附近）"""
+        result = cls(**shape)
+        per_feature = _mean(result.processes_per_feature) * _mean(result.sub_processes_per_process)
+        result.features = max(1, round(rows / per_feature))
+        return result
+
+
+@dataclass
+class SyntheticWorkbook:
+    """生成结果：按行排列的单元格值、合并区域和解析后应得到的结构"""
+    rows: List[List[Any]]
+    merged_ranges: List[str]
+    expected: "OrderedDict[str, Any]"
+
+    @property
+    def data_rows(self) -> int:
+        """非空行数（不含表头）"""
+        return sum(1 for row in self.rows if any(value is not None for value in row))
+
+
+def _mean(count: Count) -> float:
+    return count if isinstance(count, int) else (count[0] + count[1]) / 2
+
+
+def _pick(rng: random.Random, count: Count) -> int:
+    return count if isinstance(count, int) else rng.randint(count[0], count[1])
+
+
+def generate_workbook(shape: Optional[WorkbookShape] = None, seed: int = 0) -> SyntheticWorkbook:
+    """按形状生成工作簿内容（不落盘）"""
+    shape = shape or WorkbookShape()
+    rng = random.Random(seed)
+    rows: List[List[Any]] = []
+    merged_ranges: List[str] = []
+    expected: "OrderedDict[str, Any]" = OrderedDict()
+    column_index = {name: i for i, name in enumerate(COLUMNS)}
+
+    def merge(column: str, first: int, last: int):
+        # first / last 是 rows 中的下标，工作表中第 1 行是表头
+        if last > first:
+            letter = get_column_letter(column_index[column] + 1)
+            merged_ranges.append(f"{letter}{first + 2}:{letter}{last + 2}")
+
+    for feature_index in range(1, shape.features + 1):
+        feature = f"{rng.choice(_OBJECTS)}管理{feature_index}"
+        roles = rng.sample(_ROLES, 3)
+        if rng.random() < shape.role_variant_ratio:
+            # 每个分隔处独立选择写法，覆盖混用的情况
+            role_text = roles[0] + rng.choice(_ROLE_SEPARATORS) + roles[1] + rng.choice(_ROLE_SEPARATORS) + roles[2]
+        else:
+            role_text = "，".join(roles)
+        feature_merged = rng.random() < shape.merged_ratio
+        feature_first = len(rows)
+        expected[feature] = OrderedDict([("角色", "，".join(roles))])
+
+        process_count = _pick(rng, shape.processes_per_feature)
+        for process_index in range(1, process_count + 1):
+            process = f"{rng.choice(_VERBS)}{feature}-{process_index}"
+            process_merged = rng.random() < shape.merged_ratio
+            process_first = len(rows)
+            sub_processes, data_groups = [], []
+
+            for step in range(1, _pick(rng, shape.sub_processes_per_process) + 1):
+                sub_process = f"{process}步骤{step}"
+                data_group = None
+                if rng.random() >= shape.missing_data_group_ratio:
+                    data_group = f"{rng.choice(_OBJECTS)}信息"
+                    data_groups.append(data_group)
+                sub_processes.append(sub_process)
+
+                values = {
+                    '功能用户需求': feature,
+                    '触发事件': f"用户发起{process}",
+                    '功能过程': process,
+                    '子过程描述': sub_process,
+                    '数据组': data_group,
+                    '功能用户': "用户",
+                    '角色': role_text,
+                }
+                if feature_merged and len(rows) > feature_first:
+                    for column in _FEATURE_COLUMNS:
+                        values[column] = None
+                if process_merged and len(rows) > process_first:
+                    for column in _PROCESS_COLUMNS:
+                        values[column] = None
+                rows.append([values[column] for column in COLUMNS])
+
+            if process_merged:
+                for column in _PROCESS_COLUMNS:
+                    merge(column, process_first, len(rows) - 1)
+
+            # 与解析器一致：子过程不足 3 个时重复最后一个
+            while len(sub_processes) < 3:
+                sub_processes.append(sub_processes[-1] if sub_processes else f"执行{process}")
+            expected[feature][process] = [sub_processes, data_groups]
+
+            # 功能需求的最后一个过程之后不插空行，保证合并区域不以空行结尾
+            if process_index < process_count and rng.random() < shape.blank_row_ratio:
+                rows.append([None] * len(COLUMNS))
+
+        if feature_merged:
+            for column in _FEATURE_COLUMNS:
+                merge(column, feature_first, len(rows) - 1)
+
+        if feature_index < shape.features and rng.random() < shape.blank_row_ratio:
+            rows.append([None] * len(COLUMNS))
+
+    return SyntheticWorkbook(rows=rows, merged_ranges=merged_ranges, expected=expected)
+
+
+def save_workbook(workbook: SyntheticWorkbook, path: str, sheet_name: str = SHEET_NAME) -> str:
+    """写入 xlsx（write_only 模式，5 万行在数秒内完成）"""
+    return save_sheets({sheet_name: workbook}, path)
+
+
+def save_sheets(sheets: Dict[str, SyntheticWorkbook], path: str) -> str:
+    """把多个生成结果写入同一个 xlsx 的不同工作表（按字典顺序）"""
+    book = Workbook(write_only=True)
+    for sheet_name, workbook in sheets.items():
+        sheet = book.create_sheet(sheet_name)
+        sheet.append(COLUMNS)
+        for row in workbook.rows:
+            sheet.append(row)
+        # MultiCellRange.add 每次都线性查重，一次性构造以免大表退化为平方复杂度
+        sheet.merged_cells = MultiCellRange([CellRange(cell_range) for cell_range in workbook.merged_ranges])
+    book.save(path)
+    return path
+
+
+def write_workbook(path: str, rows: int, seed: int = 0, **shape) -> str:
+    """按目标行数生成并写入工作簿，其余形状参数见 WorkbookShape"""
+    return save_workbook(generate_workbook(WorkbookShape.for_rows(rows, **shape), seed=seed), path)
+
+
+def describe(workbook: SyntheticWorkbook) -> Dict[str, int]:
+    """统计生成结果的规模"""
+    return {
+        "rows": workbook.data_rows,
+        "features": len(workbook.expected),
+        "processes": sum(len(feature) - 1 for feature in workbook.expected.values()),
+        "merged_ranges": len(workbook.merged_ranges),
+    }
@@ -51,12 +51,15 @@ def build_backend():
         # 注意：不排除 numpy，因为 pandas 依赖它
         # "--exclude-module", "numpy",
         "--exclude-module", "PIL",
+        # 异步数据库驱动只通过连接 URL（database.to_async_url 生成的 sqlite+aiosqlite）加载，PyInstaller 分析不到
+        "--hidden-import", "aiosqlite",
+        "--hidden-import", "sqlalchemy.dialects.sqlite.aiosqlite",
         # 添加数据文件
         f"--add-data={app_dir}{os.pathsep}app",
         # 隐藏控制台窗口（可选）
         # "--noconsole",
-        # 主入口文件
-        str(app_dir / "main.py")
+        # 主入口文件（先调用 freeze_support 再导入 app，见 server.py）
+        str(backend_dir / "server.py")
     ]
 
     print(f"打包模式: {'onedir' if use_onedir else 'onefile'}")
@@ -0,0 +1,16 @@
+"""
+打包后的可执行文件入口（build.py 以本文件为 PyInstaller 主脚本）
+
+进程池（密码哈希、Excel 解析、Word 生成）使用 spawn 启动子进程，打包后子进程会重新执行主脚本：
+freeze_support() 必须在导入 app 之前调用，子进程才不会先加载整个应用（日志、路由、数据库）。
+"""
+import multiprocessing
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+
+    import uvicorn
+    from app.main import app
+
+    # 默认运行在 8000 端口
+    uvicorn.run(app, host="127.0.0.1", port=8000)
@@ -0,0 +1,160 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session
+
+from app.database import Base, create_async_db_engine, create_db_engine, get_async_db
+from app.models.user import User
+from app.routers import admin
+from app.services.token_cache import TokenCache, UserSnapshot
+from app.services.usage_counter_service import DIAGRAMS_RENDERED, usage_counter_service
+
+
+class TestListUsers(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        database_url = f"sqlite:///{os.path.join(self.tmp_dir.name, 'test.db')}"
+        admin.user_count_cache.clear()
+        admin.stats_cache.clear()
+
+        base_time = datetime(2025, 1, 1, 8, 0, 0)
+        sync_engine = create_db_engine(database_url)
+        Base.metadata.create_all(bind=sync_engine)
+        with Session(sync_engine) as db:
+            for i in range(25):
+                db.add(User(
+                    username=f"user{i:02d}",
+                    hashed_password="x",
+                    real_name=f"用户{i}",
+                    is_admin=(i % 10 == 0),
+                    is_active=(i % 3 != 0),
+                    # 每 5 个用户共享同一创建时间，验证 id 作为第二排序键
+                    created_at=base_time + timedelta(minutes=i // 5),
+                ))
+            db.commit()
+        sync_engine.dispose()
+
+        # 异步连接绑定事件循环，所有请求需在同一个 TestClient 事件循环中执行
+        self.engine = create_async_db_engine(database_url)
+        self.session_factory = async_sessionmaker(self.engine, expire_on_commit=False)
+
+        async def override_get_async_db():
+            async with self.session_factory() as db:
+                yield db
+
+        app = FastAPI()
+        app.include_router(admin.router, prefix="/api/admin")
+        app.dependency_overrides[get_async_db] = override_get_async_db
+        app.dependency_overrides[admin.require_admin] = lambda: UserSnapshot(
+            id=1, username="admin", real_name="管理员", is_admin=True, is_active=True
+        )
+        self.client = TestClient(app)
+        self.client.__enter__()
+
+    def tearDown(self):
+        self.client.portal.call(self.engine.dispose)
+        self.client.__exit__(None, None, None)
+        self.tmp_dir.cleanup()
+
+    def _fetch_all(self, **params):
+        users, cursor, first = [], None, None
+        while True:
+            query = dict(params)
+            if cursor:
+                query["cursor"] = cursor
+            data = self.client.get("/api/admin/users", params=query).json()["data"]
+            if first is None:
+                first = data
+            users.extend(data["users"])
+            cursor = data["next_cursor"]
+            if not cursor:
+                return users, first
+
+    def test_keyset_pagination_covers_all_rows_once(self):
+        users, first = self._fetch_all(limit=4)
+
+        self.assertEqual(first["total"], 25)
+        self.assertTrue(first["has_more"])
+        ids = [u["id"] for u in users]
+        self.assertEqual(len(ids), 25)
+        self.assertEqual(len(set(ids)), 25)
+        # 创建时间倒序，同一时间按 id 倒序
+        self.assertEqual(ids, sorted(ids, reverse=True))
+
+    def test_later_pages_do_not_count(self):
+        first = self.client.get("/api/admin/users", params={"limit": 10}).json()["data"]
+        second = self.client.get(
+            "/api/admin/users", params={"limit": 10, "cursor": first["next_cursor"]}
+        ).json()["data"]
+        self.assertIsNone(second["total"])
+
+    def test_filters(self):
+        users, first = self._fetch_all(limit=3, username_prefix="user1", is_active=True)
+        usernames = {u["username"] for u in users}
+        expected = {f"user{i:02d}" for i in range(10, 20) if i % 3 != 0}
+        self.assertEqual(usernames, expected)
+        self.assertEqual(first["total"], len(expected))
+
+        admins, _ = self._fetch_all(is_admin=True)
+        self.assertEqual({u["username"] for u in admins}, {"user00", "user10", "user20"})
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/admin/users", params={"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_stats(self):
+        stats = self.client.get("/api/admin/stats").json()["data"]
+        active = len([i for i in range(25) if i % 3 != 0])
+        self.assertEqual(stats["total_users"], 25)
+        self.assertEqual(stats["active_users"], active)
+        self.assertEqual(stats["inactive_users"], 25 - active)
+        self.assertEqual(stats["admin_users"], 3)
+        self.assertEqual(stats["ai_calls"], 0)
+
+        # 缓存期间计数变化不可见，用户变更后立即失效
+        pending = mock.patch.dict(usage_counter_service._pending)
+        pending.start()
+        self.addCleanup(pending.stop)
+        usage_counter_service.increment(DIAGRAMS_RENDERED, 2)
+        self.assertEqual(self.client.get("/api/admin/stats").json()["data"]["diagrams_rendered"], 0)
+        admin._on_user_changed()
+        stats = self.client.get("/api/admin/stats").json()["data"]
+        self.assertEqual(stats["diagrams_rendered"], 2)
+        # 读取统计不写入数据库，增量留给定期写入
+        self.assertEqual(usage_counter_service.pending(), {DIAGRAMS_RENDERED: 2})
+
+
+    def test_user_changes_invalidate_cached_tokens(self):
+        cache = TokenCache(ttl_seconds=30)
+        patch = mock.patch.object(admin, "token_cache", cache)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+        def cached(user_id):
+            cache.set(f"token-{user_id}", UserSnapshot(id=user_id, username=f"user{user_id - 1:02d}", real_name="",
+                                                       is_admin=False, is_active=True))
+            cache.set("token-other", UserSnapshot(id=5, username="user04", real_name="", is_admin=False,
+                                                  is_active=True))
+            return f"token-{user_id}"
+
+        for method, url, payload in (
+            ("PUT", "/api/admin/users/2", {"real_name": "新名字"}),
+            ("PUT", "/api/admin/users/2", {"is_active": False}),
+            ("DELETE", "/api/admin/users/3", None),
+        ):
+            with self.subTest(method=method, payload=payload):
+                token = cached(int(url.rsplit("/", 1)[1]))
+                response = self.client.request(method, url, json=payload)
+                self.assertEqual(response.status_code, 200)
+                self.assertIsNone(cache.get(token))
+                self.assertIsNotNone(cache.get("token-other"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,7 @@
 import os
 import unittest
 
-from app.services.ai_service import AIService
+from app.services.ai_service import _UNSET, AIService
 
 
 class FakeCompletionChoice:
@@ -49,6 +49,20 @@ class TestAIService(unittest.TestCase):
         desc = ai.generate_description("订单处理", ["下单", "支付", "发货"])
         self.assertEqual(desc, "生成的功能概述文本")
 
+    def test_client_created_on_first_use(self):
+        os.environ["AI_API_KEY"] = "test-key"
+        try:
+            ai = AIService()
+        finally:
+            os.environ.pop("AI_API_KEY", None)
+        self.assertIs(ai._client, _UNSET)
+        client = ai.client
+        self.assertIsNotNone(client)
+        self.assertIs(ai.client, client)
+
+    def test_no_client_without_api_key(self):
+        self.assertIsNone(AIService().client)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,207 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routers import generate
+from app.services.ai_service import ai_service
+from app.services.auth_service import get_current_user
+from app.services.document_service import document_service
+from app.services.excel_parse_pool import ExcelParsePool, excel_parse_pool
+from app.services.excel_parser import ExcelParser
+from app.services.token_cache import UserSnapshot
+from benchmarks.workbook_generator import REALISTIC_SHAPE, WorkbookShape, generate_workbook, save_sheets
+
+USER = UserSnapshot(id=1, username="pmo", real_name="项目办", is_admin=False, is_active=True)
+
+
+class CountingCompletions:
+    def __init__(self):
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def create(self, model, messages):
+        with self._lock:
+            self.calls += 1
+
+        class Message:
+            content = "功能概述"
+
+        class Choice:
+            message = Message()
+
+        class Completion:
+            choices = [Choice()]
+            usage = None
+
+        return Completion()
+
+
+class BatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        shape = WorkbookShape(features=4, **REALISTIC_SHAPE)
+        self.sheet_a = generate_workbook(shape, seed=1)
+        self.sheet_b = generate_workbook(shape, seed=2)
+        self.multi_path = save_sheets({"说明": generate_workbook(WorkbookShape(features=0)),
+                                       "一期": self.sheet_a, "二期": self.sheet_b},
+                                      os.path.join(self.tmp.name, "program.xlsx"))
+        # 第二个工作簿与「一期」内容相同，AI 描述应被复用
+        self.copy_path = save_sheets({"功能点拆分表": self.sheet_a}, os.path.join(self.tmp.name, "copy.xlsx"))
+
+        self.completions = CountingCompletions()
+        self.original_client = ai_service.client
+        ai_service.client = type("Client", (), {"chat": type("Chat", (), {"completions": self.completions})()})()
+        self.original_workers = excel_parse_pool.max_workers
+        excel_parse_pool.max_workers = 0
+
+    def tearDown(self):
+        ai_service.client = self.original_client
+        excel_parse_pool.max_workers = self.original_workers
+        self.tmp.cleanup()
+
+
+class TestExcelParserSheets(BatchTestCase):
+    def test_find_spec_sheets_skips_other_sheets(self):
+        # 「说明」工作表只有表头没有数据，同样符合格式
+        self.assertEqual(ExcelParser.find_spec_sheets(self.multi_path), ["说明", "一期", "二期"])
+
+    def test_sheet_name_parameter(self):
+        self.assertEqual(ExcelParser(self.multi_path, "二期").parse(), self.sheet_b.expected)
+
+    def test_parse_sheet_in_process_pool(self):
+        pool = ExcelParsePool(max_workers=1)
+        try:
+            result = asyncio.run(pool.parse_sheet(self.multi_path, "一期"))
+        finally:
+            pool.shutdown()
+        self.assertTrue(result["validation"]["valid"])
+        self.assertEqual(result["data"], self.sheet_a.expected)
+
+
+class TestProcessBatch(BatchTestCase):
+    def test_batch_dedups_ai_calls(self):
+        batch = asyncio.run(document_service.process_batch([(self.multi_path, None), (self.copy_path, None)]))
+        stats = batch["stats"]
+
+        self.assertEqual([(r["sheet_name"], r["success"]) for r in batch["results"]],
+                         [("说明", False), ("一期", True), ("二期", True), ("功能点拆分表", True)])
+        self.assertEqual(batch["results"][0]["validation"]["errors"][0]["type"], "parse_error")
+        self.assertEqual(batch["results"][1]["chapters"], batch["results"][3]["chapters"])
+        self.assertEqual(stats["sheets"], 4)
+        self.assertEqual(stats["features"], 12)
+        self.assertEqual(stats["ai_calls"], 8)
+        self.assertEqual(stats["ai_calls_deduplicated"], 4)
+        self.assertEqual(self.completions.calls, 8)
+
+    def test_explicit_sheet_names(self):
+        batch = asyncio.run(document_service.process_batch([(self.multi_path, ["二期", "不存在"])]))
+        self.assertTrue(batch["results"][0]["success"])
+        self.assertFalse(batch["results"][1]["success"])
+        self.assertIn("未找到工作表", batch["results"][1]["validation"]["errors"][0]["details"])
+
+
+class TestBatchEndpoint(BatchTestCase):
+    def setUp(self):
+        super().setUp()
+        self.renders = []
+
+        async def fake_run_mmdc(mermaid_code, output_path, content_hash, span):
+            self.renders.append(content_hash)
+            await asyncio.sleep(0.01)
+            with open(output_path, "wb") as f:
+                f.write(b"png")
+            return output_path
+
+        self.patches = [
+            mock.patch.object(generate, "TEMP_DIR", self.tmp.name),
+            mock.patch.object(generate, "_run_mmdc", fake_run_mmdc),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+        app = FastAPI()
+        app.include_router(generate.router, prefix="/api/generate")
+        app.dependency_overrides[get_current_user] = lambda: USER
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        super().tearDown()
+
+    def test_batch_renders_each_diagram_once(self):
+        response = self.client.post("/api/generate/batch-process-excel", json={
+            "items": [{"file_path": self.multi_path, "sheet_names": ["一期", "二期"]},
+                      {"file_path": self.copy_path}],
+            "render_images": True,
+        })
+        self.assertEqual(response.status_code, 200)
+        data = response.json()["data"]
+        stats = data["stats"]
+
+        self.assertEqual(stats["diagrams_deduplicated"], stats["diagrams"] - len(self.renders))
+        self.assertEqual(len(self.renders), len(set(self.renders)))
+        first, _, copy = data["results"]
+        self.assertEqual(first["imageMapping"], copy["imageMapping"])
+        self.assertTrue(all(os.path.exists(path) for path in first["imageMapping"].values()))
+        self.assertIn("render", stats["timing_ms"])
+
+    def test_rejects_empty_batch(self):
+        response = self.client.post("/api/generate/batch-process-excel", json={"items": []})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_identical_renders_share_one_mmdc_run(self):
+        calls = []
+
+        async def fake_run_mmdc(mermaid_code, output_path, content_hash, span):
+            calls.append(content_hash)
+            await asyncio.sleep(0.05)
+            with open(output_path, "wb") as f:
+                f.write(b"png")
+            return output_path
+
+        async def render_many():
+            return await asyncio.gather(*(generate._generate_png_from_mermaid_code("graph TD; A-->B", USER.id)
+                                          for _ in range(5)))
+
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                mock.patch.object(generate, "TEMP_DIR", tmp_dir), \
+                mock.patch.object(generate, "_run_mmdc", fake_run_mmdc):
+            paths = asyncio.run(render_many())
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(set(paths)), 1)
+        self.assertEqual(generate._inflight_renders, {})
+
+    def test_failure_is_shared_and_not_cached(self):
+        calls = []
+
+        async def failing_run_mmdc(mermaid_code, output_path, content_hash, span):
+            calls.append(content_hash)
+            await asyncio.sleep(0.01)
+            raise RuntimeError("mmdc 崩溃")
+
+        async def render_many():
+            return await asyncio.gather(*(generate._generate_png_from_mermaid_code("graph TD; X-->Y", USER.id)
+                                          for _ in range(3)), return_exceptions=True)
+
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                mock.patch.object(generate, "TEMP_DIR", tmp_dir), \
+                mock.patch.object(generate, "_run_mmdc", failing_run_mmdc):
+            outcomes = asyncio.run(render_many())
+            self.assertEqual(len(asyncio.run(render_many())), 3)
+
+        self.assertTrue(all(isinstance(outcome, RuntimeError) for outcome in outcomes))
+        self.assertEqual(len(calls), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
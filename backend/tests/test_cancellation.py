@@ -0,0 +1,227 @@
+import asyncio
+import os
+import stat
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app.routers import generate
+from app.services.ai_service import ai_service
+from app.services.document_service import document_service
+from app.services.metrics import abandoned_work_total, client_disconnects_total
+from benchmarks.workbook_generator import REALISTIC_SHAPE, WorkbookShape, generate_workbook, save_workbook
+from tests.test_batch_processing import USER
+from tests.test_incremental import IncrementalTestCase
+
+
+def request_disconnecting_after(seconds):
+    async def receive():
+        await asyncio.sleep(seconds)
+        return {"type": "http.disconnect"}
+
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": []}, receive)
+
+
+def abandoned(kind, outcome):
+    return abandoned_work_total.value(route="none", kind=kind, outcome=outcome)
+
+
+def process_alive(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            return not any(line.startswith("State:") and "Z" in line.split()[1] for line in f)
+    except FileNotFoundError:
+        return False
+
+
+class TestCancelOnDisconnect(unittest.TestCase):
+    def test_disconnect_cancels_work(self):
+        cancelled = []
+
+        async def work():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        before = client_disconnects_total.value(route="none")
+        with self.assertRaises(HTTPException) as context:
+            asyncio.run(generate._cancel_on_disconnect(request_disconnecting_after(0.01), work()))
+        self.assertEqual(context.exception.status_code, generate.CLIENT_CLOSED_REQUEST)
+        self.assertEqual(cancelled, [True])
+        self.assertEqual(client_disconnects_total.value(route="none"), before + 1)
+
+    def test_result_when_client_stays(self):
+        async def work():
+            await asyncio.sleep(0.01)
+            return "done"
+
+        self.assertEqual(asyncio.run(generate._cancel_on_disconnect(request_disconnecting_after(10), work())), "done")
+
+
+class TestSharedRenderCancellation(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.events = []
+
+        async def slow_run_mmdc(mermaid_code, output_path, content_hash, span):
+            try:
+                await asyncio.sleep(0.05)
+            except asyncio.CancelledError:
+                self.events.append("cancelled")
+                raise
+            with open(output_path, "wb") as f:
+                f.write(b"png")
+            self.events.append("rendered")
+            return output_path
+
+        self.patches = [mock.patch.object(generate, "TEMP_DIR", self.tmp.name),
+                        mock.patch.object(generate, "_run_mmdc", slow_run_mmdc)]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.tmp.cleanup()
+
+    def render_and_cancel(self, waiters, cancel):
+        async def main():
+            tasks = [asyncio.ensure_future(generate._generate_png_from_mermaid_code("graph TD; A-->B", USER.id))
+                     for _ in range(waiters)]
+            await asyncio.sleep(0.01)
+            for task in tasks[:cancel]:
+                task.cancel()
+            return await asyncio.gather(*tasks, return_exceptions=True)
+
+        return asyncio.run(main())
+
+    def test_render_continues_while_another_request_waits(self):
+        before = abandoned("mermaid_running", "continued")
+        outcomes = self.render_and_cancel(waiters=2, cancel=1)
+        self.assertIsInstance(outcomes[0], asyncio.CancelledError)
+        self.assertTrue(os.path.exists(outcomes[1]))
+        self.assertEqual(self.events, ["rendered"])
+        self.assertEqual(abandoned("mermaid_running", "continued"), before + 1)
+
+    def test_render_is_cancelled_when_nobody_waits(self):
+        before = abandoned("mermaid_running", "cancelled")
+        outcomes = self.render_and_cancel(waiters=2, cancel=2)
+        self.assertTrue(all(isinstance(outcome, asyncio.CancelledError) for outcome in outcomes))
+        self.assertEqual(self.events, ["cancelled"])
+        self.assertEqual(abandoned("mermaid_running", "cancelled"), before + 1)
+        self.assertEqual(generate._inflight_renders, {})
+
+    def test_request_right_after_cancel_renders_again(self):
+        async def main():
+            first = asyncio.ensure_future(generate._generate_png_from_mermaid_code("graph TD; A-->B", USER.id))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            # 取消尚未生效时同一张图再次请求：不能等到被取消的渲染
+            second = asyncio.ensure_future(generate._generate_png_from_mermaid_code("graph TD; A-->B", USER.id))
+            return await asyncio.gather(first, second, return_exceptions=True)
+
+        first, second = asyncio.run(main())
+        self.assertIsInstance(first, asyncio.CancelledError)
+        self.assertTrue(os.path.exists(second))
+        self.assertEqual(self.events, ["cancelled", "rendered"])
+        self.assertEqual(generate._inflight_renders, {})
+
+
+@unittest.skipUnless(os.name == "posix" and os.path.isdir("/proc"), "需要 POSIX 进程组和 /proc")
+class TestMmdcTermination(unittest.TestCase):
+    def test_cancel_kills_mmdc_and_children(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # 假的 mmdc：启动一个子进程（模拟 Chromium），写入半张图片后一直等待
+            script = os.path.join(tmp_dir, "mmdc")
+            with open(script, "w") as f:
+                f.write('#!/bin/sh\nsleep 60 &\necho $! > "$4.child"\necho partial > "$4"\nwait\n')
+            os.chmod(script, os.stat(script).st_mode | stat.S_IEXEC)
+            output_path = os.path.join(tmp_dir, "out.png")
+
+            async def main():
+                task = asyncio.ensure_future(generate._run_mmdc("graph TD; A-->B", output_path, "0" * 32,
+                                                                mock.MagicMock()))
+                for _ in range(200):
+                    if os.path.exists(output_path + ".child") and os.path.getsize(output_path + ".child"):
+                        break
+                    await asyncio.sleep(0.01)
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+
+            with mock.patch.dict(os.environ, {"PATH": tmp_dir + os.pathsep + os.environ["PATH"]}):
+                asyncio.run(main())
+
+            with open(output_path + ".child") as f:
+                child = int(f.read())
+            deadline = time.time() + 2
+            while process_alive(child) and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertFalse(process_alive(child))
+            self.assertFalse(os.path.exists(output_path))
+
+
+class BlockingCompletions:
+    """第一次调用阻塞到 release()，用于在 AI 调用进行中取消请求"""
+
+    def __init__(self):
+        self.calls = 0
+        self.started = threading.Event()
+        self.released = threading.Event()
+
+    def create(self, model, messages):
+        self.calls += 1
+        self.started.set()
+        self.released.wait(5)
+
+        class Message:
+            content = "功能概述"
+
+        class Choice:
+            message = Message()
+
+        class Completion:
+            choices = [Choice()]
+            usage = None
+
+        return Completion()
+
+    def release(self):
+        self.released.set()
+
+
+class TestProcessExcelCancellation(IncrementalTestCase):
+    def test_remaining_ai_calls_are_skipped(self):
+        self.completions = BlockingCompletions()
+        ai_service.client = type("Client", (), {"chat": type("Chat", (), {"completions": self.completions})()})()
+        workbook = generate_workbook(WorkbookShape(features=5, **REALISTIC_SHAPE), seed=7)
+        path = save_workbook(workbook, os.path.join(self.tmp.name, "spec.xlsx"))
+        skipped_before = abandoned("ai_call", "cancelled")
+        running_before = abandoned("ai_call", "continued")
+
+        async def main():
+            task = asyncio.ensure_future(document_service.process_excel(path, user_id=1, incremental=True))
+            await asyncio.get_running_loop().run_in_executor(None, self.completions.started.wait, 5)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        try:
+            asyncio.run(main())
+        finally:
+            self.completions.release()
+
+        self.assertEqual(self.completions.calls, 1)
+        self.assertEqual(abandoned("ai_call", "continued"), running_before + 1)
+        self.assertEqual(abandoned("ai_call", "cancelled"), skipped_before + 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base, create_db_engine
+from app.models.user import User
+
+
+class TestSqliteEngine(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.engine = create_db_engine(f"sqlite:///{os.path.join(self.tmp_dir.name, 'test.db')}")
+        Base.metadata.create_all(bind=self.engine)
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def test_pragmas_applied(self):
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.execute(text("PRAGMA journal_mode")).scalar().lower(), "wal")
+            self.assertEqual(conn.execute(text("PRAGMA busy_timeout")).scalar(), 5000)
+            # NORMAL = 1
+            self.assertEqual(conn.execute(text("PRAGMA synchronous")).scalar(), 1)
+
+    def test_concurrent_writes(self):
+        """多线程并发写入 + 读取，不应出现 database is locked"""
+        threads_count = 16
+        writes_per_thread = 25
+        errors = []
+
+        def worker(thread_index: int):
+            for i in range(writes_per_thread):
+                db = self.SessionLocal()
+                try:
+                    db.add(User(
+                        username=f"user_{thread_index}_{i}",
+                        hashed_password="x",
+                        real_name="并发测试"
+                    ))
+                    db.commit()
+                    db.query(User).filter(User.username == f"user_{thread_index}_{i}").first()
+                except Exception as e:  # noqa: BLE001 - 收集所有错误后统一断言
+                    errors.append(e)
+                    db.rollback()
+                finally:
+                    db.close()
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        db = self.SessionLocal()
+        try:
+            self.assertEqual(db.query(User).count(), threads_count * writes_per_thread)
+        finally:
+            db.close()
+
+
+class TestEngineSelection(unittest.TestCase):
+    def test_in_memory_sqlite_shares_connection(self):
+        engine = create_db_engine("sqlite://")
+        try:
+            Base.metadata.create_all(bind=engine)
+            with engine.connect() as conn:
+                self.assertEqual(conn.execute(text("SELECT count(*) FROM users")).scalar(), 0)
+        finally:
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    unittest.main()
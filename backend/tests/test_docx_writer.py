@@ -0,0 +1,181 @@
+import os
+import re
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+from app.services import document_service as document_module
+from app.services.document_service import document_service
+from app.services.docx_build_pool import DocxBuildPool
+from app.services.docx_writer import DocxWriter
+from app.services.ooxml_writer import OoxmlWriter
+from app.services.output_store import OutputStore
+from benchmarks.fakes import STUB_PNG
+from tests.test_incremental import body, document_xml
+
+
+class WriterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def image(self, name, content=STUB_PNG):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    def chapters(self, count):
+        chapters = []
+        for i in range(count):
+            # 每两章共用一张结构图，检验按内容去重
+            structure = self.image(f"structure_{i // 2}.png", STUB_PNG + str(i // 2).encode())
+            chapters.append({
+                "name": f"功能{i}", "description": f"功能{i}的概述", "functions": ["新增", "查询"],
+                "structure_image": structure,
+                "features": [{"scenario": f"场景{i}-{j}", "process": ["校验", "保存"], "input": "表单", "output": "记录",
+                              "flow_chart": self.image(f"flow_{i}_{j}.png", STUB_PNG + f"{i}-{j}".encode())}
+                             for j in range(2)],
+            })
+        return chapters
+
+    def write(self, name, chapters, pool=None, writer_class=DocxWriter):
+        writer = writer_class(os.path.join(self.tmp.name, name))
+        writer.add_title("软件需求说明书")
+        if pool is None:
+            for chapter in chapters:
+                writer.add_chapter(chapter)
+        else:
+            for fragment in pool.build_fragments(chapters):
+                writer.add_fragment(fragment)
+        return writer.save()
+
+
+class TestDocxWriter(WriterTestCase):
+    def test_images_are_deduplicated_and_numbered(self):
+        path = self.write("serial.docx", self.chapters(4))
+        xml = document_xml(path)
+        with zipfile.ZipFile(path) as archive:
+            media = sorted(name for name in archive.namelist() if name.startswith("word/media/"))
+            rels = archive.read("word/_rels/document.xml.rels").decode("utf-8")
+
+        # 2 张结构图 + 8 张流程图
+        self.assertEqual(media, sorted(f"word/media/image{n}.png" for n in range(1, 11)))
+        embeds = re.findall(r'r:embed="([^"]+)"', xml)
+        self.assertEqual(len(embeds), 12)
+        self.assertEqual(len(set(embeds)), 10)
+        self.assertTrue(all(f'Id="{rid}"' in rels for rid in embeds))
+        shape_ids = re.findall(r'<wp:docPr id="(\d+)"', xml)
+        self.assertEqual(len(set(shape_ids)), 12)
+
+    def test_shared_image_path_is_read_once(self):
+        from docx.image.image import Image
+
+        # 4 章共 2 张结构图 + 8 张流程图：每个路径只读取一次
+        for writer_class in (DocxWriter, OoxmlWriter):
+            with self.subTest(writer=writer_class.__name__), \
+                    mock.patch.object(Image, "from_file", wraps=Image.from_file) as from_file:
+                self.write(f"{writer_class.__name__}.docx", self.chapters(4), writer_class=writer_class)
+                self.assertEqual(from_file.call_count, 10)
+
+    def test_missing_image_writes_placeholder_text(self):
+        chapter = self.chapters(1)[0]
+        chapter["structure_image"] = os.path.join(self.tmp.name, "missing.png")
+        xml = document_xml(self.write("missing.docx", [chapter]))
+        self.assertIn("结构图生成失败，未能插入图片。", xml)
+        self.assertEqual(len(re.findall(r"<wp:docPr ", xml)), 2)
+
+    def test_fragment_text_resembling_markup_is_kept(self):
+        # 正文中恰好含有 r:embed="rId5"、docPr 或占位符字符时，合并片段不能改写这些文本
+        chapters = self.chapters(2)
+        for chapter in chapters:
+            chapter["name"] += "\ue000"
+            chapter["description"] = 'r:embed="rId5" <wp:docPr id="1" name="Picture 1" \ue000'
+            chapter["functions"] = ["\ue000开头的功能"]
+        scratch = DocxWriter(None)
+        merged = DocxWriter(os.path.join(self.tmp.name, "merged.docx"))
+        for chapter in chapters:
+            merged.add_fragment(scratch.build_fragment(chapter))
+        direct = DocxWriter(os.path.join(self.tmp.name, "direct.docx"))
+        for chapter in chapters:
+            direct.add_chapter(chapter)
+
+        xml = document_xml(merged.save())
+        self.assertEqual(body(xml), body(document_xml(direct.save())))
+        self.assertIn("2.3.1. 场景1-0", xml)
+        self.assertEqual(xml.count("\ue000"), 6)
+
+
+class TestDocxBuildPool(WriterTestCase):
+    def test_parallel_build_matches_serial(self):
+        chapters = self.chapters(6)
+        pool = DocxBuildPool(max_workers=2, min_chapters=1)
+        try:
+            parallel = self.write("parallel.docx", chapters, pool)
+        finally:
+            pool.shutdown()
+        serial = self.write("serial.docx", chapters)
+
+        self.assertEqual(body(document_xml(parallel)), body(document_xml(serial)))
+        with zipfile.ZipFile(parallel) as a, zipfile.ZipFile(serial) as b:
+            self.assertEqual(sorted(a.namelist()), sorted(b.namelist()))
+            self.assertEqual(a.read("word/_rels/document.xml.rels"), b.read("word/_rels/document.xml.rels"))
+
+    def test_small_documents_stay_serial(self):
+        pool = DocxBuildPool(max_workers=2, min_chapters=10)
+        self.assertFalse(pool.parallel_for(9))
+        self.assertTrue(pool.parallel_for(10))
+        self.assertFalse(DocxBuildPool(max_workers=1, min_chapters=1).parallel_for(100))
+        self.assertEqual(len(pool.build_fragments(self.chapters(2))), 2)
+        self.assertIsNone(pool._executor)
+
+
+class TestOoxmlWriter(WriterTestCase):
+    def parts(self, path):
+        with zipfile.ZipFile(path) as archive:
+            parts = {name: archive.read(name) for name in archive.namelist()}
+        parts["word/document.xml"] = re.sub(rb' w:rsid\w*="[^"]*"', b"", parts["word/document.xml"])
+        return parts
+
+    def test_package_matches_python_docx(self):
+        chapters = self.chapters(4)
+        chapters[0]["description"] = " 第一行\n第二行\t<含特殊字符> & \"引号\" "
+        chapters[1]["description"] = ""
+        chapters[1]["functions"] = ["", "  缩进"]
+        chapters[2]["structure_image"] = self.image("broken.png", b"not an image")
+        chapters[3]["features"][0]["flow_chart"] = os.path.join(self.tmp.name, "missing.png")
+
+        expected = self.parts(self.write("python-docx.docx", chapters))
+        actual = self.parts(self.write("ooxml.docx", chapters, writer_class=OoxmlWriter))
+        self.assertEqual(sorted(actual), sorted(expected))
+        for name in expected:
+            self.assertEqual(actual[name], expected[name], name)
+
+    def test_discard_removes_temp_file(self):
+        writer = OoxmlWriter(os.path.join(self.tmp.name, "discarded.docx"))
+        writer.add_chapter(self.chapters(1)[0])
+        with self.assertRaises(ValueError):
+            writer.add_chapter({"name": "非法字符\x00"})
+        writer.discard()
+        self.assertEqual([name for name in os.listdir(self.tmp.name) if not name.endswith(".png")], [])
+
+    def test_generate_word_selects_writer(self):
+        chapters = self.chapters(2)
+        image_mapping = {f"structure_{chapter['name']}": chapter["structure_image"] for chapter in chapters}
+        image_mapping.update({f"flow_{feature['scenario']}": feature["flow_chart"]
+                              for chapter in chapters for feature in chapter["features"]})
+        expected = self.write("expected.docx", chapters)
+
+        store = OutputStore(os.path.join(self.tmp.name, "outputs"))
+        with mock.patch.object(document_module, "output_store", store):
+            path, _, _ = document_service.generate_user_document(chapters, image_mapping, 1, "ooxml")
+            self.assertEqual(body(document_xml(path)), body(document_xml(expected)))
+            with self.assertRaises(ValueError):
+                document_service.generate_user_document(self.chapters(1), {}, 1, "unknown")
+
+
+if __name__ == "__main__":
+    unittest.main()
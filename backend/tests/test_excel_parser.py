@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+
+import openpyxl
+
+from app.services.excel_parser import ExcelParser
+from benchmarks.workbook_generator import (REALISTIC_SHAPE, WorkbookShape, describe, generate_workbook,
+                                           save_workbook)
+
+
+class TestExcelParserWithSyntheticWorkbooks(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def parse(self, workbook):
+        path = save_workbook(workbook, os.path.join(self.tmp.name, "spec.xlsx"))
+        return ExcelParser(path).parse()
+
+    def test_regular_workbook(self):
+        workbook = generate_workbook(WorkbookShape(features=5), seed=1)
+        self.assertEqual(describe(workbook)["rows"], 5 * 4 * 3)
+        self.assertEqual(self.parse(workbook), workbook.expected)
+
+    def test_merged_cells_blank_rows_and_variants(self):
+        shape = WorkbookShape(features=30, **REALISTIC_SHAPE)
+        shape.merged_ratio = 0.7
+        shape.blank_row_ratio = 0.3
+        workbook = generate_workbook(shape, seed=7)
+        self.assertTrue(workbook.merged_ranges)
+        self.assertTrue(any(all(value is None for value in row) for row in workbook.rows))
+
+        self.assertEqual(self.parse(workbook), workbook.expected)
+
+        sheet = openpyxl.load_workbook(os.path.join(self.tmp.name, "spec.xlsx"))["功能点拆分表"]
+        self.assertEqual(len(sheet.merged_cells.ranges), len(workbook.merged_ranges))
+
+    def test_few_sub_processes_are_padded(self):
+        workbook = generate_workbook(WorkbookShape(features=3, sub_processes_per_process=1,
+                                                   missing_data_group_ratio=1.0), seed=3)
+        parsed = self.parse(workbook)
+        self.assertEqual(parsed, workbook.expected)
+        for feature in parsed.values():
+            for name, value in feature.items():
+                if name != "角色":
+                    self.assertEqual(len(value[0]), 3)
+                    self.assertEqual(value[1], [])
+
+    def test_deterministic_by_seed(self):
+        shape = WorkbookShape(features=10, **REALISTIC_SHAPE)
+        first = generate_workbook(shape, seed=42)
+        self.assertEqual(first, generate_workbook(shape, seed=42))
+        self.assertNotEqual(first.rows, generate_workbook(shape, seed=43).rows)
+
+    def test_for_rows_targets_row_count(self):
+        workbook = generate_workbook(WorkbookShape.for_rows(1000, **REALISTIC_SHAPE), seed=0)
+        self.assertAlmostEqual(describe(workbook)["rows"], 1000, delta=150)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+import asyncio
+import copy
+import os
+import re
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+from app.services import document_service as document_module
+from app.services.ai_service import ai_service
+from app.services.chapter_store import ChapterStore, chapter_fingerprint
+from app.services.document_service import document_service
+from app.services.docx_writer import DocxWriter
+from app.services.output_store import OutputStore
+from benchmarks.fakes import STUB_PNG
+from benchmarks.workbook_generator import COLUMNS, REALISTIC_SHAPE, WorkbookShape, generate_workbook, save_workbook
+from tests.test_batch_processing import CountingCompletions
+
+
+def document_xml(path):
+    with zipfile.ZipFile(path) as archive:
+        return archive.read("word/document.xml").decode("utf-8")
+
+
+def body(xml):
+    # rsid 等随机属性不参与比较
+    return re.sub(r' w:rsid\w*="[^"]*"', "", xml[xml.index("<w:body>"):])
+
+
+class IncrementalTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = ChapterStore(os.path.join(self.tmp.name, "cache"))
+        self.patches = [
+            mock.patch.object(document_module, "chapter_store", self.store),
+            mock.patch.object(document_module, "output_store", OutputStore(os.path.join(self.tmp.name, "outputs"))),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+        self.completions = CountingCompletions()
+        self.original_client = ai_service.client
+        ai_service.client = type("Client", (), {"chat": type("Chat", (), {"completions": self.completions})()})()
+
+    def tearDown(self):
+        ai_service.client = self.original_client
+        for patch in self.patches:
+            patch.stop()
+        self.tmp.cleanup()
+
+    def image(self, name):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as f:
+            f.write(STUB_PNG)
+        return path
+
+
+class TestFingerprint(unittest.TestCase):
+    def test_changes_only_for_edited_feature(self):
+        workbook = generate_workbook(WorkbookShape(features=3, **REALISTIC_SHAPE), seed=3)
+        before = {name: chapter_fingerprint(name, data) for name, data in workbook.expected.items()}
+
+        edited = copy.deepcopy(workbook.expected)
+        name = next(iter(edited))
+        process = next(key for key in edited[name] if key != "角色")
+        edited[name][process][1][0] = "修改后的数据组"
+        after = {name: chapter_fingerprint(name, data) for name, data in edited.items()}
+
+        self.assertEqual([key for key in before if before[key] != after[key]], [name])
+
+
+class TestFragments(IncrementalTestCase):
+    def chapters(self):
+        structure, flow = self.image("structure.png"), self.image("flow.png")
+        return [
+            {"name": f"功能{i}", "description": "概述", "functions": ["新增", "删除"], "structure_image": structure,
+             "features": [{"scenario": f"场景{i}", "process": "处理", "input": "输入", "output": "输出",
+                           "flow_chart": flow if i else os.path.join(self.tmp.name, "missing.png")}]}
+            for i in range(3)
+        ]
+
+    def test_fragments_match_add_chapter(self):
+        direct = DocxWriter(os.path.join(self.tmp.name, "direct.docx"))
+        merged = DocxWriter(os.path.join(self.tmp.name, "merged.docx"))
+        scratch = DocxWriter(None)
+        for chapter in self.chapters():
+            direct.add_chapter(chapter)
+            merged.add_fragment(scratch.build_fragment(chapter))
+
+        self.assertEqual(body(document_xml(merged.save())), body(document_xml(direct.save())))
+
+    def test_incremental_document_reuses_fragments(self):
+        chapters = self.chapters()
+        _, _, first = document_service.generate_user_document(copy.deepcopy(chapters), {}, 1, incremental=True)
+        chapters[1]["description"] = "修改后的概述"
+        path, _, second = document_service.generate_user_document(copy.deepcopy(chapters), {}, 1, incremental=True)
+
+        self.assertEqual(first, {"chapters": 3, "reused": 0})
+        self.assertEqual(second, {"chapters": 3, "reused": 2})
+        # 另一个用户没有保存的文档，完整生成一次用于对比
+        full, _, _ = document_service.generate_user_document(copy.deepcopy(chapters), {}, 2)
+        self.assertEqual(body(document_xml(path)), body(document_xml(full)))
+
+    def test_least_recently_used_fragments_are_pruned(self):
+        self.store.max_fragments = 4
+        chapters = self.chapters()
+        document_service.generate_user_document(copy.deepcopy(chapters), {}, 1, incremental=True)
+        fragment_dir = os.path.join(self.store.base_dir, "user_1", "chapters", "fragments")
+        self.assertEqual(len(os.listdir(fragment_dir)), 3)
+
+        # 第二份文档只共用第一章：其余两个旧片段中只能再保留一个
+        for i in (1, 2):
+            chapters[i]["description"] = "修改后的概述"
+        _, _, reuse = document_service.generate_user_document(copy.deepcopy(chapters), {}, 1, incremental=True)
+        self.assertEqual(reuse, {"chapters": 3, "reused": 1})
+        self.assertEqual(len(os.listdir(fragment_dir)), 4)
+
+        _, _, reuse = document_service.generate_user_document(copy.deepcopy(chapters), {}, 1, incremental=True)
+        self.assertEqual(reuse, {"chapters": 3, "reused": 3})
+
+
+class TestIncrementalProcessExcel(IncrementalTestCase):
+    def test_reuses_descriptions_of_unchanged_features(self):
+        workbook = generate_workbook(WorkbookShape(features=4, **REALISTIC_SHAPE), seed=5)
+        path = save_workbook(workbook, os.path.join(self.tmp.name, "spec.xlsx"))
+        first = asyncio.run(document_service.process_excel(path, user_id=1, incremental=True))
+        self.assertEqual(first["reuse"]["reused"], 0)
+        self.assertEqual(self.completions.calls, 4)
+
+        # 修改第一个功能过程的一个数据组
+        workbook.rows[0][COLUMNS.index("数据组")] = "修改后的数据组"
+        save_workbook(workbook, path)
+        second = asyncio.run(document_service.process_excel(path, user_id=1, incremental=True))
+
+        self.assertEqual(second["reuse"]["reused"], 3)
+        self.assertEqual(second["reuse"]["regenerated"], [first["chapters"][0]["name"]])
+        self.assertEqual(self.completions.calls, 5)
+        self.assertNotEqual(second["chapters"][0]["fingerprint"], first["chapters"][0]["fingerprint"])
+
+        # 全部复用时不再改写描述文件
+        with mock.patch.object(self.store, "save_descriptions") as save:
+            third = asyncio.run(document_service.process_excel(path, user_id=1, incremental=True))
+        self.assertEqual(third["reuse"]["reused"], 4)
+        save.assert_not_called()
+
+        # 未开启增量时全部重新生成
+        asyncio.run(document_service.process_excel(path, user_id=1))
+        self.assertEqual(self.completions.calls, 9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import io
+import json
+import logging
+import queue
+import unittest
+
+from app.services.tracing import InMemorySpanExporter, tracer
+from app.utils.logging_setup import (JsonFormatter, NonBlockingQueueHandler, SamplingFilter,
+                                     setup_logging, shutdown_logging)
+
+
+class TestStructuredLogging(unittest.TestCase):
+    def setUp(self):
+        self.stream = io.StringIO()
+        self.root = logging.getLogger()
+        self.original_level = self.root.level
+        self.handler = setup_logging(level="DEBUG", fmt="json", stream=self.stream)
+        self.logger = logging.getLogger("tests.logging")
+
+    def tearDown(self):
+        shutdown_logging()
+        self.root.removeHandler(self.handler)
+        self.root.setLevel(self.original_level)
+
+    def records(self):
+        shutdown_logging()
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_json_lines_with_extra_fields(self):
+        self.logger.info("渲染完成 %s", "abc", extra={"hash": "abc", "count": 3})
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            self.logger.exception("失败")
+
+        info, error = self.records()
+        self.assertEqual(info["level"], "INFO")
+        self.assertEqual(info["logger"], "tests.logging")
+        self.assertEqual(info["msg"], "渲染完成 abc")
+        self.assertEqual(info["hash"], "abc")
+        self.assertEqual(info["count"], 3)
+        self.assertIn("ValueError: boom", error["exc_info"])
+
+    def test_trace_ids_attached(self):
+        original_exporter = tracer.exporter
+        tracer.exporter = InMemorySpanExporter()
+        try:
+            with tracer.start_span("root") as span:
+                self.logger.info("在 Span 中")
+        finally:
+            tracer.exporter = original_exporter
+
+        record = self.records()[0]
+        self.assertEqual(record["trace_id"], span.trace_id)
+        self.assertEqual(record["span_id"], span.span_id)
+
+    def test_sampling(self):
+        for i in range(25):
+            self.logger.info("缓存命中 %s", i, extra={"sample_every": 10})
+        self.logger.warning("警告不采样", extra={"sample_every": 10})
+
+        records = self.records()
+        hits = [r for r in records if r["msg"].startswith("缓存命中")]
+        self.assertEqual([r["msg"] for r in hits], ["缓存命中 0", "缓存命中 10", "缓存命中 20"])
+        self.assertTrue(all(r["sampled"] == 10 for r in hits))
+        self.assertEqual(records[-1]["msg"], "警告不采样")
+
+
+class TestQueueHandler(unittest.TestCase):
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+        logger = logging.getLogger("tests.logging.queue")
+        logger.propagate = False
+        logger.addHandler(handler)
+        try:
+            logger.warning("first")
+            logger.warning("second")
+        finally:
+            logger.removeHandler(handler)
+            logger.propagate = True
+
+        self.assertEqual(handler.queue.qsize(), 1)
+        self.assertEqual(handler.dropped, 1)
+
+    def test_sampling_filter_ignores_unsampled_records(self):
+        sampling = SamplingFilter()
+        record = logging.makeLogRecord({"name": "x", "msg": "m", "levelno": logging.INFO})
+        self.assertTrue(all(sampling.filter(record) for _ in range(3)))
+        self.assertNotIn('"sampled"', JsonFormatter().format(record))
+
+
+if __name__ == "__main__":
+    unittest.main()
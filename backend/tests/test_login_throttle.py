@@ -0,0 +1,88 @@
+import asyncio
+import unittest
+
+from fastapi import HTTPException
+
+from app.services.login_throttle import LoginThrottle, SlidingWindowLimiter
+
+
+class TestSlidingWindowLimiter(unittest.TestCase):
+    def test_limits_within_window(self):
+        limiter = SlidingWindowLimiter(limit=2, window_seconds=10)
+        limiter.hit("k", now=0)
+        self.assertEqual(limiter.retry_after("k", now=1), 0)
+        limiter.hit("k", now=1)
+        self.assertAlmostEqual(limiter.retry_after("k", now=2), 8)
+
+    def test_window_slides(self):
+        limiter = SlidingWindowLimiter(limit=2, window_seconds=10)
+        limiter.hit("k", now=0)
+        limiter.hit("k", now=5)
+        self.assertEqual(limiter.retry_after("k", now=10.5), 0)
+
+    def test_reset(self):
+        limiter = SlidingWindowLimiter(limit=1, window_seconds=10)
+        limiter.hit("k", now=0)
+        limiter.reset("k")
+        self.assertEqual(limiter.retry_after("k", now=1), 0)
+
+    def test_evicts_idle_keys(self):
+        limiter = SlidingWindowLimiter(limit=1, window_seconds=1, max_keys=2)
+        limiter.hit("a", now=0)
+        limiter.hit("b", now=0)
+        limiter.hit("c", now=5)
+        self.assertEqual(set(limiter._events), {"c"})
+
+    def test_evicts_oldest_key_when_all_active(self):
+        limiter = SlidingWindowLimiter(limit=1, window_seconds=100, max_keys=2)
+        limiter.hit("a", now=0)
+        limiter.hit("b", now=1)
+        limiter.hit("a", now=2)
+        limiter.hit("c", now=3)
+        # 窗口内的 key 都有事件：淘汰最久没有新事件的 b
+        self.assertEqual(list(limiter._events), ["a", "c"])
+
+
+class TestLoginThrottle(unittest.TestCase):
+    def test_username_failures_block_then_reset_on_success(self):
+        throttle = LoginThrottle(ip_limit=100, username_failure_limit=2)
+        for _ in range(2):
+            throttle.check("alice", "1.1.1.1")
+            throttle.record_failure("alice", "1.1.1.1")
+
+        with self.assertRaises(HTTPException) as ctx:
+            throttle.check("alice", "1.1.1.1")
+        self.assertEqual(ctx.exception.status_code, 429)
+        self.assertIn("Retry-After", ctx.exception.headers)
+
+        # 其他 IP 上的失败不会锁定该用户
+        throttle.check("alice", "2.2.2.2")
+
+        throttle.record_success("alice", "1.1.1.1")
+        throttle.check("alice", "1.1.1.1")
+
+    def test_ip_limit(self):
+        throttle = LoginThrottle(ip_limit=2, username_failure_limit=100)
+        throttle.check("a", "1.1.1.1")
+        throttle.check("b", "1.1.1.1")
+        with self.assertRaises(HTTPException):
+            throttle.check("c", "1.1.1.1")
+        throttle.check("c", "3.3.3.3")
+
+    def test_verify_budget_rejects_when_exhausted(self):
+        throttle = LoginThrottle(max_concurrent_verify=1, verify_queue_timeout=0.01)
+
+        async def scenario():
+            async with throttle.verify_slot():
+                with self.assertRaises(HTTPException) as ctx:
+                    async with throttle.verify_slot():
+                        pass
+                self.assertEqual(ctx.exception.status_code, 503)
+            async with throttle.verify_slot():
+                pass
+
+        asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    unittest.main()
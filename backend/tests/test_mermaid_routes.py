@@ -0,0 +1,270 @@
+import asyncio
+import io
+import json
+import os
+import stat
+import tempfile
+import unittest
+from unittest import mock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routers import generate
+from app.services import document_service as document_module
+from app.services.auth_service import get_current_user
+from app.services.diagram_keys import diagram_hash, flow_key
+from app.services.document_service import document_service
+from app.services.output_store import OutputStore
+from app.services.render_failures import RenderFailureCache
+from app.services.render_manifest import RenderManifest
+from benchmarks.fakes import STUB_PNG
+from tests.test_batch_processing import USER
+from tests.test_incremental import document_xml
+
+CODE = "graph TD; A-->B"
+CHAPTERS = [
+    {"name": f"功能{i}", "functions": ["新增", "查询"],
+     "features": [{"scenario": f"场景{i}", "role": ["用户", "系统", "数据库"], "process": ["提交", f"校验{i}", "保存"]}]}
+    for i in range(3)
+]
+
+
+class MermaidRouteTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.renders = []
+
+        async def fake_run_mmdc(mermaid_code, output_path, content_hash, span):
+            self.renders.append(content_hash)
+            await asyncio.sleep(0.01)
+            with open(output_path, "wb") as f:
+                f.write(b"png:" + mermaid_code.encode("utf-8"))
+            return output_path
+
+        self.patches = [
+            mock.patch.object(generate, "TEMP_DIR", self.tmp.name),
+            mock.patch.object(generate, "_run_mmdc", fake_run_mmdc),
+            mock.patch.object(generate, "render_manifest", RenderManifest(os.path.join(self.tmp.name, "cache"))),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+        app = FastAPI()
+        app.include_router(generate.router, prefix="/api/generate")
+        app.dependency_overrides[get_current_user] = lambda: USER
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.tmp.cleanup()
+
+
+class TestMermaidConditionalGet(MermaidRouteTestCase):
+    def test_etag_and_not_modified(self):
+        first = self.client.post("/api/generate/mermaid", json={"code": CODE})
+        self.assertEqual(first.status_code, 200)
+        content_hash = first.headers[generate.DIAGRAM_HASH_HEADER]
+        self.assertEqual(first.headers["etag"], f'"{content_hash}"')
+        self.assertIn("immutable", first.headers["cache-control"])
+
+        # POST 不是条件请求：带匹配的 If-None-Match（或 *）仍返回图片，304 只由 GET /mermaid/{hash} 给出
+        for if_none_match in (first.headers["etag"], "*"):
+            repeat = self.client.post("/api/generate/mermaid", json={"code": CODE},
+                                      headers={"If-None-Match": if_none_match})
+            self.assertEqual(repeat.status_code, 200)
+            self.assertEqual(repeat.content, b"png:" + CODE.encode("utf-8"))
+
+        fresh = self.client.post("/api/generate/mermaid", json={"code": CODE + ";"}, headers={"If-None-Match": "*"})
+        self.assertEqual(fresh.status_code, 200)
+        self.assertEqual(len(self.renders), 2)
+
+    def test_get_by_hash(self):
+        content_hash = self.client.post("/api/generate/mermaid", json={"code": CODE}).headers[
+            generate.DIAGRAM_HASH_HEADER]
+        url = f"/api/generate/mermaid/{content_hash}"
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"png:" + CODE.encode("utf-8"))
+        self.assertEqual(response.headers["content-type"], "image/png")
+        self.assertEqual(self.client.get(url, headers={"If-None-Match": f'W/"{content_hash}"'}).status_code, 304)
+
+        self.assertEqual(self.client.get(url, headers={"If-None-Match": "*"}).status_code, 304)
+
+        # 未生成过的图片：If-None-Match: * 不成立，返回 404
+        self.assertEqual(self.client.get(f"/api/generate/mermaid/{'0' * 32}", headers={"If-None-Match": "*"}).status_code, 404)
+        self.assertEqual(self.client.get(f"/api/generate/mermaid/{'0' * 32}").status_code, 404)
+        self.assertEqual(self.client.get("/api/generate/mermaid/..%2Fsecret").status_code, 404)
+        self.assertEqual(len(self.renders), 1)
+
+
+class TestDiagramKeys(MermaidRouteTestCase):
+    def test_same_scenario_in_two_chapters(self):
+        # 不同章节的同名功能过程：各自的流程图都保留，生成 Word 时各取各的
+        chapters = [CHAPTERS[0], dict(CHAPTERS[1], features=[dict(CHAPTERS[1]["features"][0], scenario="场景0")])]
+        mapping = self.client.post("/api/generate/mermaid-images", json={"chapters": chapters}).json()["data"][
+            "imageMapping"]
+        self.assertEqual(len(mapping), 4)
+        first, second = mapping[flow_key("功能0", "场景0")], mapping[flow_key("功能1", "场景0")]
+        self.assertNotEqual(first, second)
+
+        attached = [dict(chapter, features=[dict(feature) for feature in chapter["features"]]) for chapter in chapters]
+        for chapter in attached:
+            document_service._attach_images(chapter, mapping)
+        self.assertEqual([chapter["features"][0]["flow_chart"] for chapter in attached], [first, second])
+
+    def test_key_prefix_is_unambiguous(self):
+        self.assertNotEqual(flow_key("功能_甲", "场景"), flow_key("功能", "甲_场景"))
+
+    def test_legacy_flow_key(self):
+        chapter = {"name": "功能0", "features": [{"scenario": "场景0"}]}
+        document_service._attach_images(chapter, {"flow_场景0": "/tmp/flow.png"})
+        self.assertEqual(chapter["features"][0]["flow_chart"], "/tmp/flow.png")
+
+    def test_hash_is_computed_once_and_reused(self):
+        response = self.client.post("/api/generate/mermaid", json={"code": CODE})
+        self.assertEqual(response.headers[generate.DIAGRAM_HASH_HEADER], diagram_hash(CODE))
+        self.assertEqual(self.renders, [diagram_hash(CODE)])
+
+        # 每张图（一个结构图、一个流程图）只计算一次哈希，渲染时不再重复计算
+        with mock.patch("app.services.diagram_keys.diagram_hash", wraps=diagram_hash) as hashed, \
+                mock.patch.object(generate, "diagram_hash", side_effect=AssertionError):
+            self.client.post("/api/generate/mermaid-images", json={"chapters": CHAPTERS[:1]})
+        self.assertEqual(hashed.call_count, 2)
+        self.assertEqual(len(self.renders), 3)
+
+    def test_structure_node_ids(self):
+        code = generate._get_structure_chart_code("功能", ["新增", "查询", "新增"])
+        self.assertEqual(code.count('P0["新增"]'), 2)
+        self.assertIn('P1["查询"]', code)
+        self.assertNotIn("P2", code)
+
+
+class TestRenderManifest(MermaidRouteTestCase):
+    def images(self, chapters=CHAPTERS, **extra):
+        return self.client.post("/api/generate/mermaid-images", json={"chapters": chapters, **extra})
+
+    def stream(self, chapters=CHAPTERS):
+        response = self.images(chapters, partial=True)
+        self.assertEqual(response.headers["content-type"], generate.NDJSON_MEDIA_TYPE)
+        return [json.loads(line) for line in response.text.splitlines()]
+
+    def test_cached_spec_is_served_from_manifest(self):
+        first = self.images().json()["data"]["imageMapping"]
+        self.assertEqual(len(self.renders), 6)
+
+        # 清单命中时不再逐张生成代码、检查文件
+        with mock.patch.object(generate, "_collect_diagram_codes", side_effect=AssertionError):
+            self.assertEqual(self.images().json()["data"]["imageMapping"], first)
+
+        # 图片被删除后，返回之后的检查使清单失效，下次请求重新生成
+        os.remove(first["structure_功能0"])
+        self.images()
+        self.assertEqual(self.images().json()["data"]["imageMapping"], first)
+        self.assertEqual(len(self.renders), 7)
+
+    def test_partial_mode_streams_pending_images(self):
+        self.client.post("/api/generate/mermaid", json={"code": generate._get_structure_chart_code("功能0", ["新增", "查询"])})
+
+        lines = self.stream()
+        self.assertEqual(lines[0]["type"], "cached")
+        self.assertEqual(list(lines[0]["imageMapping"]), ["structure_功能0"])
+        self.assertEqual(lines[0]["pending"], 5)
+        self.assertEqual(sorted(line["key"] for line in lines[1:-1]),
+                         sorted([flow_key("功能0", "场景0"), "structure_功能1", flow_key("功能1", "场景1"),
+                                 "structure_功能2", flow_key("功能2", "场景2")]))
+        self.assertEqual(lines[-1]["type"], "done")
+        self.assertEqual(len(lines[-1]["imageMapping"]), 6)
+        self.assertEqual(lines[-1]["errors"], {})
+
+        # 全部成功后保存了清单
+        cached = self.stream()
+        self.assertEqual([line["type"] for line in cached], ["cached", "done"])
+        self.assertEqual(cached[0]["imageMapping"], lines[-1]["imageMapping"])
+        self.assertEqual(len(self.renders), 6)
+
+
+@unittest.skipUnless(os.name == "posix", "假的 mmdc 为 shell 脚本")
+class TestFailureIsolation(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        bin_dir = os.path.join(self.tmp.name, "bin")
+        os.makedirs(bin_dir)
+        self.log = os.path.join(self.tmp.name, "mmdc.log")
+        stub = os.path.join(self.tmp.name, "stub.png")
+        with open(stub, "wb") as f:
+            f.write(STUB_PNG)
+        # 假的 mmdc：代码中含 BAD 时报语法错误，含 FLAKY 时报浏览器启动失败，否则写出图片；每次调用记录一行
+        script = os.path.join(bin_dir, "mmdc")
+        with open(script, "w") as f:
+            f.write(f'#!/bin/sh\necho "$2" >> "{self.log}"\n'
+                    'if grep -q BAD "$2"; then echo "Parse error on line 2" >&2; exit 1; fi\n'
+                    'if grep -q FLAKY "$2"; then echo "Error: Failed to launch the browser process!" >&2; exit 1; fi\n'
+                    f'cp "{stub}" "$4"\n')
+        os.chmod(script, os.stat(script).st_mode | stat.S_IEXEC)
+
+        store = OutputStore(os.path.join(self.tmp.name, "outputs"))
+        self.patches = [
+            mock.patch.dict(os.environ, {"PATH": bin_dir + os.pathsep + os.environ["PATH"]}),
+            mock.patch.object(generate, "TEMP_DIR", self.tmp.name),
+            mock.patch.object(generate, "render_manifest", RenderManifest(os.path.join(self.tmp.name, "cache"))),
+            mock.patch.object(generate, "render_failure_cache", RenderFailureCache(ttl_seconds=60)),
+            mock.patch.object(document_module, "output_store", store),
+            mock.patch.object(generate, "output_store", store),
+        ]
+        for patch in self.patches:
+            patch.start()
+        app = FastAPI()
+        app.include_router(generate.router, prefix="/api/generate")
+        app.dependency_overrides[get_current_user] = lambda: USER
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.tmp.cleanup()
+
+    def mmdc_runs(self):
+        with open(self.log) as f:
+            return len(f.readlines())
+
+    def test_one_bad_diagram_does_not_fail_the_rest(self):
+        chapters = [dict(CHAPTERS[0]), dict(CHAPTERS[1], name="BAD功能")]
+        response = self.client.post("/api/generate/mermaid-images", json={"chapters": chapters})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()["data"]
+        self.assertEqual(sorted(data["imageMapping"]),
+                         sorted([flow_key("功能0", "场景0"), flow_key("BAD功能", "场景1"), "structure_功能0"]))
+        self.assertEqual(list(data["errors"]), ["structure_BAD功能"])
+        self.assertIn("Parse error", data["errors"]["structure_BAD功能"])
+        self.assertEqual(self.mmdc_runs(), 4)
+
+        # 重试：成功的图来自缓存，失败的代码在负缓存有效期内不再启动 mmdc
+        retry = self.client.post("/api/generate/mermaid-images", json={"chapters": chapters}).json()["data"]
+        self.assertEqual(retry, data)
+        self.assertEqual(self.mmdc_runs(), 4)
+
+        document = self.client.post("/api/generate/generate-word", json={
+            "chapters": [{**chapter, "description": "概述",
+                          "features": [{**feature, "input": "", "output": ""} for feature in chapter["features"]]}
+                         for chapter in chapters],
+            "image_mapping": data["imageMapping"],
+        })
+        self.assertEqual(document.status_code, 200)
+        xml = document_xml(io.BytesIO(document.content))
+        self.assertEqual(xml.count("结构图生成失败，未能插入图片。"), 1)
+        self.assertEqual(xml.count("<wp:docPr "), 3)
+
+    def test_transient_failure_is_not_cached(self):
+        code = "graph TD; FLAKY-->B"
+        for attempt in (1, 2):
+            response = self.client.post("/api/generate/mermaid", json={"code": code})
+            self.assertEqual(response.status_code, 500)
+            self.assertIn("Failed to launch", response.json()["detail"])
+            self.assertEqual(self.mmdc_runs(), attempt)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+
+from fastapi import APIRouter, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from app.services import metrics
+from app.services.metrics import MetricsMiddleware, MetricsRegistry
+
+
+class TestMetricTypes(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter(self):
+        counter = self.registry.counter("jobs_total", "任务数", ("kind",))
+        counter.inc(kind="a")
+        counter.inc(2, kind="a")
+        counter.inc(kind="b")
+        self.assertEqual(counter.value(kind="a"), 3)
+
+        text = self.registry.render()
+        self.assertIn("# TYPE jobs_total counter", text)
+        self.assertIn('jobs_total{kind="a"} 3', text)
+        self.assertIn('jobs_total{kind="b"} 1', text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self.registry.histogram("latency_seconds", "耗时", buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value)
+
+        text = self.registry.render()
+        self.assertIn('latency_seconds_bucket{le="0.1"} 2', text)
+        self.assertIn('latency_seconds_bucket{le="1"} 3', text)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 4', text)
+        self.assertIn("latency_seconds_count 4", text)
+        self.assertIn("latency_seconds_sum 3.65", text)
+
+    def test_time_records_outcome(self):
+        histogram = self.registry.histogram("stage_seconds", "耗时", ("outcome",))
+        with histogram.time():
+            pass
+        with self.assertRaises(RuntimeError):
+            with histogram.time():
+                raise RuntimeError("boom")
+
+        self.assertEqual(histogram.count(outcome="success"), 1)
+        self.assertEqual(histogram.count(outcome="error"), 1)
+
+    def test_label_values_are_escaped(self):
+        counter = self.registry.counter("escaped_total", "转义", ("name",))
+        counter.inc(name='a"b\\c')
+        self.assertIn('escaped_total{name="a\\"b\\\\c"} 1', self.registry.render())
+
+    def test_route_label_outside_request(self):
+        histogram = self.registry.histogram("route_seconds", "耗时", ("route",))
+        histogram.observe(0.1)
+        self.assertEqual(histogram.count(route="none"), 1)
+
+
+class TestMetricsMiddleware(unittest.TestCase):
+    def setUp(self):
+        metrics.registry.clear()
+        self.stage = metrics.docx_build_seconds
+
+        app = FastAPI()
+        app.add_middleware(MetricsMiddleware)
+        router = APIRouter()
+
+        @router.get("/items/{item_id}")
+        async def get_item(item_id: int):
+            with self.stage.time():
+                pass
+            return {"id": item_id}
+
+        @app.get("/broken")
+        async def broken():
+            raise HTTPException(status_code=500, detail="boom")
+
+        app.include_router(router, prefix="/api")
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        metrics.registry.clear()
+
+    def test_requests_labelled_by_route_template(self):
+        self.client.get("/api/items/1")
+        self.client.get("/api/items/2")
+        self.client.get("/broken")
+        self.client.get("/missing")
+
+        self.assertEqual(metrics.http_requests_total.value(route="/api/items/{item_id}", method="GET", status="200"), 2)
+        self.assertEqual(metrics.http_requests_total.value(route="/broken", method="GET", status="500"), 1)
+        self.assertEqual(metrics.http_requests_total.value(route="unmatched", method="GET", status="404"), 1)
+        self.assertEqual(
+            metrics.http_request_seconds.count(route="/broken", method="GET", outcome="error"), 1
+        )
+        # 阶段指标自动带上当前请求的路由
+        self.assertEqual(self.stage.count(route="/api/items/{item_id}", outcome="success"), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+import asyncio
+import copy
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.models.schemas import GenerateWordRequest
+from app.routers import generate
+from app.services import document_service as document_module
+from app.services.auth_service import get_current_user
+from app.services.document_service import document_service
+from app.services.output_store import OutputStore, document_key
+from app.services.token_cache import UserSnapshot
+from benchmarks.fakes import STUB_PNG
+from tests.test_batch_processing import USER
+
+OTHER_USER = UserSnapshot(id=2, username="qa", real_name="测试", is_admin=False, is_active=True)
+
+
+class OutputStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = OutputStore(os.path.join(self.tmp.name, "outputs"), max_documents=3)
+        self.image = os.path.join(self.tmp.name, "structure.png")
+        with open(self.image, "wb") as f:
+            f.write(STUB_PNG)
+        self.chapters = [{"name": "用户管理", "description": "概述", "functions": ["新增"], "features": []}]
+        self.image_mapping = {"structure_用户管理": self.image}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+
+class TestDocumentKey(OutputStoreTestCase):
+    def test_key_follows_content(self):
+        key = document_key(self.chapters, self.image_mapping)
+        self.assertEqual(document_key(copy.deepcopy(self.chapters), dict(self.image_mapping)), key)
+
+        edited = copy.deepcopy(self.chapters)
+        edited[0]["description"] = "修改后的概述"
+        self.assertNotEqual(document_key(edited, self.image_mapping), key)
+
+        # 图片重新生成（内容变化）后 key 随之变化
+        with open(self.image, "ab") as f:
+            f.write(b"changed")
+        self.assertNotEqual(document_key(self.chapters, self.image_mapping), key)
+
+    def test_prune_keeps_recent_documents(self):
+        keys = [f"{n:032x}" for n in range(5)]
+        for n, key in enumerate(keys):
+            temp_path = self.store.temp_path(USER.id)
+            self.store.commit(USER.id, key, temp_path)
+            os.utime(self.store.path(USER.id, key), ns=(n, n))
+            if n == 1:
+                # 读取过的文档视为最近使用
+                self.store.get(USER.id, keys[0])
+
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tmp.name, "outputs", "user_1"))),
+                         sorted(f"{key}.docx" for key in (keys[0], keys[3], keys[4])))
+        self.assertIsNone(self.store.get(USER.id, "../user_2/" + keys[0]))
+
+
+class TestDocumentDownload(OutputStoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.patches = [
+            mock.patch.object(document_module, "output_store", self.store),
+            mock.patch.object(generate, "output_store", self.store),
+        ]
+        for patch in self.patches:
+            patch.start()
+        app = FastAPI()
+        app.include_router(generate.router, prefix="/api/generate")
+        app.dependency_overrides[get_current_user] = lambda: self.user
+        self.user = USER
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        super().tearDown()
+
+    def generate(self):
+        return self.client.post("/api/generate/generate-word", json={
+            "chapters": self.chapters, "image_mapping": self.image_mapping,
+        })
+
+    def test_document_pruned_after_cache_hit_is_rebuilt(self):
+        first = self.generate()
+        original = document_service.generate_user_document
+        calls = []
+
+        def pruned_after_lookup(*args):
+            # 模拟命中之后、发送之前被其他请求的清理删除
+            result = original(*args)
+            calls.append(result[1])
+            if len(calls) == 1:
+                os.remove(result[0])
+            return result
+
+        with mock.patch.object(document_service, "generate_user_document", pruned_after_lookup):
+            second = self.generate()
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(second.headers[generate.DOCUMENT_ID_HEADER], first.headers[generate.DOCUMENT_ID_HEADER])
+        self.assertTrue(os.path.exists(self.store.path(USER.id, calls[0])))
+
+    def test_same_content_is_not_rebuilt(self):
+        with mock.patch.object(document_service, "_write_word", wraps=document_service._write_word) as write:
+            first = self.generate()
+            second = self.generate()
+        self.assertEqual(write.call_count, 1)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.content, first.content)
+        document_id = first.headers[generate.DOCUMENT_ID_HEADER]
+        self.assertEqual(second.headers["etag"], f'"{document_id}"')
+
+        # 其他用户生成同样内容的文档时写入自己的目录
+        self.user = OTHER_USER
+        self.assertEqual(self.generate().headers[generate.DOCUMENT_ID_HEADER], document_id)
+        self.assertTrue(os.path.exists(self.store.path(OTHER_USER.id, document_id)))
+        self.assertTrue(os.path.exists(self.store.path(USER.id, document_id)))
+
+    def test_download_supports_etag_and_range(self):
+        created = self.generate()
+        document_id = created.headers[generate.DOCUMENT_ID_HEADER]
+        url = f"/api/generate/documents/{document_id}"
+
+        full = self.client.get(url, params={"filename": "说明书.docx"})
+        self.assertEqual(full.status_code, 200)
+        self.assertEqual(full.content, created.content)
+        self.assertIn("filename*=utf-8''%E8%AF%B4", full.headers["content-disposition"])
+
+        not_modified = self.client.get(url, headers={"If-None-Match": full.headers["etag"]})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b"")
+
+        partial = self.client.get(url, headers={"Range": "bytes=0-99"})
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial.content, created.content[:100])
+
+        self.user = OTHER_USER
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get("/api/generate/documents/not-a-key").status_code, 404)
+
+    def test_build_does_not_block_event_loop(self):
+        ticks = []
+
+        async def main():
+            async def ticker():
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks.append(True)
+
+            task = asyncio.ensure_future(ticker())
+            request = GenerateWordRequest(chapters=self.chapters, image_mapping=self.image_mapping)
+            with mock.patch.object(document_service, "_write_word", side_effect=lambda *args: time.sleep(0.2)):
+                await generate.generate_word(request, current_user=USER)
+            task.cancel()
+
+        asyncio.run(main())
+        self.assertGreater(len(ticks), 5)
+
+    def test_failed_build_leaves_no_file(self):
+        with mock.patch.object(document_service, "_write_word", side_effect=RuntimeError("磁盘已满")):
+            self.assertEqual(self.generate().status_code, 500)
+        self.assertEqual(os.listdir(os.path.join(self.tmp.name, "outputs", "user_1")), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import asyncio
+import unittest
+
+from app.services.metrics import mermaid_queue_wait_seconds
+from app.services.render_scheduler import BULK, INTERACTIVE, RenderScheduler
+
+
+class TestRenderScheduler(unittest.TestCase):
+    def run_jobs(self, scheduler, jobs, before_release=None):
+        """先占满名额，再按顺序提交 jobs（(名称, 优先级, 用户)），释放后返回获得名额的顺序"""
+        order = []
+
+        async def job(name, priority, user_id):
+            async with scheduler.ticket(priority, user_id):
+                order.append(name)
+                await asyncio.sleep(0)
+
+        async def main():
+            blocker = scheduler.ticket(BULK, "blocker")
+            await blocker.__aenter__()
+            tasks = {}
+            for name, priority, user_id in jobs:
+                tasks[name] = asyncio.ensure_future(job(name, priority, user_id))
+                await asyncio.sleep(0)
+            if before_release:
+                before_release(tasks)
+                await asyncio.sleep(0)
+            await blocker.__aexit__(None, None, None)
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+        asyncio.run(main())
+        self.assertEqual(scheduler.active, 0)
+        self.assertEqual(scheduler.queued(INTERACTIVE) + scheduler.queued(BULK), 0)
+        return order
+
+    def test_interactive_jumps_ahead_of_bulk(self):
+        order = self.run_jobs(RenderScheduler(1), [
+            ("bulk-1", BULK, 1), ("bulk-2", BULK, 1), ("preview", INTERACTIVE, 2), ("bulk-3", BULK, 1),
+        ])
+        self.assertEqual(order, ["preview", "bulk-1", "bulk-2", "bulk-3"])
+
+    def test_bulk_is_round_robin_per_user(self):
+        order = self.run_jobs(RenderScheduler(1), [
+            ("a1", BULK, "a"), ("a2", BULK, "a"), ("a3", BULK, "a"), ("b1", BULK, "b"), ("c1", BULK, "c"),
+            ("b2", BULK, "b"),
+        ])
+        self.assertEqual(order, ["a1", "b1", "c1", "a2", "b2", "a3"])
+
+    def test_cancelled_waiter_gives_up_its_place(self):
+        order = self.run_jobs(RenderScheduler(1), [("a1", BULK, "a"), ("a2", BULK, "a")],
+                              before_release=lambda tasks: tasks["a1"].cancel())
+        self.assertEqual(order, ["a2"])
+
+    def test_promote_moves_queued_bulk_ahead(self):
+        scheduler = RenderScheduler(1)
+        tickets = {}
+        original = scheduler.ticket
+
+        def ticket(priority, user_id):
+            tickets[user_id] = original(priority, user_id)
+            return tickets[user_id]
+
+        scheduler.ticket = ticket
+        order = self.run_jobs(scheduler, [("a", BULK, "a"), ("b", BULK, "b"), ("c", BULK, "c")],
+                              before_release=lambda tasks: tickets["c"].promote())
+        self.assertEqual(order, ["c", "a", "b"])
+
+    def test_queue_wait_is_recorded_per_priority(self):
+        before = mermaid_queue_wait_seconds.count(route="none", priority=INTERACTIVE)
+        self.run_jobs(RenderScheduler(2), [("preview", INTERACTIVE, 1)])
+        self.assertEqual(mermaid_queue_wait_seconds.count(route="none", priority=INTERACTIVE), before + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from app.utils.startup_report import BACKEND_DIR, StartupReport, import_times
+
+HEAVY_MODULES = ("pandas", "openpyxl", "docx", "openai")
+
+
+class TestStartupReport(unittest.TestCase):
+    def test_steps_and_ready(self):
+        report = StartupReport()
+        with report.measure("step"):
+            pass
+        with self.assertLogs("app.utils.startup_report", level="INFO"):
+            report.ready()
+
+        data = report.as_dict()
+        self.assertIn("step", data["steps_ms"])
+        self.assertGreaterEqual(data["total_ms"], data["steps_ms"]["step"])
+
+    def test_import_times(self):
+        rows = {row["module"]: row for row in import_times("json")}
+        self.assertEqual(rows["json"]["depth"], 0)
+        self.assertGreater(rows["json"]["cumulative_us"], 0)
+        self.assertEqual(rows["json.decoder"]["depth"], 1)
+
+
+class TestLazyImports(unittest.TestCase):
+    def test_app_main_does_not_import_heavy_libraries(self):
+        code = f"import sys, app.main; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+        completed = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True,
+                                   env={**os.environ, "AI_API_KEY": "lazy-test"})
+        self.assertEqual(completed.returncode, 0, completed.stderr)
+        self.assertEqual(completed.stdout.strip(), "")
+
+    def test_startup_does_not_spawn_process_pools(self):
+        # 进程池在首次使用时才创建：启动、关闭应用都不会拉起子进程
+        code = ("import multiprocessing, app.main\n"
+                "from fastapi.testclient import TestClient\n"
+                "with TestClient(app.main.app) as client:\n"
+                "    client.get('/health')\n"
+                "    print('pools', len(multiprocessing.active_children()), app.main.password_hasher._executor)")
+        with tempfile.TemporaryDirectory() as tmp:
+            completed = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True,
+                                       env={**os.environ, "AI_API_KEY": "lazy-test",
+                                            "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'users.db')}"})
+        self.assertEqual(completed.returncode, 0, completed.stderr)
+        # 日志同样输出到 stdout，只看测试打印的那一行
+        self.assertIn("pools 0 None", completed.stdout.splitlines())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+from fastapi.security import HTTPAuthorizationCredentials
+
+from app.models.user import User
+from app.services import auth_service as auth_module
+from app.services.auth_service import AuthService, get_current_user
+from app.services.token_cache import TokenCache, UserSnapshot
+
+
+def make_snapshot(user_id: int = 1, is_active: bool = True) -> UserSnapshot:
+    return UserSnapshot(id=user_id, username=f"u{user_id}", real_name="测试", is_admin=False, is_active=is_active)
+
+
+class TestTokenCache(unittest.TestCase):
+    def test_hit_and_miss(self):
+        cache = TokenCache(ttl_seconds=30)
+        self.assertIsNone(cache.get("t1"))
+
+        snapshot = make_snapshot()
+        cache.set("t1", snapshot)
+        self.assertEqual(cache.get("t1"), snapshot)
+
+    def test_expires_after_ttl(self):
+        cache = TokenCache(ttl_seconds=0.01)
+        cache.set("t1", make_snapshot())
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("t1"))
+        self.assertEqual(len(cache), 0)
+
+    def test_ttl_capped_by_token_exp(self):
+        cache = TokenCache(ttl_seconds=30)
+        cache.set("expired", make_snapshot(), token_exp=time.time() - 1)
+        self.assertIsNone(cache.get("expired"))
+
+    def test_invalidate_user(self):
+        cache = TokenCache(ttl_seconds=30)
+        cache.set("a1", make_snapshot(1))
+        cache.set("a2", make_snapshot(1))
+        cache.set("b1", make_snapshot(2))
+
+        cache.invalidate_user(1)
+
+        self.assertIsNone(cache.get("a1"))
+        self.assertIsNone(cache.get("a2"))
+        self.assertIsNotNone(cache.get("b1"))
+
+    def test_set_after_invalidation_is_refused(self):
+        # 查询开始后用户被修改：查到的旧快照不能写入缓存
+        cache = TokenCache(ttl_seconds=30)
+        generation = cache.generation(1)
+        cache.invalidate_user(1)
+        cache.set("a1", make_snapshot(1), generation=generation)
+        self.assertIsNone(cache.get("a1"))
+
+        cache.set("a1", make_snapshot(1), generation=cache.generation(1))
+        self.assertIsNotNone(cache.get("a1"))
+
+    def test_evicts_least_recently_used(self):
+        cache = TokenCache(ttl_seconds=30, max_entries=2)
+        cache.set("t1", make_snapshot(1))
+        cache.set("t2", make_snapshot(2))
+        cache.get("t1")
+        cache.set("t3", make_snapshot(3))
+
+        self.assertIsNotNone(cache.get("t1"))
+        self.assertIsNone(cache.get("t2"))
+        self.assertIsNotNone(cache.get("t3"))
+
+    def test_disabled_when_ttl_zero(self):
+        cache = TokenCache(ttl_seconds=0)
+        cache.set("t1", make_snapshot())
+        self.assertIsNone(cache.get("t1"))
+
+
+class FakeSession:
+    """只实现 get_current_user 用到的 get()，记录查询次数"""
+
+    def __init__(self, user, on_get=None):
+        self.user = user
+        self.on_get = on_get
+        self.gets = 0
+
+    async def get(self, model, user_id):
+        self.gets += 1
+        if self.on_get is not None:
+            self.on_get()
+        return self.user if user_id == self.user.id else None
+
+
+class TestGetCurrentUser(unittest.TestCase):
+    def setUp(self):
+        self.cache = TokenCache(ttl_seconds=30)
+        patch = mock.patch.object(auth_module, "token_cache", self.cache)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.user = User(id=7, username="u7", real_name="测试", is_admin=False, is_active=True)
+        self.credentials = HTTPAuthorizationCredentials(
+            scheme="Bearer", credentials=AuthService(None).create_access_token(self.user))
+
+    def test_cache_hit_skips_database(self):
+        db = FakeSession(self.user)
+        first = asyncio.run(get_current_user(self.credentials, db))
+        second = asyncio.run(get_current_user(self.credentials, db))
+        self.assertEqual(first, second)
+        self.assertEqual(second.username, "u7")
+        self.assertEqual(db.gets, 1)
+
+    def test_invalidation_during_lookup_is_not_cached(self):
+        db = FakeSession(self.user, on_get=lambda: self.cache.invalidate_user(self.user.id))
+        asyncio.run(get_current_user(self.credentials, db))
+        self.assertIsNone(self.cache.get(self.credentials.credentials))
+
+        asyncio.run(get_current_user(self.credentials, db))
+        self.assertEqual(db.gets, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import asyncio
+import contextvars
+import json
+import os
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from app.services.tracing import (InMemorySpanExporter, JsonFileSpanExporter, TracingMiddleware,
+                                  current_request_id, current_span, traced, tracer)
+
+
+@traced("work")
+def do_work(value: int) -> int:
+    current_span().set_attribute("value", value)
+    return value * 2
+
+
+class TracingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.exporter = InMemorySpanExporter()
+        self.original_exporter = tracer.exporter
+        tracer.exporter = self.exporter
+
+    def tearDown(self):
+        tracer.exporter = self.original_exporter
+
+    def spans_by_name(self):
+        return {span.name: span for span in self.exporter.spans}
+
+
+class TestTracer(TracingTestCase):
+    def test_children_exported_with_root(self):
+        with tracer.start_span("root") as root:
+            with tracer.start_span("child"):
+                self.assertEqual(do_work(3), 6)
+            # 根 Span 结束前不导出
+            self.assertEqual(self.exporter.spans, [])
+
+        spans = self.spans_by_name()
+        self.assertEqual(set(spans), {"root", "child", "work"})
+        self.assertEqual({span.trace_id for span in spans.values()}, {root.trace_id})
+        self.assertEqual(spans["child"].parent_span_id, root.span_id)
+        self.assertEqual(spans["work"].parent_span_id, spans["child"].span_id)
+        self.assertEqual(spans["work"].attributes["value"], 3)
+        self.assertEqual(spans["root"].to_dict()["parentSpanId"], "")
+
+    def test_exception_marks_error(self):
+        with self.assertRaises(ValueError):
+            with tracer.start_span("failing"):
+                raise ValueError("bad")
+
+        span = self.exporter.spans[0]
+        self.assertEqual(span.status_code, "ERROR")
+        self.assertEqual(span.events[0]["attributes"]["exception.type"], "ValueError")
+
+    def test_context_propagates_to_tasks_and_threads(self):
+        async def child(name: str):
+            with tracer.start_span(name):
+                await asyncio.sleep(0)
+
+        async def main():
+            with tracer.start_span("root") as root:
+                await asyncio.gather(child("a"), child("b"))
+                loop = asyncio.get_running_loop()
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    await loop.run_in_executor(executor, contextvars.copy_context().run, do_work, 1)
+                return root
+
+        root = asyncio.run(main())
+        spans = self.spans_by_name()
+        for name in ("a", "b", "work"):
+            self.assertEqual(spans[name].parent_span_id, root.span_id)
+
+    def test_disabled_tracer_is_noop(self):
+        tracer.exporter = None
+        with tracer.start_span("ignored") as span:
+            span.set_attribute("x", 1)
+        self.assertEqual(do_work(2), 4)
+        self.assertEqual(self.exporter.spans, [])
+
+
+class TestJsonFileSpanExporter(unittest.TestCase):
+    def test_written_by_background_thread(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            exporter = JsonFileSpanExporter(os.path.join(tmp_dir, "traces.jsonl"))
+            writers = []
+
+            def recording_open(*args, **kwargs):
+                writers.append(threading.current_thread())
+                return open(*args, **kwargs)
+
+            original_exporter = tracer.exporter
+            tracer.exporter = exporter
+            try:
+                with mock.patch("app.services.tracing.open", recording_open, create=True):
+                    for n in range(3):
+                        with tracer.start_span(f"root{n}"):
+                            do_work(n)
+                    tracer.shutdown()
+            finally:
+                tracer.exporter = original_exporter
+
+            with open(exporter.path, encoding="utf-8") as f:
+                names = [json.loads(line)["name"] for line in f]
+            self.assertEqual(sorted(names), ["root0", "root1", "root2", "work", "work", "work"])
+            self.assertTrue(writers)
+            self.assertNotIn(threading.current_thread(), writers)
+
+
+class TestTracingMiddleware(TracingTestCase):
+    def setUp(self):
+        super().setUp()
+        app = FastAPI()
+        app.add_middleware(TracingMiddleware)
+        router = APIRouter()
+
+        @router.get("/items/{item_id}")
+        async def get_item(item_id: int):
+            return {"value": do_work(item_id), "request_id": current_request_id()}
+
+        app.include_router(router, prefix="/api")
+        self.client = TestClient(app)
+
+    def test_request_id_header_and_spans(self):
+        response = self.client.get("/api/items/5")
+        request_id = response.headers["X-Request-ID"]
+        self.assertEqual(response.json()["request_id"], request_id)
+
+        spans = self.spans_by_name()
+        root = spans["GET /api/items/{item_id}"]
+        self.assertEqual(root.trace_id, request_id)
+        self.assertEqual(root.kind, "SERVER")
+        self.assertEqual(root.attributes["http.status_code"], 200)
+        self.assertEqual(spans["work"].parent_span_id, root.span_id)
+
+    def test_incoming_request_id(self):
+        response = self.client.get("/api/items/1", headers={"X-Request-ID": "client-req-1"})
+        self.assertEqual(response.headers["X-Request-ID"], "client-req-1")
+        root = self.spans_by_name()["GET /api/items/{item_id}"]
+        self.assertEqual(root.attributes["request.id"], "client-req-1")
+
+        # 非法的请求 ID 会被替换
+        response = self.client.get("/api/items/1", headers={"X-Request-ID": "bad id\n"})
+        self.assertNotEqual(response.headers["X-Request-ID"], "bad id\n")
+        self.assertEqual(len(response.headers["X-Request-ID"]), 32)
+
+
+if __name__ == "__main__":
+    unittest.main()
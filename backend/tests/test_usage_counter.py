@@ -0,0 +1,92 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.database import Base, create_async_db_engine
+from app.services.usage_counter_service import (AI_CALLS, DOCUMENTS_GENERATED,
+                                                UsageCounterService)
+
+
+class TestUsageCounterService(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.database_url = f"sqlite:///{os.path.join(self.tmp_dir.name, 'test.db')}"
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _run(self, scenario):
+        async def main():
+            engine = create_async_db_engine(self.database_url)
+            try:
+                async with engine.begin() as conn:
+                    await conn.run_sync(Base.metadata.create_all)
+                session_factory = async_sessionmaker(engine, expire_on_commit=False)
+                return await scenario(session_factory)
+            finally:
+                await engine.dispose()
+
+        return asyncio.run(main())
+
+    def test_flush_accumulates_into_table(self):
+        service = UsageCounterService()
+
+        async def scenario(session_factory):
+            service.increment(AI_CALLS)
+            service.increment(AI_CALLS, 2)
+            async with session_factory() as db:
+                await service.flush(db)
+            service.increment(AI_CALLS)
+            service.increment(DOCUMENTS_GENERATED)
+            # 读取是只读的：已落库的值加上内存中的增量
+            async with session_factory() as db:
+                before = await service.read(db)
+            pending = service.pending()
+            async with session_factory() as db:
+                await service.flush(db)
+                return before, pending, await service.read(db)
+
+        before, pending, after = self._run(scenario)
+        self.assertEqual(pending, {AI_CALLS: 1, DOCUMENTS_GENERATED: 1})
+        self.assertEqual(before, after)
+        self.assertEqual(after[AI_CALLS], 4)
+        self.assertEqual(after[DOCUMENTS_GENERATED], 1)
+        self.assertEqual(service.pending(), {})
+
+    def test_processes_flushing_the_same_counter(self):
+        # 两个进程各自的计数器写入同一行：由 ON CONFLICT DO UPDATE 累加
+        first, second = UsageCounterService(), UsageCounterService()
+
+        async def scenario(session_factory):
+            first.increment(AI_CALLS, 2)
+            second.increment(AI_CALLS, 5)
+            second.increment(DOCUMENTS_GENERATED)
+            async with session_factory() as db_a, session_factory() as db_b:
+                await asyncio.gather(first.flush(db_a), second.flush(db_b))
+            async with session_factory() as db:
+                return await UsageCounterService().read(db)
+
+        counters = self._run(scenario)
+        self.assertEqual(counters[AI_CALLS], 7)
+        self.assertEqual(counters[DOCUMENTS_GENERATED], 1)
+
+    def test_failed_flush_keeps_deltas(self):
+        service = UsageCounterService()
+
+        async def scenario(session_factory):
+            service.increment(AI_CALLS, 3)
+            async with session_factory() as db:
+                # 表不存在时写入失败，增量应保留
+                await db.run_sync(lambda session: Base.metadata.drop_all(session.connection()))
+                with self.assertRaises(Exception):
+                    await service.flush(db)
+
+        self._run(scenario)
+        self.assertEqual(service.pending(), {AI_CALLS: 3})
+
+
+if __name__ == "__main__":
+    unittest.main()